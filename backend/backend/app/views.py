@@ -1,3 +1,5 @@
+import requests
+from django.conf import settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics, permissions
@@ -30,6 +32,28 @@ from .serializers import (
 from users.models import User
 from backend.errors import APIErrorResponse
 
+# Profile fields FastAPI derives a student's ILS learning profile from
+LEARNING_STYLE_FIELDS = ('learning_styles', 'questionnaire_completed')
+
+
+def notify_fastapi_profile_sync(request, profile):
+    """Tell FastAPI a user's ILS data changed, so chat stops using its cached copy"""
+    # FastAPI identifies the user from the forwarded token
+    if profile.user_id != request.user.id:
+        return
+    ils_data = profile.learning_styles if profile.questionnaire_completed else None
+    try:
+        response = requests.post(
+            f"{settings.FASTAPI_URL}/api/learning/profile-sync",
+            json={"ils_data": ils_data},
+            headers={"Authorization": f"Bearer {request.auth}"},
+            timeout=2,
+        )
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"[PROFILE] Could not notify FastAPI of learning style update: {str(e)}")
+
+
 class UserProfileDetail(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -59,6 +83,8 @@ class UserProfileDetail(APIView):
             serializer = ProfileUpdateSerializer(profile, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
+                if any(field in request.data for field in LEARNING_STYLE_FIELDS):
+                    notify_fastapi_profile_sync(request, profile)
                 return Response(serializer.data)
             
             print(f"[PROFILE] Validation errors: {serializer.errors}")
@@ -0,0 +1,18 @@
+# Generated migration for asynchronous document processing
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_bookmark_message_is_bookmarked'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='processing_job_id',
+            field=models.CharField(blank=True, help_text='FastAPI ingestion job tracking this upload', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated migration for FastAPI document-processing callbacks
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_document_processing_job_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='processing_status',
+            field=models.CharField(blank=True, help_text='Ingestion status last reported by FastAPI', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='processing_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -57,6 +57,9 @@ class Document(models.Model):
     file = models.FileField(upload_to='documents/', null=True, blank=True)
     file_path = models.CharField(max_length=255, blank=True)
     processed = models.BooleanField(default=False)
+    processing_job_id = models.CharField(max_length=64, blank=True, help_text='FastAPI ingestion job tracking this upload')
+    processing_status = models.CharField(max_length=16, blank=True, help_text='Ingestion status last reported by FastAPI')
+    processing_error = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
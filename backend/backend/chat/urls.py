@@ -1,16 +1,19 @@
 from django.urls import path
-from .views import ChatSessionView, ChatSessionDetailView, ChatMessageView, SessionDocumentView, DocumentListView, MessageDocumentView, ContinueMessageView, MarkMessageGoodView, BookmarkToggleView, BookmarksListView
+from .views import ChatSessionView, ChatSessionDetailView, ChatMessageView, ChatMessageStreamView, SessionDocumentView, DocumentStatusView, DocumentProcessingCallbackView, DocumentListView, MessageDocumentView, ContinueMessageView, MarkMessageGoodView, BookmarkToggleView, BookmarksListView
 
 urlpatterns = [
     path('sessions/', ChatSessionView.as_view(), name='chat-sessions'),
     path('sessions/<uuid:session_id>/', ChatSessionDetailView.as_view(), name='chat-session-detail'),
     path('sessions/<uuid:session_id>/messages/', ChatMessageView.as_view(), name='chat-messages'),
+    path('sessions/<uuid:session_id>/messages/stream/', ChatMessageStreamView.as_view(), name='chat-messages-stream'),
     path('sessions/<uuid:session_id>/continue/', ContinueMessageView.as_view(), name='continue-message'),
     path('sessions/<uuid:session_id>/messages/<uuid:message_id>/mark-good/', MarkMessageGoodView.as_view(), name='mark-message-good'),
     path('sessions/<uuid:session_id>/messages/<uuid:message_id>/bookmark/', BookmarkToggleView.as_view(), name='bookmark-toggle'),
     path('bookmarks/', BookmarksListView.as_view(), name='bookmarks-list'),
     path('bookmarks/<uuid:bookmark_id>/', BookmarksListView.as_view(), name='bookmark-delete'),
     path('sessions/<uuid:session_id>/documents/', SessionDocumentView.as_view(), name='session-documents'),
+    path('sessions/<uuid:session_id>/documents/<uuid:document_id>/status/', DocumentStatusView.as_view(), name='session-document-status'),
+    path('sessions/<uuid:session_id>/documents/<uuid:document_id>/processing-callback/', DocumentProcessingCallbackView.as_view(), name='session-document-callback'),
     path('documents/', DocumentListView.as_view(), name='document-list'),
     path('documents/<uuid:message_id>/', MessageDocumentView.as_view(), name='message-documents'),
 ]
@@ -4,10 +4,13 @@ import os
 import time
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.parsers import MultiPartParser
 from django.conf import settings
+from django.core import signing
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from .models import ChatSession, Message, Document, Bookmark
 import uuid
 import logging
@@ -15,6 +18,10 @@ from backend.errors import APIErrorResponse
 
 logger = logging.getLogger(__name__)
 
+# FastAPI reports finished ingestion jobs to DocumentProcessingCallbackView with a token signed under this salt
+DOCUMENT_CALLBACK_SALT = "chat.document-processing-callback"
+DOCUMENT_CALLBACK_MAX_AGE = 7 * 24 * 3600
+
 def serialize_document(document, request=None):
     if not document:
         return None
@@ -55,6 +62,8 @@ def serialize_document(document, request=None):
         "doc_type": "Uploaded",
         "category": "Uploads",
         "processed": document.processed,
+        "processing_job_id": document.processing_job_id or None,
+        "processing_status": document.processing_status or None,
         "created_at": document.uploaded_at.isoformat() if document.uploaded_at else None,
         "uploaded_at": document.uploaded_at.isoformat() if document.uploaded_at else None,
         "session_id": str(document.session_id) if document.session_id else None,
@@ -128,6 +137,80 @@ def post_to_fastapi_with_retry(url, headers, json_payload, max_retries=3):
     raise Exception("Max retries exceeded")
 
 
+def resolve_message_documents(request, session):
+    """
+    Validate the document_ids sent with a new message.
+
+    Returns (documents_to_attach, documents_to_search, error_response):
+    documents_to_attach are the explicitly provided documents, and
+    documents_to_search falls back to every processed document in the session.
+    """
+    document_ids = request.data.get("document_ids", [])
+    if isinstance(document_ids, str):
+        try:
+            parsed_value = json.loads(document_ids)
+            document_ids = parsed_value if isinstance(parsed_value, list) else [document_ids]
+        except json.JSONDecodeError:
+            document_ids = [document_ids]
+
+    if not isinstance(document_ids, list):
+        return None, None, APIErrorResponse.bad_request("document_ids must be a list")
+
+    document_ids = [doc_id for doc_id in document_ids if doc_id]
+
+    if not document_ids:
+        # If no document_ids provided, get all processed documents from the session for RAG search
+        documents_to_search = Document.objects.filter(
+            user=request.user,
+            session=session,
+            processed=True
+        ).order_by("-uploaded_at")
+        return None, documents_to_search, None
+
+    # Validate provided document_ids
+    documents_to_attach = Document.objects.filter(id__in=document_ids, user=request.user, session=session)
+    if documents_to_attach.count() != len(set(document_ids)):
+        return None, None, APIErrorResponse.bad_request("One or more documents were not found for this session")
+
+    # Check if documents are already attached to another message
+    for document in documents_to_attach:
+        if document.message_id:
+            return None, None, APIErrorResponse.bad_request("One or more documents are already attached to another message")
+
+    # Use provided documents for search
+    return documents_to_attach, documents_to_attach, None
+
+
+def assistant_context_json(fastapi_data):
+    """Serialize FastAPI context for Message.context, keeping the is_incomplete flag"""
+    context_data = fastapi_data.get("context", [])
+    if fastapi_data.get("is_incomplete"):
+        # Add incomplete flag to context metadata
+        context_metadata = {"is_incomplete": True}
+        if isinstance(context_data, list):
+            context_metadata["context_docs"] = context_data
+        else:
+            context_metadata["context_docs"] = []
+        return json.dumps(context_metadata)
+    return json.dumps(context_data)
+
+
+def attach_message_documents(session, user_message, content, documents_to_attach):
+    """Link uploaded documents to the user message and title an untitled session"""
+    # Attach documents to the user message (only if explicitly provided)
+    if documents_to_attach:
+        for document in documents_to_attach:
+            document.message = user_message
+            if not document.filename:
+                document.filename = os.path.basename(document.file.name) if document.file else document.filename
+            document.save(update_fields=["message", "filename"])
+
+    # Update session title if empty
+    if not session.title:
+        session.title = content[:50] + ("..." if len(content) > 50 else "")
+        session.save()
+
+
 class ChatSessionView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -300,45 +383,11 @@ class ChatMessageView(APIView):
             if not content:
                 return APIErrorResponse.bad_request("Content is required")
 
-            document_ids = request.data.get("document_ids", [])
-            if isinstance(document_ids, str):
-                try:
-                    parsed_value = json.loads(document_ids)
-                    document_ids = parsed_value if isinstance(parsed_value, list) else [document_ids]
-                except json.JSONDecodeError:
-                    document_ids = [document_ids]
-
-            if not isinstance(document_ids, list):
-                return APIErrorResponse.bad_request("document_ids must be a list")
-
-            document_ids = [doc_id for doc_id in document_ids if doc_id]
-            
-            # Documents to attach to this message (only explicitly provided ones)
-            documents_to_attach = None
-            
-            # Documents to search in RAG (all session documents if none specified)
-            documents_to_search = None
-            
-            if not document_ids:
-                # If no document_ids provided, get all processed documents from the session for RAG search
-                documents_to_search = Document.objects.filter(
-                    user=request.user, 
-                    session=session,
-                    processed=True
-                ).order_by("-uploaded_at")
-            else:
-                # Validate provided document_ids
-                documents_to_attach = Document.objects.filter(id__in=document_ids, user=request.user, session=session)
-                if documents_to_attach.count() != len(set(document_ids)):
-                    return APIErrorResponse.bad_request("One or more documents were not found for this session")
-                
-                # Check if documents are already attached to another message
-                for document in documents_to_attach:
-                    if document.message_id:
-                        return APIErrorResponse.bad_request("One or more documents are already attached to another message")
-                
-                # Use provided documents for search
-                documents_to_search = documents_to_attach
+            # Documents to attach to this message (only explicitly provided ones) and
+            # documents to search in RAG (all session documents if none specified)
+            documents_to_attach, documents_to_search, error_response = resolve_message_documents(request, session)
+            if error_response:
+                return error_response
 
             # Store user message
             user_message = Message.objects.create(
@@ -377,38 +426,15 @@ class ChatMessageView(APIView):
 
                 # Store assistant message, linking to user message
                 # Store is_incomplete flag in context metadata if present
-                context_data = fastapi_data.get("context", [])
-                if fastapi_data.get("is_incomplete"):
-                    # Add incomplete flag to context metadata
-                    context_metadata = {"is_incomplete": True}
-                    if isinstance(context_data, list):
-                        context_metadata["context_docs"] = context_data
-                    else:
-                        context_metadata["context_docs"] = []
-                    context_json = json.dumps(context_metadata)
-                else:
-                    context_json = json.dumps(context_data)
-                
                 assistant_message = Message.objects.create(
                     session=session,
                     message_type="assistant",
                     content=fastapi_data["answer"],
-                    context=context_json,
+                    context=assistant_context_json(fastapi_data),
                     parent_message=user_message
                 )
 
-                # Attach documents to the user message (only if explicitly provided)
-                if documents_to_attach:
-                    for document in documents_to_attach:
-                        document.message = user_message
-                        if not document.filename:
-                            document.filename = os.path.basename(document.file.name) if document.file else document.filename
-                        document.save(update_fields=["message", "filename"])
-
-                # Update session title if empty
-                if not session.title:
-                    session.title = content[:50] + ("..." if len(content) > 50 else "")
-                    session.save()
+                attach_message_documents(session, user_message, content, documents_to_attach)
 
                 # Parse context to check for is_incomplete flag
                 context_data = fastapi_data.get("context", [])
@@ -575,6 +601,110 @@ class ChatMessageView(APIView):
         except ChatSession.DoesNotExist:
             return APIErrorResponse.not_found("Session not found")
 
+class ChatMessageStreamView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, session_id):
+        """
+        Create a user-assistant message pair, streaming the answer as it is generated.
+
+        Server-sent events from FastAPI /api/chat/stream are relayed as they
+        arrive. The assistant Message is saved when the final "done" event
+        comes through; its ids are added to that event before it is relayed.
+        """
+        try:
+            session = ChatSession.objects.get(id=session_id, user=request.user)
+        except ChatSession.DoesNotExist:
+            return APIErrorResponse.not_found("Session not found")
+
+        content = request.data.get("content")
+        if not content:
+            return APIErrorResponse.bad_request("Content is required")
+
+        documents_to_attach, documents_to_search, error_response = resolve_message_documents(request, session)
+        if error_response:
+            return error_response
+
+        user_message = Message.objects.create(
+            session=session,
+            message_type="user",
+            content=content
+        )
+
+        fastapi_url = f"{settings.FASTAPI_URL}/api/chat/stream"
+        headers = {"Authorization": f"Bearer {request.auth}", "Accept": "text/event-stream"}
+        payload = {
+            "content": content,
+            "session_id": str(session_id)
+        }
+        if documents_to_search and documents_to_search.exists():
+            payload["document_ids"] = [str(doc.id) for doc in documents_to_search]
+
+        logger.info(f"[CHAT] Opening stream to FastAPI: {fastapi_url}")
+        try:
+            # Read timeout applies between chunks, so long answers are fine as long as tokens keep coming
+            upstream = requests.post(fastapi_url, headers=headers, json=payload, stream=True, timeout=(10, 180))
+            upstream.raise_for_status()
+        except requests.RequestException as e:
+            logger.error(f"[CHAT] Error opening stream to FastAPI: {str(e)}")
+            user_message.delete()
+            return APIErrorResponse.server_error(f"Failed to process message. Service error: {str(e)}")
+
+        def event_stream():
+            assistant_message = None
+            try:
+                for line in upstream.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    if event.get("type") == "done":
+                        assistant_message = Message.objects.create(
+                            session=session,
+                            message_type="assistant",
+                            content=event["answer"],
+                            context=assistant_context_json(event),
+                            parent_message=user_message
+                        )
+                        attach_message_documents(session, user_message, content, documents_to_attach)
+                        event["user_message"] = {
+                            "id": str(user_message.id),
+                            "message_type": user_message.message_type,
+                            "content": user_message.content,
+                            "context": None,
+                            "timestamp": user_message.timestamp.isoformat(),
+                            "documents": [
+                                serialize_document(doc, request=request)
+                                for doc in user_message.documents.all()
+                            ]
+                        }
+                        event["assistant_message"] = {
+                            "id": str(assistant_message.id),
+                            "message_type": assistant_message.message_type,
+                            "content": assistant_message.content,
+                            "context": event.get("context", []),
+                            "is_incomplete": event.get("is_incomplete", False),
+                            "is_good": assistant_message.is_good,
+                            "is_bookmarked": assistant_message.is_bookmarked,
+                            "timestamp": assistant_message.timestamp.isoformat()
+                        }
+                    yield f"data: {json.dumps(event)}\n\n"
+            except (requests.RequestException, ValueError) as e:
+                logger.error(f"[CHAT] Stream from FastAPI failed: {str(e)}")
+                yield f"data: {json.dumps({'type': 'error', 'detail': f'Service error: {str(e)}'})}\n\n"
+            finally:
+                upstream.close()
+                # Nothing is kept for streams that errored or were abandoned by the client
+                if assistant_message is None:
+                    user_message.delete()
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
 class MarkMessageGoodView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -642,7 +772,7 @@ class SessionDocumentView(APIView):
         ])
 
     def post(self, request, session_id):
-        """Upload a PDF for a session and process it via FastAPI"""
+        """Upload a PDF for a session and queue it for processing via FastAPI"""
         logger.info(f"Upload request received for session {session_id}")
         logger.info(f"Request FILES keys: {list(request.FILES.keys())}")
         logger.info(f"Request content type: {request.content_type}")
@@ -735,38 +865,146 @@ class SessionDocumentView(APIView):
                 document.delete()
             return APIErrorResponse.server_error(f"Failed to save file: {str(e)}")
 
-        fastapi_url = f"{settings.FASTAPI_URL}/api/documents/process"
+        fastapi_url = f"{settings.FASTAPI_URL}/api/documents/jobs"
         headers = {"Authorization": f"Bearer {request.auth}"}
         try:
             # Open the saved file for FastAPI
             if not document.file:
                 raise ValueError("File field is empty")
             with document.file.open("rb") as file_obj:
+                # FastAPI only stores the file and queues it; embedding happens in the background
                 response = requests.post(
                     fastapi_url,
                     headers=headers,
                     files={"file": (unique_name, file_obj, "application/pdf")},
                     data={
                         "session_id": str(session_id),
-                        "document_id": str(document.id)
-                    }
+                        "document_id": str(document.id),
+                        # FastAPI reports the outcome here, so completion is recorded even if nobody polls
+                        "callback_url": request.build_absolute_uri(
+                            reverse("session-document-callback", args=[session_id, document.id])
+                        ),
+                        "callback_token": signing.dumps(str(document.id), salt=DOCUMENT_CALLBACK_SALT),
+                    },
+                    timeout=60
                 )
                 response.raise_for_status()
-                document.processed = True
-                document.save(update_fields=["processed"])
+                job = response.json()
+                document.processing_job_id = job["job_id"]
+                document.processing_status = job.get("status") or ""
+                document.save(update_fields=["processing_job_id", "processing_status"])
                 return Response({
                     "id": str(document.id),
                     "filename": document.filename,
                     "processed": document.processed,
                     "session_id": str(document.session_id),
                     "file_url": serialize_document(document, request=request)["file_url"],
-                    "message": "Document uploaded and processed successfully"
-                }, status=201)
-        except requests.RequestException as e:
-            logger.error(f"Error processing document via FastAPI: {str(e)}")
+                    "job_id": document.processing_job_id,
+                    "status": job.get("status"),
+                    "message": "Document uploaded and queued for processing"
+                }, status=202)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logger.error(f"Error queueing document via FastAPI: {str(e)}")
             document.delete()
             return APIErrorResponse.server_error(str(e))
 
+
+def record_processing_outcome(document, job_status, error=None):
+    """Store a finished ingestion job's outcome on its document"""
+    document.processing_status = job_status
+    document.processing_error = error or ""
+    update_fields = ["processing_status", "processing_error"]
+    if job_status == "completed":
+        document.processed = True
+        update_fields.append("processed")
+    document.save(update_fields=update_fields)
+
+
+class DocumentStatusView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, session_id, document_id):
+        """
+        Report a document's ingestion status. Completion and failure are
+        normally recorded by DocumentProcessingCallbackView; while the job is
+        running this asks FastAPI for progress, and records the outcome
+        itself if the job has finished but the callback never arrived.
+        """
+        try:
+            document = Document.objects.get(id=document_id, session_id=session_id, user=request.user)
+        except Document.DoesNotExist:
+            return APIErrorResponse.not_found("Document not found")
+
+        payload = {
+            "id": str(document.id),
+            "filename": document.filename,
+            "job_id": document.processing_job_id or None,
+            "processed": document.processed,
+        }
+        if document.processed or document.processing_status == "failed" or not document.processing_job_id:
+            payload.update({
+                "status": "completed" if document.processed else (document.processing_status or "unknown"),
+                "progress": 1.0 if document.processed else 0.0,
+                "error": document.processing_error or None,
+            })
+            return Response(payload)
+
+        fastapi_url = f"{settings.FASTAPI_URL}/api/documents/jobs/{document.processing_job_id}"
+        headers = {"Authorization": f"Bearer {request.auth}"}
+        try:
+            response = requests.get(fastapi_url, headers=headers, timeout=10)
+            if response.status_code == 404:
+                # FastAPI restarted and lost the job; the upload has to be retried
+                payload.update({"status": "unknown", "progress": 0.0, "error": "Processing job was lost, please upload again"})
+                return Response(payload)
+            response.raise_for_status()
+            job = response.json()
+        except requests.RequestException as e:
+            logger.error(f"Error polling document job {document.processing_job_id}: {str(e)}")
+            return APIErrorResponse.server_error(str(e))
+
+        if job.get("status") in ("completed", "failed"):
+            record_processing_outcome(document, job["status"], job.get("error"))
+            payload["processed"] = document.processed
+
+        payload.update({
+            "status": job.get("status"),
+            "progress": job.get("progress", 0.0),
+            "queue_position": job.get("queue_position"),
+            "error": job.get("error"),
+        })
+        return Response(payload)
+
+
+class DocumentProcessingCallbackView(APIView):
+    """Called by FastAPI when a document's ingestion job completes or fails"""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request, session_id, document_id):
+        # The signed token stands in for user authentication; it only names this document
+        try:
+            signed_id = signing.loads(
+                request.data.get("token") or "", salt=DOCUMENT_CALLBACK_SALT, max_age=DOCUMENT_CALLBACK_MAX_AGE
+            )
+        except signing.BadSignature:
+            return APIErrorResponse.forbidden("Invalid callback token")
+        if signed_id != str(document_id):
+            return APIErrorResponse.forbidden("Invalid callback token")
+
+        job_status = request.data.get("status")
+        if job_status not in ("completed", "failed"):
+            return APIErrorResponse.bad_request("status must be 'completed' or 'failed'")
+        try:
+            document = Document.objects.get(id=document_id, session_id=session_id)
+        except Document.DoesNotExist:
+            return APIErrorResponse.not_found("Document not found")
+
+        record_processing_outcome(document, job_status, request.data.get("error"))
+        logger.info(f"Document {document.id} processing {job_status} (job {request.data.get('job_id')})")
+        return Response({"id": str(document.id), "status": job_status, "processed": document.processed})
+
 class DocumentListView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
@@ -1,14 +1,29 @@
 # adaptive_learning.py
 
+import hashlib
 import json
+from collections import deque
 from typing import Dict, List, Optional
 from datetime import datetime
 import os
+import threading
+import time
 import numpy as np
 import faiss
 import pickle
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from config import settings
+from chunk_store import (
+    CONTENT_TYPE_FLAGS,
+    ChunkStore,
+    current_snapshot,
+    decode_content_type,
+    encode_content_type,
+    new_snapshot,
+    prune_snapshots,
+    publish_snapshot,
+)
+from sparse_index import BM25Index
 
 
 class ILSLearningProfile:
@@ -22,7 +37,8 @@ class ILSLearningProfile:
             'visual_verbal': 0.5,      # 0.0 to 1.0 (0=visual, 1=verbal, 0.5=balanced)
             'sequential_global': 0.5   # 0.0 to 1.0 (0=sequential, 1=global, 0.5=balanced)
         }
-        self.interaction_history = []
+        # Ring buffer: only the latest interactions are kept or persisted
+        self.interaction_history = deque(maxlen=settings.PROFILE_HISTORY_LIMIT)
         self.total_interactions = 0
         # Questionnaire data (ILS questionnaire responses)
         self.questionnaire_data = None  # Will store questionnaire responses
@@ -245,7 +261,7 @@ class ILSLearningProfile:
             'user_id': self.user_id,
             'dimensions': self.dimensions,
             'total_interactions': self.total_interactions,
-            'interaction_history': self.interaction_history[-10:],  # Keep last 10
+            'interaction_history': list(self.interaction_history),
             'questionnaire_data': self.questionnaire_data,
             'questionnaire_completed': self.questionnaire_completed,
             'questionnaire_timestamp': self.questionnaire_timestamp
@@ -257,7 +273,7 @@ class ILSLearningProfile:
         profile = cls(data['user_id'])
         profile.dimensions = data.get('dimensions', profile.dimensions)
         profile.total_interactions = data.get('total_interactions', 0)
-        profile.interaction_history = data.get('interaction_history', [])
+        profile.interaction_history.extend(data.get('interaction_history', []))
         profile.questionnaire_data = data.get('questionnaire_data')
         profile.questionnaire_completed = data.get('questionnaire_completed', False)
         profile.questionnaire_timestamp = data.get('questionnaire_timestamp')
@@ -373,23 +389,436 @@ class AdaptiveFAISSVectorStore:
     def __init__(self, embedding_model: HuggingFaceEmbeddings):
         self.embedding_model = embedding_model
         self.index = None
-        self.documents = []
+        self.documents = ChunkStore()
         self.dimension = 768
+        # Inverted maps from filter keys to FAISS row ids, so filtered
+        # searches only score the rows that can actually match
+        self.session_rows: Dict[str, List[int]] = {}
+        self.document_rows: Dict[str, List[int]] = {}
+        # BM25 index over the same rows, kept current by _append_rows and
+        # rebuilt from the chunk store by load_index; None with hybrid search off
+        self._sparse: Optional[BM25Index] = BM25Index() if settings.HYBRID_SEARCH_ENABLED else None
+        # Packed content-type flags per row, for vectorized style scoring
+        self._flags: Optional[np.ndarray] = None
+        # Rows added since the last persist, waiting to be appended to the WAL
+        self._pending_segments: List[Dict] = []
+        self._wal_segments = 0
+        self._lock = threading.RLock()
+        # One rebuild or snapshot at a time; held while they work outside self._lock
+        self._persist_lock = threading.Lock()
 
-    def add_documents(self, docs: List[str], metadatas: List[Dict] = None):
+    def add_documents(self, docs: List[str], metadatas: List[Dict] = None) -> List[int]:
+        """
+        Embed and index chunks, returning the row id that holds each one.
+
+        Chunks whose exact text is already stored are not embedded again;
+        their session_id / document_id are linked to the existing row.
+        """
         if not docs:
-            return
-        embeddings = self.embedding_model.embed_documents(docs)
-        embeddings_np = np.array(embeddings).astype("float32")
+            return []
+        metadatas = metadatas or [{} for _ in docs]
+        with self._lock:
+            rows = [self.documents.find(doc) for doc in docs]
+        # Only the first copy of each unseen chunk is embedded
+        first_position = {}
+        new_positions = []
+        for i, doc in enumerate(docs):
+            if rows[i] is None and doc not in first_position:
+                first_position[doc] = i
+                new_positions.append(i)
+
+        new_documents = []
+        embeddings_np = None
+        if new_positions:
+            embeddings = self.embedding_model.embed_documents([docs[i] for i in new_positions])
+            embeddings_np = np.array(embeddings).astype("float32")
+            faiss.normalize_L2(embeddings_np)
+            for i in new_positions:
+                metadata = metadatas[i]
+                # Analyze content characteristics for learning style matching
+                metadata['content_type'] = self._analyze_content_type(docs[i])
+                new_documents.append({"content": docs[i], "metadata": metadata})
+
+        with self._lock:
+            # Another batch (e.g. a concurrent upload) may have stored some of
+            # these texts while this one was embedding; link to its rows instead
+            for i in new_positions:
+                rows[i] = self.documents.find(docs[i])
+            fresh = [offset for offset, i in enumerate(new_positions) if rows[i] is None]
+            if len(fresh) < len(new_positions):
+                new_positions = [new_positions[offset] for offset in fresh]
+                new_documents = [new_documents[offset] for offset in fresh]
+                embeddings_np = embeddings_np[fresh]
+            start = len(self.documents)
+            if new_documents:
+                self._append_rows(embeddings_np, new_documents)
+                self._pending_segments.append({
+                    "start": start,
+                    "vectors": embeddings_np,
+                    "documents": new_documents
+                })
+            for offset, i in enumerate(new_positions):
+                rows[i] = start + offset
+            embedded = set(new_positions)
+            links = []
+            for i, doc in enumerate(docs):
+                if i in embedded:
+                    continue
+                if rows[i] is None:
+                    rows[i] = rows[first_position[doc]]
+                link = self._link_row(rows[i], metadatas[i].get("session_id"), metadatas[i].get("document_id"))
+                if link:
+                    links.append(link)
+            if links:
+                self._pending_segments.append({"links": links})
+        return rows
+
+    def _link_row(self, row_id: int, session_id: str = None, document_id: str = None) -> Optional[List]:
+        """Attach a session/document to an existing row and index it for filtering"""
+        if not (session_id or document_id) or not self.documents.link(row_id, session_id, document_id):
+            return None
+        self._register_row(row_id, {"session_id": session_id, "document_id": document_id})
+        return [int(row_id), session_id, document_id]
+
+    def attach_file(self, file_hash: str, metadata: Dict) -> Optional[int]:
+        """
+        Reuse the rows of a previously ingested file for a new upload.
+        Returns the number of rows attached, or None if the file is unknown.
+        """
+        with self._lock:
+            rows = self.documents.files.get(file_hash)
+            if not rows:
+                return None
+            links = []
+            for row_id in rows:
+                link = self._link_row(row_id, metadata.get("session_id"), metadata.get("document_id"))
+                if link:
+                    links.append(link)
+            if links:
+                self._pending_segments.append({"links": links})
+            return len(rows)
+
+    def register_file(self, file_hash: str, rows: List[int]):
+        """Remember which rows hold a file's chunks so re-uploads can skip ingestion"""
+        with self._lock:
+            rows = sorted(set(int(row) for row in rows))
+            self.documents.files[file_hash] = rows
+            self._pending_segments.append({"files": {file_hash: rows}})
+
+    def _document_for(self, row_id: int, session_id: str = None, document_ids: List[str] = None) -> Dict:
+        """
+        Stored chunk for a row, with session_id / document_id taken from
+        whichever attachment satisfies the active filters.
+        """
+        doc = self.documents[row_id]
+        if not session_id and not document_ids:
+            return doc
+        metadata = doc.get("metadata", {})
+
+        def matches(candidate_session, candidate_document):
+            if session_id and candidate_session != session_id:
+                return False
+            return not document_ids or candidate_document in document_ids
+
+        if matches(metadata.get("session_id"), metadata.get("document_id")):
+            return doc
+        for _, link_session, link_document in self.documents.row_links(row_id):
+            if matches(link_session, link_document):
+                return {**doc, "metadata": {**metadata, "session_id": link_session, "document_id": link_document}}
+        return doc
+
+    def _append_rows(self, embeddings_np: np.ndarray, new_documents: List[Dict]):
+        """Add normalized vectors and their documents to the in-memory store"""
         if self.index is None:
             self.index = faiss.IndexFlatIP(self.dimension)
-        faiss.normalize_L2(embeddings_np)
         self.index.add(embeddings_np)
-        for i, doc in enumerate(docs):
-            metadata = metadatas[i] if metadatas else {}
-            # Analyze content characteristics for learning style matching
-            metadata['content_type'] = self._analyze_content_type(doc)
-            self.documents.append({"content": doc, "metadata": metadata})
+        for doc in new_documents:
+            self.documents.append(doc)
+            row_id = len(self.documents) - 1
+            self._register_row(row_id, doc.get("metadata", {}))
+            if self._sparse is not None:
+                self._sparse.add(row_id, doc["content"])
+        if self._flags is not None:
+            added = np.fromiter(
+                (encode_content_type(doc.get("metadata", {}).get("content_type", {})) for doc in new_documents),
+                dtype=np.uint8, count=len(new_documents)
+            )
+            self._flags = np.concatenate([self._flags, added])
+
+    # FAISS index_factory layouts for each supported VECTORSTORE_INDEX_TYPE
+    INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+    @staticmethod
+    def _index_kind(index) -> str:
+        """Map a FAISS index object back to its VECTORSTORE_INDEX_TYPE name"""
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexIVFPQ):
+            return "ivf_pq"
+        if isinstance(index, faiss.IndexIVFFlat):
+            return "ivf_flat"
+        if isinstance(index, faiss.IndexHNSW):
+            return "hnsw"
+        return "flat"
+
+    def _min_training_rows(self, index_type: str) -> int:
+        """Rows needed before an index type can be trained (FAISS recommends 39 per centroid)"""
+        if index_type == "ivf_flat":
+            return settings.VECTORSTORE_IVF_NLIST * 39
+        if index_type == "ivf_pq":
+            # Each 8-bit PQ codebook also has 256 centroids to train
+            return max(settings.VECTORSTORE_IVF_NLIST, 256) * 39
+        return 0
+
+    def _configure_index(self, index):
+        """Apply query-time parameters, which are not all persisted by write_index"""
+        kind = self._index_kind(index)
+        if kind in ("ivf_flat", "ivf_pq"):
+            ivf = faiss.extract_index_ivf(index)
+            ivf.nprobe = settings.VECTORSTORE_IVF_NPROBE
+            # Row-id reconstruction is needed by filtered search and rebuilds
+            ivf.make_direct_map()
+        elif kind == "hnsw":
+            faiss.downcast_index(index).hnsw.efSearch = settings.VECTORSTORE_HNSW_EF_SEARCH
+        return index
+
+    def _build_index(self, index_type: str, vectors: np.ndarray):
+        """Create, train and fill an index of the given type from normalized vectors"""
+        if index_type == "flat":
+            spec = "Flat"
+        elif index_type == "ivf_flat":
+            spec = f"IVF{settings.VECTORSTORE_IVF_NLIST},Flat"
+        elif index_type == "hnsw":
+            spec = f"HNSW{settings.VECTORSTORE_HNSW_M},Flat"
+        elif index_type == "ivf_pq":
+            spec = f"IVF{settings.VECTORSTORE_IVF_NLIST},PQ{settings.VECTORSTORE_PQ_M}"
+        else:
+            raise ValueError(f"Unsupported vectorstore index type: {index_type}")
+        index = faiss.index_factory(self.dimension, spec, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        return self._configure_index(index)
+
+    def rebuild_index(self, index_type: str = None, recall_queries: int = 200, recall_k: int = 10) -> Dict:
+        """
+        Rebuild the index as index_type (default: settings.VECTORSTORE_INDEX_TYPE)
+        and report recall@k of the new index against exact flat search.
+
+        Stays on the current index if there are too few rows to train.
+
+        Only copying the vectors out and swapping the new index in hold
+        self._lock; training runs without it, so searches keep being served.
+        Rows added meanwhile are copied into the new index before the swap.
+        """
+        index_type = (index_type or settings.VECTORSTORE_INDEX_TYPE).lower()
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unsupported vectorstore index type: {index_type}")
+        with self._persist_lock:
+            with self._lock:
+                if self.index is None or self.index.ntotal == 0:
+                    return {"index_type": None, "rebuilt": False, "reason": "empty store"}
+                current = self._index_kind(self.index)
+                ntotal = self.index.ntotal
+                if ntotal < self._min_training_rows(index_type):
+                    print(f"ℹ️ [VectorStore] {ntotal} rows is too few to train {index_type}, keeping {current}")
+                    return {"index_type": current, "rebuilt": False, "reason": "not enough rows to train"}
+                vectors = self.index.reconstruct_n(0, ntotal)
+
+            print(f"🏗️ [VectorStore] Rebuilding {current} index as {index_type} over {ntotal} rows")
+            new_index = self._build_index(index_type, vectors)
+            report = self.recall_report(new_index, vectors, recall_queries, recall_k)
+            with self._lock:
+                added = self.index.ntotal - ntotal
+                if added:
+                    new_index.add(self.index.reconstruct_n(ntotal, added))
+                self.index = new_index
+        report.update({"index_type": index_type, "previous_index_type": current, "rebuilt": True})
+        if current == "ivf_pq":
+            report["note"] = "ground truth reconstructed from PQ codes, so recall is approximate"
+        print(f"📈 [VectorStore] recall@{recall_k} = {report['recall']:.3f} over {report['queries']} queries")
+        return report
+
+    @staticmethod
+    def recall_report(index, vectors: np.ndarray, num_queries: int = 200, k: int = 10) -> Dict:
+        """
+        Recall@k of index against brute-force inner product over vectors,
+        using a sample of the stored vectors as queries.
+        """
+        num_queries = min(num_queries, len(vectors))
+        k = min(k, len(vectors))
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), size=num_queries, replace=False)]
+        
+        exact = faiss.IndexFlatIP(vectors.shape[1])
+        exact.add(vectors)
+        _, truth = exact.search(queries, k)
+        _, found = index.search(queries, k)
+        
+        hits = sum(len(set(t) & set(f)) for t, f in zip(truth.tolist(), found.tolist()))
+        return {"recall": hits / float(num_queries * k), "queries": num_queries, "k": k}
+
+    def needs_rebuild(self) -> bool:
+        """Whether the configured index type differs from the live index and can be trained"""
+        if self.index is None:
+            return False
+        index_type = settings.VECTORSTORE_INDEX_TYPE.lower()
+        return (
+            self._index_kind(self.index) != index_type
+            and self.index.ntotal >= self._min_training_rows(index_type)
+        )
+
+    def _register_row(self, row_id: int, metadata: Dict):
+        """Record a row id under its session_id / document_id keys"""
+        session_id = metadata.get("session_id")
+        if session_id:
+            self.session_rows.setdefault(session_id, []).append(row_id)
+        document_id = metadata.get("document_id")
+        if document_id:
+            self.document_rows.setdefault(document_id, []).append(row_id)
+
+    def _rebuild_row_maps(self):
+        """Rebuild the session/document row maps from stored metadata"""
+        self.session_rows = self.documents.group_rows("session_id")
+        self.document_rows = self.documents.group_rows("document_id")
+
+    def _candidate_rows(self, session_id: str = None, document_ids: List[str] = None) -> Optional[np.ndarray]:
+        """
+        Resolve filters to the FAISS row ids that satisfy all of them.
+        Returns None when no filter is active (search the whole index).
+        """
+        candidates = None
+        if session_id:
+            candidates = set(self.session_rows.get(session_id, []))
+        if document_ids and len(document_ids) > 0:
+            doc_rows = set()
+            for doc_id in document_ids:
+                doc_rows.update(self.document_rows.get(doc_id, []))
+            candidates = doc_rows if candidates is None else candidates & doc_rows
+        if candidates is None:
+            return None
+        return np.fromiter(sorted(candidates), dtype="int64", count=len(candidates))
+
+    def filter_fingerprint(self, session_id: str = None, document_ids: List[str] = None) -> Optional[str]:
+        """
+        Digest of the rows a filtered search can see, or None when unfiltered.
+        It changes whenever rows are added to or linked into the filter.
+        """
+        with self._lock:
+            rows = self._candidate_rows(session_id, document_ids)
+        if rows is None:
+            return None
+        return hashlib.sha1(rows.tobytes()).hexdigest()
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        query_embedding = self.embedding_model.embed_query(query)
+        query_np = np.array([query_embedding]).astype("float32")
+        faiss.normalize_L2(query_np)
+        return query_np
+
+    def _build_sparse_index(self):
+        """Index every stored chunk for BM25; runs at load time, never during a request"""
+        if not settings.HYBRID_SEARCH_ENABLED:
+            self._sparse = None
+            return
+        started = time.perf_counter()
+        sparse = BM25Index()
+        for row_id, text in enumerate(self.documents.texts()):
+            sparse.add(row_id, text)
+        self._sparse = sparse
+        print(f"🔤 [VectorStore] Built BM25 index over {len(sparse)} chunks in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def _candidate_window(k: int) -> int:
+        """Rows fetched for re-ranking; fusion surfaces exact-term hits, so it needs fewer"""
+        return k * (settings.HYBRID_CANDIDATE_FACTOR if settings.HYBRID_SEARCH_ENABLED else 5)
+
+    def _search(
+        self,
+        query_np: np.ndarray,
+        k: int,
+        session_id: str = None,
+        document_ids: List[str] = None,
+        query: str = None
+    ):
+        """
+        Return (scores, indices, relevance) for the top k rows.
+
+        scores are always cosine similarities, so confidence thresholds keep
+        their meaning. With hybrid search enabled and the query text given,
+        the dense top k and the BM25 top k (both under the same filters) are
+        merged by reciprocal-rank fusion: rows come back in fused order and
+        relevance is the fused score scaled to (0, 1]. Otherwise relevance is
+        the cosine score itself.
+
+        Everything that reads the FAISS index or the row maps runs under
+        self._lock, which writers also hold while they touch the index
+        (_append_rows, and rebuild_index / save_index while they copy or swap
+        it): FAISS releases the GIL, so a concurrent index.add from an
+        ingestion thread would otherwise race with search/reconstruct.
+        """
+        with self._lock:
+            rows = self._candidate_rows(session_id, document_ids)
+            scores, indices = self._dense_search(query_np, k, rows)
+            if not query or self._sparse is None:
+                return scores, indices, scores
+            _, sparse_indices = self._sparse.search(query, k, rows)
+            return self._fuse(query_np, scores, indices, sparse_indices, k)
+
+    def _fuse(
+        self,
+        query_np: np.ndarray,
+        dense_scores: np.ndarray,
+        dense_indices: np.ndarray,
+        sparse_indices: np.ndarray,
+        k: int
+    ):
+        """Reciprocal-rank fusion of the dense and sparse result lists"""
+        rrf_k = settings.HYBRID_RRF_K
+        keep = dense_indices != -1
+        dense_indices = dense_indices[keep].tolist()
+        cosine = dict(zip(dense_indices, dense_scores[keep].tolist()))
+        fused: Dict[int, float] = {}
+        for ranked in (dense_indices, sparse_indices.tolist()):
+            for rank, row_id in enumerate(ranked):
+                fused[row_id] = fused.get(row_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+        # sorted() is stable, so ties keep dense order
+        order = sorted(fused, key=fused.get, reverse=True)[:k]
+        keyword_only = [row_id for row_id in order if row_id not in cosine]
+        if keyword_only:
+            vectors = self.index.reconstruct_batch(np.array(keyword_only, dtype="int64"))
+            cosine.update(zip(keyword_only, (vectors @ query_np[0]).tolist()))
+        # A row ranked first by both legs scores 1.0
+        best = 2.0 / (rrf_k + 1)
+        return (
+            np.array([cosine[row_id] for row_id in order], dtype="float32"),
+            np.array(order, dtype="int64"),
+            np.array([fused[row_id] / best for row_id in order], dtype="float32"),
+        )
+
+    def _dense_search(self, query_np: np.ndarray, k: int, rows: Optional[np.ndarray]):
+        """
+        Unfiltered queries go through the FAISS index. Filtered queries score
+        only the rows listed in the session/document maps, so latency depends
+        on the size of the matching subset instead of the whole store.
+        """
+        if rows is None:
+            search_k = min(k, len(self.documents))
+            scores, indices = self.index.search(query_np, search_k)
+            return scores[0], indices[0]
+        
+        print(f"   🔎 Filtering active - scoring {len(rows)} matching documents")
+        if len(rows) == 0:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        
+        vectors = self.index.reconstruct_batch(rows)
+        scores = vectors @ query_np[0]
+        search_k = min(k, len(rows))
+        if search_k < len(rows):
+            top = np.argpartition(-scores, search_k - 1)[:search_k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], rows[top]
 
     def _analyze_content_type(self, text: str) -> Dict:
         """Analyze content to determine its learning style characteristics"""
@@ -417,95 +846,77 @@ class AdaptiveFAISSVectorStore:
             return []
         
         # Get initial results (fetch more than k for re-ranking and filtering)
-        query_embedding = self.embedding_model.embed_query(query)
-        query_np = np.array([query_embedding]).astype("float32")
-        faiss.normalize_L2(query_np)
+        query_np = self._embed_query(query)
         
-        # When filtering by session_id or document_ids, we need to search through
-        # a much larger set to find matching documents, since they might not be
-        # in the top similarity results
-        if session_id or (document_ids and len(document_ids) > 0):
-            # Search through a large portion of documents when filtering
-            search_k = min(len(self.documents), max(k * 20, 200))  # Search more when filtering
-            print(f"   🔎 Filtering active - searching through {search_k} documents")
-        else:
-            search_k = min(k * 5, len(self.documents))  # Normal search
-        scores, indices = self.index.search(query_np, search_k)
-        
-        results = []
-        total_checked = 0
-        filtered_by_session = 0
-        filtered_by_doc_id = 0
-        sample_metadata_shown = False
-        
-        for score, idx in zip(scores[0], indices[0]):
-            if idx != -1:
-                total_checked += 1
-                doc = self.documents[idx]
-                metadata = doc.get("metadata", {})
-                doc_id = metadata.get("document_id")
-                doc_session_id = metadata.get("session_id")
-                
-                # Debug: Show sample metadata for first few documents
-                if not sample_metadata_shown and total_checked <= 3:
-                    print(f"   📋 Sample doc {total_checked} metadata: session_id={doc_session_id}, document_id={doc_id}")
-                    if total_checked == 3:
-                        sample_metadata_shown = True
-                
-                # STRICT filtering: If session_id or document_ids are provided, 
-                # only include documents with proper metadata
-                if session_id:
-                    # If session_id is provided, document MUST have matching session_id
-                    if not doc_session_id or doc_session_id != session_id:
-                        filtered_by_session += 1
-                        continue
-                
-                # Filter by document_ids if provided (non-empty list) - STRICT filtering
-                if document_ids and len(document_ids) > 0:
-                    # Document MUST have a document_id and it MUST be in the provided list
-                    if not doc_id or doc_id not in document_ids:
-                        filtered_by_doc_id += 1
-                        continue
-                
-                # Apply learning style boost
-                style_score = self._calculate_style_score(doc, learning_style)
-                
-                # Priority boost system:
-                # 1. Highest priority: documents matching provided document_ids (2x boost)
-                # 2. High priority: documents from current session (1.5x boost)
-                # 3. Normal priority: other documents (1x)
+        # FAISS releases the GIL, so index reads must not overlap index.add on an ingestion thread
+        with self._lock:
+            # Filtered queries only score rows from the session/document maps,
+            # so the same candidate window works with or without filters
+            scores, indices, relevances = self._search(query_np, self._candidate_window(k), session_id, document_ids, query)
+        
+            keep = indices != -1
+            rows = indices[keep]
+            if len(rows) == 0:
+                print(f"⚠️ No results after filtering!")
+                print(f"   - Requested session_id: {session_id}")
+                print(f"   - Requested document_ids: {document_ids}")
+                return []
+            semantic = scores[keep].astype(np.float64)
+            relevance = relevances[keep].astype(np.float64)
+        
+            # Style scores for every candidate in one lookup: the score depends
+            # only on the six content-type flags, so it is tabulated per bitmask
+            style = self._style_score_table(learning_style)[self._style_flags()[rows]]
+        
+            # Priority boost system:
+            # 1. Highest priority: documents matching provided document_ids (2x boost)
+            # 2. High priority: documents from current session (1.5x boost)
+            # 3. Normal priority: other documents (1x)
+            # Candidates come from the filter maps, so every row matches the filters
+            if document_ids and len(document_ids) > 0:
+                priority_multiplier = 2.0
+            elif session_id:
+                priority_multiplier = 1.5
+            else:
                 priority_multiplier = 1.0
-                if document_ids and len(document_ids) > 0 and doc_id in document_ids:
-                    # Maximum priority for explicitly requested documents
-                    priority_multiplier = 2.0
-                elif session_id and doc_session_id == session_id:
-                    # High priority for current session documents
-                    priority_multiplier = 1.5
-                
-                # Combine scores with priority boost
-                base_score = float(score) * 0.7 + style_score * 0.3
-                combined_score = base_score * priority_multiplier
-                
+        
+            # Combine scores with priority boost
+            combined = (relevance * 0.7 + style * 0.3) * priority_multiplier
+        
+            # Top k by combined score, ties kept in candidate order like a stable sort
+            if k < len(rows):
+                kth = combined[np.argpartition(-combined, k - 1)[k - 1]]
+                top = np.flatnonzero(combined >= kth)
+            else:
+                top = np.arange(len(rows))
+            top = top[np.argsort(-combined[top], kind="stable")][:k]
+        
+            results = []
+            for position in top.tolist():
+                doc = self._document_for(rows[position], session_id, document_ids)
                 results.append({
                     **doc,
-                    "semantic_score": float(score),
-                    "style_score": style_score,
+                    "semantic_score": float(semantic[position]),
+                    "relevance_score": float(relevance[position]),
+                    "style_score": float(style[position]),
                     "priority_multiplier": priority_multiplier,
-                    "combined_score": combined_score
+                    "combined_score": float(combined[position])
                 })
-        
-        # Re-rank by combined score (with priority boost)
-        results.sort(key=lambda x: x['combined_score'], reverse=True)
-        
-        # Debug logging
-        if len(results) == 0:
-            print(f"⚠️ No results after filtering! Checked {total_checked} documents")
-            print(f"   - Filtered by session_id: {filtered_by_session}")
-            print(f"   - Filtered by document_ids: {filtered_by_doc_id}")
-            print(f"   - Requested session_id: {session_id}")
-            print(f"   - Requested document_ids: {document_ids}")
-        
-        return results[:k]
+            return results
+
+    def _style_flags(self) -> np.ndarray:
+        """Packed content-type flags for every row, aligned with FAISS row ids"""
+        with self._lock:
+            if self._flags is None or len(self._flags) != len(self.documents):
+                self._flags = self.documents.content_flags()
+            return self._flags
+
+    def _style_score_table(self, learning_style: Dict) -> np.ndarray:
+        """_calculate_style_score for each possible content-type bitmask"""
+        return np.array([
+            self._calculate_style_score({"metadata": {"content_type": decode_content_type(flags)}}, learning_style)
+            for flags in range(1 << len(CONTENT_TYPE_FLAGS))
+        ])
 
     def _calculate_style_score(self, doc: Dict, learning_style: Dict) -> float:
         """Calculate how well content matches learning style"""
@@ -554,108 +965,255 @@ class AdaptiveFAISSVectorStore:
         """Standard similarity search with optional filtering"""
         if self.index is None or len(self.documents) == 0:
             return []
-        query_embedding = self.embedding_model.embed_query(query)
-        query_np = np.array([query_embedding]).astype("float32")
-        faiss.normalize_L2(query_np)
+        query_np = self._embed_query(query)
         
-        # When filtering by session_id or document_ids, we need to search through
-        # a much larger set to find matching documents, since they might not be
-        # in the top similarity results
-        if session_id or (document_ids and len(document_ids) > 0):
-            # Search through a large portion of documents when filtering
-            search_k = min(len(self.documents), max(k * 20, 200))  # Search more when filtering
-            print(f"   🔎 Filtering active - searching through {search_k} documents")
-        else:
-            search_k = min(k * 5, len(self.documents))  # Normal search
-        scores, indices = self.index.search(query_np, search_k)
-        
-        results = []
-        total_checked = 0
-        filtered_by_session = 0
-        filtered_by_doc_id = 0
-        sample_metadata_shown = False
-        
-        for score, idx in zip(scores[0], indices[0]):
-            if idx != -1:
-                total_checked += 1
-                doc = self.documents[idx]
-                metadata = doc.get("metadata", {})
-                doc_id = metadata.get("document_id")
-                doc_session_id = metadata.get("session_id")
+        # FAISS releases the GIL, so index reads must not overlap index.add on an ingestion thread
+        with self._lock:
+            # Filtered queries only score rows from the session/document maps,
+            # so the same candidate window works with or without filters
+            scores, indices, relevances = self._search(query_np, self._candidate_window(k), session_id, document_ids, query)
+        
+            results = []
+            total_checked = 0
+            filtered_by_session = 0
+            filtered_by_doc_id = 0
+            sample_metadata_shown = False
+        
+            for score, idx, relevance in zip(scores, indices, relevances):
+                if idx != -1:
+                    total_checked += 1
+                    doc = self._document_for(idx, session_id, document_ids)
+                    metadata = doc.get("metadata", {})
+                    doc_id = metadata.get("document_id")
+                    doc_session_id = metadata.get("session_id")
                 
-                # Debug: Show sample metadata for first few documents
-                if not sample_metadata_shown and total_checked <= 3:
-                    print(f"   📋 Sample doc {total_checked} metadata: session_id={doc_session_id}, document_id={doc_id}")
-                    if total_checked == 3:
-                        sample_metadata_shown = True
+                    # Debug: Show sample metadata for first few documents
+                    if not sample_metadata_shown and total_checked <= 3:
+                        print(f"   📋 Sample doc {total_checked} metadata: session_id={doc_session_id}, document_id={doc_id}")
+                        if total_checked == 3:
+                            sample_metadata_shown = True
                 
-                # STRICT filtering: If session_id or document_ids are provided, 
-                # only include documents with proper metadata
-                if session_id:
-                    # If session_id is provided, document MUST have matching session_id
-                    if not doc_session_id or doc_session_id != session_id:
-                        filtered_by_session += 1
-                        continue
+                    # STRICT filtering: If session_id or document_ids are provided, 
+                    # only include documents with proper metadata
+                    if session_id:
+                        # If session_id is provided, document MUST have matching session_id
+                        if not doc_session_id or doc_session_id != session_id:
+                            filtered_by_session += 1
+                            continue
                 
-                # Filter by document_ids if provided (non-empty list) - STRICT filtering
-                if document_ids and len(document_ids) > 0:
-                    # Document MUST have a document_id and it MUST be in the provided list
-                    if not doc_id or doc_id not in document_ids:
-                        filtered_by_doc_id += 1
-                        continue
+                    # Filter by document_ids if provided (non-empty list) - STRICT filtering
+                    if document_ids and len(document_ids) > 0:
+                        # Document MUST have a document_id and it MUST be in the provided list
+                        if not doc_id or doc_id not in document_ids:
+                            filtered_by_doc_id += 1
+                            continue
                 
-                # Priority boost system:
-                # 1. Highest priority: documents matching provided document_ids (2x boost)
-                # 2. High priority: documents from current session (1.5x boost)
-                # 3. Normal priority: other documents (1x)
-                priority_multiplier = 1.0
-                if document_ids and len(document_ids) > 0 and doc_id in document_ids:
-                    # Maximum priority for explicitly requested documents
-                    priority_multiplier = 2.0
-                elif session_id and doc_session_id == session_id:
-                    # High priority for current session documents
-                    priority_multiplier = 1.5
+                    # Priority boost system:
+                    # 1. Highest priority: documents matching provided document_ids (2x boost)
+                    # 2. High priority: documents from current session (1.5x boost)
+                    # 3. Normal priority: other documents (1x)
+                    priority_multiplier = 1.0
+                    if document_ids and len(document_ids) > 0 and doc_id in document_ids:
+                        # Maximum priority for explicitly requested documents
+                        priority_multiplier = 2.0
+                    elif session_id and doc_session_id == session_id:
+                        # High priority for current session documents
+                        priority_multiplier = 1.5
                 
-                # Apply priority boost to score
-                boosted_score = float(score) * priority_multiplier
+                    # Apply priority boost to score
+                    boosted_score = float(relevance) * priority_multiplier
                 
-                results.append({
-                    **doc, 
-                    "score": float(score),
-                    "priority_multiplier": priority_multiplier,
-                    "boosted_score": boosted_score
-                })
+                    results.append({
+                        **doc, 
+                        "score": float(score),
+                        "relevance_score": float(relevance),
+                        "priority_multiplier": priority_multiplier,
+                        "boosted_score": boosted_score
+                    })
                 
-                # Stop if we have enough results
-                if len(results) >= k:
-                    break
+                    # Stop if we have enough results
+                    if len(results) >= k:
+                        break
         
-        # Re-rank by boosted score to ensure priority documents come first
-        results.sort(key=lambda x: x.get('boosted_score', x.get('score', 0)), reverse=True)
+            # Re-rank by boosted score to ensure priority documents come first
+            results.sort(key=lambda x: x.get('boosted_score', x.get('score', 0)), reverse=True)
         
-        # Debug logging
-        if len(results) == 0:
-            print(f"⚠️ No results after filtering! Checked {total_checked} documents")
-            print(f"   - Filtered by session_id: {filtered_by_session}")
-            print(f"   - Filtered by document_ids: {filtered_by_doc_id}")
-            print(f"   - Requested session_id: {session_id}")
-            print(f"   - Requested document_ids: {document_ids}")
+            # Debug logging
+            if len(results) == 0:
+                print(f"⚠️ No results after filtering! Checked {total_checked} documents")
+                print(f"   - Filtered by session_id: {filtered_by_session}")
+                print(f"   - Filtered by document_ids: {filtered_by_doc_id}")
+                print(f"   - Requested session_id: {session_id}")
+                print(f"   - Requested document_ids: {document_ids}")
         
-        return results[:k]
+            return results[:k]
 
     def save_index(self, path: str):
-        if self.index is not None:
-            faiss.write_index(self.index, f"{path}.faiss")
-            with open(f"{path}.pkl", "wb") as f:
-                pickle.dump(self.documents, f)
+        """
+        Write a full snapshot and truncate the write-ahead log.
+        Cost is O(total corpus); use append_segment for per-upload persistence.
+
+        The index and chunk store go into a new versioned directory under
+        {path}.snapshots, which is published by atomically replacing the
+        {path}.current pointer. Only then is the WAL cut back, so a crash at
+        any point leaves a published snapshot plus a WAL that covers the rest.
+
+        self._lock is held only to copy the index and to switch over, not
+        while the corpus is written and fsynced. Rows added during the write
+        go to the WAL after the snapshot point and are kept when it is cut.
+        """
+        with self._persist_lock:
+            with self._lock:
+                if self.index is None:
+                    return
+                # Everything up to the snapshot point is in the WAL before it is taken
+                self.append_segment(path)
+                wal_path = f"{path}.wal"
+                wal_offset = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+                wal_segments = self._wal_segments
+                index = faiss.clone_index(self.index)
+                rows = index.ntotal
+
+            directory = new_snapshot(path)
+            faiss.write_index(index, os.path.join(directory, "index.faiss"))
+            self.documents.save(os.path.join(directory, "chunks"), rows)
+            publish_snapshot(path, directory)
+
+            with self._lock:
+                self.documents.adopt(os.path.join(directory, "chunks"))
+                self._truncate_wal(wal_path, wal_offset)
+                self._wal_segments -= wal_segments
+            prune_snapshots(path)
+
+    @staticmethod
+    def _truncate_wal(wal_path: str, offset: int):
+        """Drop the first offset bytes of the WAL, keeping segments appended after them"""
+        if not os.path.exists(wal_path):
+            return
+        if os.path.getsize(wal_path) <= offset:
+            os.remove(wal_path)
+            return
+        with open(wal_path, "rb") as f:
+            f.seek(offset)
+            remaining = f.read()
+        with open(f"{wal_path}.tmp", "wb") as f:
+            f.write(remaining)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{wal_path}.tmp", wal_path)
+
+    def append_segment(self, path: str) -> int:
+        """
+        Append rows added since the last persist to the write-ahead log.
+        Cost depends only on the new chunks, not on the size of the store.
+        Returns the number of rows written.
+        """
+        with self._lock:
+            if not self._pending_segments:
+                return 0
+            written = 0
+            with open(f"{path}.wal", "ab") as f:
+                for segment in self._pending_segments:
+                    pickle.dump(segment, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    written += len(segment.get("documents", []))
+                f.flush()
+                os.fsync(f.fileno())
+            self._wal_segments += len(self._pending_segments)
+            self._pending_segments = []
+            return written
+
+    def needs_compaction(self) -> bool:
+        """Whether the WAL has grown enough to fold it into a new snapshot"""
+        return self._wal_segments >= settings.VECTORSTORE_COMPACT_SEGMENTS
+
+    def compact(self, path: str):
+        """
+        Fold the write-ahead log into a fresh snapshot. Runs on an executor
+        thread; searches are only blocked while the index is copied or swapped.
+        """
+        print(f"🗜️ [VectorStore] Compacting {self._wal_segments} WAL segments into snapshot")
+        # Migrate to the configured ANN index once the corpus is large enough to train it
+        if self.needs_rebuild():
+            self.rebuild_index()
+        self.save_index(path)
+
+    def _replay_wal(self, path: str) -> int:
+        """Re-apply WAL segments not yet covered by the loaded snapshot"""
+        wal_path = f"{path}.wal"
+        if not os.path.exists(wal_path):
+            return 0
+        replayed = 0
+        # End of the last intact segment
+        good_offset = 0
+        with open(wal_path, "rb") as f:
+            while True:
+                try:
+                    segment = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    # A crash mid-append leaves a torn trailing record; stop there
+                    print(f"⚠️ [VectorStore] Stopping WAL replay at damaged segment: {e}")
+                    break
+                good_offset = f.tell()
+                self._wal_segments += 1
+                if "start" not in segment:
+                    # Link/file segments are idempotent, so re-applying one is harmless
+                    self._apply_attachments(segment)
+                    continue
+                # Segments already folded into the snapshot are skipped
+                if segment["start"] < len(self.documents):
+                    continue
+                self._append_rows(segment["vectors"], segment["documents"])
+                replayed += len(segment["documents"])
+        size = os.path.getsize(wal_path)
+        if good_offset < size:
+            # New segments are appended to the end; behind damaged bytes the
+            # next replay would never reach them
+            print(f"⚠️ [VectorStore] Truncating {size - good_offset} damaged bytes from the WAL")
+            with open(wal_path, "r+b") as f:
+                f.truncate(good_offset)
+                os.fsync(f.fileno())
+        return replayed
+
+    def _apply_attachments(self, segment: Dict):
+        for row_id, session_id, document_id in segment.get("links", []):
+            if row_id < len(self.documents):
+                self._link_row(row_id, session_id, document_id)
+        self.documents.files.update(segment.get("files", {}))
 
     def load_index(self, path: str):
         try:
-            if os.path.exists(f"{path}.faiss") and os.path.exists(f"{path}.pkl"):
-                self.index = faiss.read_index(f"{path}.faiss")
-                with open(f"{path}.pkl", "rb") as f:
-                    self.documents = pickle.load(f)
-                return True
+            with self._lock:
+                loaded = False
+                snapshot = current_snapshot(path)
+                if snapshot is not None:
+                    self.index = self._configure_index(faiss.read_index(os.path.join(snapshot, "index.faiss")))
+                    self.documents = ChunkStore.open(os.path.join(snapshot, "chunks"))
+                    loaded = True
+                elif os.path.exists(f"{path}.faiss") and ChunkStore.exists(f"{path}.chunks"):
+                    # Snapshot from before versioned directories; replaced on the next compaction
+                    self.index = self._configure_index(faiss.read_index(f"{path}.faiss"))
+                    self.documents = ChunkStore.open(f"{path}.chunks")
+                    loaded = True
+                elif os.path.exists(f"{path}.faiss") and os.path.exists(f"{path}.pkl"):
+                    # Legacy pickled documents list; converted on the next snapshot
+                    print(f"ℹ️ [VectorStore] Loading legacy pickle, will migrate to chunk store on compaction")
+                    self.index = self._configure_index(faiss.read_index(f"{path}.faiss"))
+                    with open(f"{path}.pkl", "rb") as f:
+                        self.documents = ChunkStore.from_documents(pickle.load(f))
+                    loaded = True
+                if loaded:
+                    if self.index.ntotal != len(self.documents):
+                        print(f"⚠️ [VectorStore] Index has {self.index.ntotal} vectors but chunk store has {len(self.documents)} rows")
+                    self._rebuild_row_maps()
+                    # Built before the WAL replay, which extends it row by row
+                    self._build_sparse_index()
+                    self._flags = None
+                replayed = self._replay_wal(path)
+                if replayed:
+                    print(f"✅ [VectorStore] Replayed {replayed} rows from write-ahead log")
+                return loaded or replayed > 0
         except Exception as e:
             print(f"Error loading index: {e}")
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,123 @@
+"""
+Semantic Answer Cache for RAG chat
+Reuses answers to near-identical questions asked against the same documents and learning style
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of generated answers keyed by question embedding.
+
+    Entries live in scopes: a scope is the retrieval filter (which chunks the
+    question could see) plus the learning-style bucket, so an answer is only
+    reused for a question asked against the same material and delivered in
+    the same style. Within a scope, a question hits when its cosine
+    similarity to a cached question reaches the threshold. Entries expire
+    after ttl_seconds and the least recently used are evicted past
+    max_entries.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._scopes: Dict[Hashable, List[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _drop(self, entry_id: str):
+        entry = self._entries.pop(entry_id)
+        ids = self._scopes.get(entry["scope"], [])
+        ids.remove(entry_id)
+        if not ids:
+            self._scopes.pop(entry["scope"], None)
+
+    def lookup(self, scope: Hashable, query_vector) -> Optional[Dict]:
+        """Cached payload for the closest question in scope, or None"""
+        query = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            ids = list(self._scopes.get(scope, []))
+            for entry_id in ids:
+                if now - self._entries[entry_id]["created_at"] > self.ttl_seconds:
+                    self._drop(entry_id)
+                    self.evictions += 1
+            ids = self._scopes.get(scope, [])
+            if ids:
+                vectors = np.stack([self._entries[entry_id]["vector"] for entry_id in ids])
+                scores = vectors @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return {**self._entries[entry_id]["payload"], "cache_similarity": float(scores[best])}
+            self.misses += 1
+            return None
+
+    def store(self, scope: Hashable, query_vector, payload: Dict, document_ids: Optional[List[str]] = None):
+        with self._lock:
+            entry_id = uuid.uuid4().hex
+            self._entries[entry_id] = {
+                "scope": scope,
+                "vector": self._normalize(query_vector),
+                "payload": payload,
+                "document_ids": set(document_ids or []),
+                "created_at": time.time(),
+            }
+            self._scopes.setdefault(scope, []).append(entry_id)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_documents(self, document_ids: List[str]) -> int:
+        """Drop every answer that drew on any of these documents"""
+        targets = set(document_ids)
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry["document_ids"] & targets]
+            for entry_id in stale:
+                self._drop(entry_id)
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "scopes": len(self._scopes),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,76 @@
+"""
+Check that importing services/tools_manager.py stays within its cold-start budget
+
+Each run imports the module in a fresh interpreter (after config, which every
+service loads anyway), so only the tools module's own cost is measured. The
+check fails if the median exceeds the budget, or if the import pulls in a
+tool library that should only load on first use.
+
+Usage:
+    python benchmark_tools_import.py                    # 5 runs, 300 ms budget
+    python benchmark_tools_import.py --runs 10 --budget-ms 150
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Libraries the tools load lazily; none of them may be imported with the module
+HEAVY_MODULES = [
+    "langchain_community", "playwright", "matplotlib", "arxiv", "googleapiclient",
+    "wikipedia", "scholarly", "github", "aiohttp",
+]
+
+PROBE = """
+import json, sys, time
+import config
+start = time.perf_counter()
+import services.tools_manager
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"import_ms": elapsed * 1000, "heavy_modules": heavy}}))
+"""
+
+
+def measure() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the tools manager import time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh-interpreter imports to time")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="Maximum median import time")
+    args = parser.parse_args()
+
+    samples = [measure() for _ in range(args.runs)]
+    timings = [sample["import_ms"] for sample in samples]
+    heavy = sorted({name for sample in samples for name in sample["heavy_modules"]})
+    report = {
+        "runs": args.runs,
+        "median_ms": round(statistics.median(timings), 1),
+        "max_ms": round(max(timings), 1),
+        "budget_ms": args.budget_ms,
+        "heavy_modules": heavy,
+    }
+    print(json.dumps(report, indent=2))
+
+    if heavy:
+        print(f"❌ Importing the tools manager loaded: {', '.join(heavy)}")
+        return 1
+    if report["median_ms"] > args.budget_ms:
+        print(f"❌ Tools manager import took {report['median_ms']} ms (budget {args.budget_ms} ms)")
+        return 1
+    print("✅ Tools manager import is within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
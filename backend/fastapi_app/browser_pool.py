@@ -0,0 +1,151 @@
+"""
+Browser Pool for the Playwright tool
+Keeps one Chromium warm and gives every fetch a fresh browser context
+"""
+
+import asyncio
+import time
+from typing import Dict, List
+
+
+# Resource types skipped when fetching pages; the agent only reads the text
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+# Runs in the page: drop non-content elements and return the readable text
+# of the main content area (or the whole body when there is none)
+READABLE_TEXT_SCRIPT = """
+() => {
+    const root = document.querySelector("main, article, [role=main]") || document.body;
+    if (!root) return "";
+    const clone = root.cloneNode(true);
+    clone.querySelectorAll(
+        "script, style, noscript, template, svg, iframe, nav, header, footer, aside, form, [aria-hidden=true]"
+    ).forEach((element) => element.remove());
+    return clone.innerText || clone.textContent || "";
+}
+"""
+
+
+def clean_text(text: str) -> str:
+    """Collapse whitespace while keeping paragraph breaks"""
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    paragraphs: List[str] = []
+    for line in lines:
+        if line:
+            paragraphs.append(line)
+        elif paragraphs and paragraphs[-1]:
+            paragraphs.append("")
+    return "\n".join(paragraphs).strip()
+
+
+class BrowserPool:
+    """
+    One Chromium process shared by every fetch, started on first use.
+
+    Each fetch gets a new browser context, closed when the fetch ends, so no
+    cookies, storage, cache or service workers pass from one student's fetch
+    to the next. Creating a context is cheap next to launching the browser,
+    which is what stays warm. At most max_contexts fetches run at once and
+    the rest wait. If the browser goes away it is relaunched on the next fetch.
+    """
+
+    def __init__(self, max_contexts: int = 4, block_resources: bool = True):
+        self.max_contexts = max_contexts
+        self.block_resources = block_resources
+        self._playwright = None
+        self._browser = None
+        self._start_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max_contexts)
+        self.launches = 0
+        self.contexts_created = 0
+        self.fetches = 0
+        self.failures = 0
+
+    async def _ensure_browser(self):
+        async with self._start_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+            from playwright.async_api import async_playwright
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.launch()
+            self.launches += 1
+            print("🌐 [BrowserPool] Chromium launched")
+            return self._browser
+
+    async def _block_resources(self, route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _new_context(self):
+        browser = await self._ensure_browser()
+        context = await browser.new_context()
+        if self.block_resources:
+            await context.route("**/*", self._block_resources)
+        self.contexts_created += 1
+        return context
+
+    @staticmethod
+    async def _close_context(context):
+        try:
+            await context.close()
+        except Exception:
+            pass
+
+    async def fetch(self, url: str, fast: bool = True, timeout: float = 15.0, max_chars: int = 2000) -> Dict:
+        """
+        Load a page and return its readable text.
+
+        fast=True waits for DOMContentLoaded only; fast=False waits for the
+        load event, for pages that render their content with scripts.
+        """
+        async with self._semaphore:
+            context = await self._new_context()
+            started = time.monotonic()
+            self.fetches += 1
+            try:
+                page = await context.new_page()
+                response = await page.goto(
+                    url, wait_until="domcontentloaded" if fast else "load", timeout=timeout * 1000
+                )
+                title = await page.title()
+                text = clean_text(await page.evaluate(READABLE_TEXT_SCRIPT))
+                return {
+                    "url": page.url,
+                    "title": title,
+                    "status": response.status if response is not None else None,
+                    "content": text[:max_chars],
+                    "full_content_length": len(text),
+                    "load_seconds": round(time.monotonic() - started, 2),
+                }
+            except Exception:
+                self.failures += 1
+                raise
+            finally:
+                # Closing the context closes its pages and discards everything they stored
+                await self._close_context(context)
+
+    async def close(self):
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def stats(self) -> Dict:
+        return {
+            "browser_running": self._browser is not None and self._browser.is_connected(),
+            "max_contexts": self.max_contexts,
+            "launches": self.launches,
+            "contexts_created": self.contexts_created,
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "block_resources": self.block_resources,
+        }
@@ -0,0 +1,482 @@
+"""
+Chunk Store for the adaptive vector store
+Columnar, memory-mapped storage for chunk text and metadata, addressed by FAISS row id
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+# Bit positions of the content-type flags produced by
+# AdaptiveFAISSVectorStore._analyze_content_type
+CONTENT_TYPE_FLAGS = (
+    'has_examples',
+    'has_theory',
+    'has_steps',
+    'has_overview',
+    'is_detailed',
+    'is_concise',
+)
+
+# Metadata keys stored as typed columns rather than in the JSON blob
+_COLUMN_KEYS = ('session_id', 'document_id', 'content_type')
+
+
+def encode_content_type(content_type: Dict) -> int:
+    """Pack a content_type dict into a bitmask"""
+    flags = 0
+    for bit, name in enumerate(CONTENT_TYPE_FLAGS):
+        if content_type.get(name):
+            flags |= 1 << bit
+    return flags
+
+
+def decode_content_type(flags: int) -> Dict:
+    """Unpack a bitmask into a content_type dict"""
+    return {name: bool(flags & (1 << bit)) for bit, name in enumerate(CONTENT_TYPE_FLAGS)}
+
+
+def _fsync_tree(directory: str):
+    """Flush every file under a directory, and the directories themselves, to disk"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), "rb") as f:
+                os.fsync(f.fileno())
+        _fsync_directory(root)
+
+
+def _fsync_directory(directory: str):
+    # Directory fsync makes renames durable; Windows cannot open directories
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _snapshot_root(path: str) -> str:
+    return f"{path}.snapshots"
+
+
+def _pointer_path(path: str) -> str:
+    return f"{path}.current"
+
+
+def current_snapshot(path: str) -> Optional[str]:
+    """Directory of the published snapshot for a vectorstore path prefix, or None"""
+    try:
+        with open(_pointer_path(path), "r") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    directory = os.path.join(_snapshot_root(path), version)
+    return directory if version and os.path.isdir(directory) else None
+
+
+def new_snapshot(path: str) -> str:
+    """Create an empty directory for the next snapshot version"""
+    root = _snapshot_root(path)
+    os.makedirs(root, exist_ok=True)
+    versions = [int(name[1:]) for name in os.listdir(root) if name.startswith("v") and name[1:].isdigit()]
+    directory = os.path.join(root, f"v{max(versions, default=0) + 1:06d}")
+    os.makedirs(directory)
+    return directory
+
+
+def publish_snapshot(path: str, directory: str):
+    """
+    Make a fully written snapshot directory the current one. The pointer
+    file is replaced with a single rename, so a crash leaves either the old
+    or the new snapshot published, never a mix of the two.
+    """
+    _fsync_tree(directory)
+    pointer = _pointer_path(path)
+    with open(f"{pointer}.tmp", "w") as f:
+        f.write(os.path.basename(directory))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{pointer}.tmp", pointer)
+    _fsync_directory(os.path.dirname(os.path.abspath(pointer)))
+
+
+def prune_snapshots(path: str):
+    """Delete snapshot versions other than the published one, and pre-versioning snapshot files"""
+    current = current_snapshot(path)
+    if current is None:
+        return
+    root = _snapshot_root(path)
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        if directory != current:
+            # Readers holding mmaps of the old files keep them alive until they finish
+            shutil.rmtree(directory, ignore_errors=True)
+    shutil.rmtree(f"{path}.chunks", ignore_errors=True)
+    # The legacy index pairs with either .chunks or the older pickled documents
+    for legacy in (f"{path}.faiss", f"{path}.pkl"):
+        if os.path.exists(legacy):
+            os.remove(legacy)
+
+
+def chunk_digest(text: str) -> int:
+    """64-bit content hash of a chunk; callers confirm hits against the stored text"""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _MappedChunks:
+    """Read-only view over one on-disk chunk store directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.text_offsets = np.load(os.path.join(directory, "text_offsets.npy"), mmap_mode="r")
+        self.meta_offsets = np.load(os.path.join(directory, "meta_offsets.npy"), mmap_mode="r")
+        self.session_codes = np.load(os.path.join(directory, "session.npy"), mmap_mode="r")
+        self.document_codes = np.load(os.path.join(directory, "document.npy"), mmap_mode="r")
+        self.flags = np.load(os.path.join(directory, "flags.npy"), mmap_mode="r")
+        # Snapshots written before deduplication have no digest column or links
+        digests_path = os.path.join(directory, "digests.npy")
+        self.digests = np.load(digests_path, mmap_mode="r") if os.path.exists(digests_path) else None
+        # Digests in ascending order with the row holding each, for binary-search lookups
+        self.sorted_digests = None
+        self.digest_rows = None
+        if os.path.exists(os.path.join(directory, "digest_rows.npy")):
+            self.sorted_digests = np.load(os.path.join(directory, "sorted_digests.npy"), mmap_mode="r")
+            self.digest_rows = np.load(os.path.join(directory, "digest_rows.npy"), mmap_mode="r")
+        self.links: List[List] = []
+        self.files: Dict[str, List[int]] = {}
+        links_path = os.path.join(directory, "links.json")
+        if os.path.exists(links_path):
+            with open(links_path, "r") as f:
+                attachments = json.load(f)
+            self.links = attachments.get("links", [])
+            self.files = attachments.get("files", {})
+        with open(os.path.join(directory, "vocab.json"), "r") as f:
+            vocab = json.load(f)
+        self.sessions: List[str] = vocab["session_id"]
+        self.documents: List[str] = vocab["document_id"]
+        self.text = self._map(os.path.join(directory, "text.bin"))
+        self.meta = self._map(os.path.join(directory, "meta.bin"))
+
+    @staticmethod
+    def _map(file_path: str):
+        # mmap cannot map empty files; an empty bytes object behaves the same for slicing
+        if os.path.getsize(file_path) == 0:
+            return b""
+        with open(file_path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.flags)
+
+    def raw_text(self, row: int) -> bytes:
+        return self.text[int(self.text_offsets[row]):int(self.text_offsets[row + 1])]
+
+    def raw_meta(self, row: int) -> bytes:
+        return self.meta[int(self.meta_offsets[row]):int(self.meta_offsets[row + 1])]
+
+    def all_digests(self) -> np.ndarray:
+        if self.digests is not None:
+            return np.asarray(self.digests)
+        return np.fromiter(
+            (chunk_digest(self.raw_text(row).decode("utf-8")) for row in range(len(self))),
+            dtype=np.uint64, count=len(self)
+        )
+
+    def digest_index(self):
+        """(sorted digests, row of each); built in memory once for snapshots that predate the columns"""
+        if self.digest_rows is None:
+            digests = self.all_digests()
+            self.digest_rows = np.argsort(digests, kind="stable")
+            self.sorted_digests = digests[self.digest_rows]
+        return self.sorted_digests, self.digest_rows
+
+    def session_id(self, row: int) -> Optional[str]:
+        code = int(self.session_codes[row])
+        return self.sessions[code] if code >= 0 else None
+
+    def document_id(self, row: int) -> Optional[str]:
+        code = int(self.document_codes[row])
+        return self.documents[code] if code >= 0 else None
+
+    def get(self, row: int) -> Dict:
+        metadata = json.loads(self.raw_meta(row) or b"{}")
+        session_id = self.session_id(row)
+        if session_id is not None:
+            metadata['session_id'] = session_id
+        document_id = self.document_id(row)
+        if document_id is not None:
+            metadata['document_id'] = document_id
+        metadata['content_type'] = decode_content_type(int(self.flags[row]))
+        return {"content": self.raw_text(row).decode("utf-8"), "metadata": metadata}
+
+
+class ChunkStore:
+    """
+    List-like store of {"content", "metadata"} chunks.
+
+    Rows from the last snapshot are read lazily from memory-mapped files, so
+    resident memory and cold start do not scale with corpus size, and all
+    workers share the same page cache. Rows appended since then live in an
+    in-memory tail until the next save().
+
+    Each chunk is stored once. When the same chunk (or a whole file) is
+    uploaded again, the new session_id / document_id pair is recorded as a
+    link to the existing row instead of a new row.
+    """
+
+    def __init__(self):
+        # (mapped snapshot or None, in-memory tail); swapped as one object so
+        # readers never see a new snapshot paired with a stale tail
+        self._state = (None, [])
+        # [row, session_id, document_id] attachments beyond each row's own metadata
+        self.links: List[List] = []
+        self._link_keys = set()
+        self._row_links: Dict[int, List[List]] = {}
+        # File content hash -> rows holding that file's chunks
+        self.files: Dict[str, List[int]] = {}
+        # Chunk digest -> rows of the in-memory tail with that digest; snapshot
+        # rows are found by binary search over the snapshot's sorted digest column
+        self._tail_digests: Dict[int, List[int]] = {}
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "vocab.json"))
+
+    @classmethod
+    def open(cls, directory: str) -> "ChunkStore":
+        store = cls()
+        base = _MappedChunks(directory)
+        store._state = (base, [])
+        for row, session_id, document_id in base.links:
+            store._add_link(row, session_id, document_id)
+        store.files = dict(base.files)
+        return store
+
+    @classmethod
+    def from_documents(cls, documents: List[Dict]) -> "ChunkStore":
+        """Wrap a legacy in-memory documents list (e.g. from an old pickle)"""
+        store = cls()
+        for doc in documents:
+            store.append(doc)
+        return store
+
+    def __len__(self) -> int:
+        base, tail = self._state
+        return (len(base) if base is not None else 0) + len(tail)
+
+    def __getitem__(self, row: int) -> Dict:
+        base, tail = self._state
+        base_len = len(base) if base is not None else 0
+        total = base_len + len(tail)
+        row = int(row)
+        if row < 0:
+            row += total
+        if row < 0 or row >= total:
+            raise IndexError("chunk row out of range")
+        if row < base_len:
+            return base.get(row)
+        return tail[row - base_len]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def texts(self) -> Iterator[str]:
+        """Chunk text in row order, without decoding metadata"""
+        base, tail = self._state
+        if base is not None:
+            for row in range(len(base)):
+                yield base.raw_text(row).decode("utf-8")
+        for doc in tail:
+            yield doc["content"]
+
+    def append(self, doc: Dict):
+        self._state[1].append(doc)
+        self._tail_digests.setdefault(chunk_digest(doc["content"]), []).append(len(self) - 1)
+
+    def _digests(self) -> np.ndarray:
+        base, tail = self._state
+        tail_digests = np.fromiter((chunk_digest(doc["content"]) for doc in tail), dtype=np.uint64, count=len(tail))
+        if base is None:
+            return tail_digests
+        return np.concatenate([base.all_digests(), tail_digests])
+
+    def find(self, text: str) -> Optional[int]:
+        """Row id of a stored chunk with exactly this text, or None"""
+        digest = chunk_digest(text)
+        base, tail = self._state
+        if base is not None and len(base):
+            sorted_digests, rows = base.digest_index()
+            encoded = text.encode("utf-8")
+            # Equal digests are adjacent, lowest row first
+            position = int(np.searchsorted(sorted_digests, np.uint64(digest)))
+            while position < len(rows) and int(sorted_digests[position]) == digest:
+                row = int(rows[position])
+                if base.raw_text(row) == encoded:
+                    return row
+                position += 1
+        for row in self._tail_digests.get(digest, []):
+            if self[row]["content"] == text:
+                return row
+        return None
+
+    def _add_link(self, row: int, session_id: Optional[str], document_id: Optional[str]) -> bool:
+        key = (int(row), session_id, document_id)
+        if key in self._link_keys:
+            return False
+        self._link_keys.add(key)
+        link = [int(row), session_id, document_id]
+        self.links.append(link)
+        self._row_links.setdefault(int(row), []).append(link)
+        return True
+
+    def link(self, row: int, session_id: Optional[str], document_id: Optional[str]) -> bool:
+        """
+        Attach a session_id / document_id pair to an existing row.
+        Returns False if the row already carries that pair.
+        """
+        metadata = self[row].get("metadata", {})
+        if metadata.get("session_id") == session_id and metadata.get("document_id") == document_id:
+            return False
+        return self._add_link(row, session_id, document_id)
+
+    def row_links(self, row: int) -> List[List]:
+        return self._row_links.get(int(row), [])
+
+    def content_flags(self) -> np.ndarray:
+        """Packed content-type bitmask for every row, aligned with FAISS row ids"""
+        base, tail = self._state
+        tail_flags = np.fromiter(
+            (encode_content_type(doc.get("metadata", {}).get("content_type", {})) for doc in tail),
+            dtype=np.uint8, count=len(tail)
+        )
+        if base is None:
+            return tail_flags
+        return np.concatenate([np.asarray(base.flags), tail_flags])
+
+    def group_rows(self, key: str) -> Dict[str, List[int]]:
+        """Map each distinct session_id / document_id value to its row ids"""
+        base, tail = self._state
+        groups: Dict[str, List[int]] = {}
+        base_len = 0
+        if base is not None:
+            base_len = len(base)
+            codes = np.asarray(base.session_codes if key == 'session_id' else base.document_codes)
+            vocab = base.sessions if key == 'session_id' else base.documents
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+            for rows in np.split(order, boundaries):
+                if len(rows) and codes[rows[0]] >= 0:
+                    groups[vocab[int(codes[rows[0]])]] = rows.tolist()
+        for offset, doc in enumerate(tail):
+            value = doc.get("metadata", {}).get(key)
+            if value:
+                groups.setdefault(value, []).append(base_len + offset)
+        position = 1 if key == 'session_id' else 2
+        for link in self.links:
+            if link[position]:
+                groups.setdefault(link[position], []).append(link[0])
+        return groups
+
+    def save(self, directory: str, rows: Optional[int] = None):
+        """
+        Write the first rows rows (default: all) to a new directory. The
+        directory must not be in use; publishing it (publish_snapshot) and
+        switching to it (adopt) are up to the caller.
+
+        Rows are only ever appended, so this can run while another thread
+        appends or links rows; anything beyond rows is left to the WAL.
+        """
+        base, tail = self._state
+        os.makedirs(directory)
+
+        total = len(self) if rows is None else rows
+        links = [link for link in list(self.links) if link[0] < total]
+        files = {
+            file_hash: file_rows for file_hash, file_rows in list(self.files.items())
+            if all(row < total for row in file_rows)
+        }
+        text_offsets = np.zeros(total + 1, dtype=np.int64)
+        meta_offsets = np.zeros(total + 1, dtype=np.int64)
+        session_codes = np.full(total, -1, dtype=np.int32)
+        document_codes = np.full(total, -1, dtype=np.int32)
+        flags = np.zeros(total, dtype=np.uint8)
+        digests = self._digests()[:total]
+        vocab = {"session_id": [], "document_id": []}
+        lookup = {"session_id": {}, "document_id": {}}
+
+        def code_for(key, value):
+            if not value:
+                return -1
+            codes = lookup[key]
+            if value not in codes:
+                codes[value] = len(vocab[key])
+                vocab[key].append(value)
+            return codes[value]
+
+        base_len = len(base) if base is not None else 0
+        with open(os.path.join(directory, "text.bin"), "wb") as text_f, \
+                open(os.path.join(directory, "meta.bin"), "wb") as meta_f:
+            text_pos = meta_pos = 0
+            for row in range(total):
+                if row < base_len:
+                    text_bytes = base.raw_text(row)
+                    meta_bytes = base.raw_meta(row)
+                    session_id = base.session_id(row)
+                    document_id = base.document_id(row)
+                    flags[row] = base.flags[row]
+                else:
+                    doc = tail[row - base_len]
+                    metadata = doc.get("metadata", {})
+                    text_bytes = doc["content"].encode("utf-8")
+                    extra = {k: v for k, v in metadata.items() if k not in _COLUMN_KEYS}
+                    meta_bytes = json.dumps(extra, default=str).encode("utf-8") if extra else b""
+                    session_id = metadata.get("session_id")
+                    document_id = metadata.get("document_id")
+                    flags[row] = encode_content_type(metadata.get("content_type", {}))
+                session_codes[row] = code_for("session_id", session_id)
+                document_codes[row] = code_for("document_id", document_id)
+                text_f.write(text_bytes)
+                meta_f.write(meta_bytes)
+                text_pos += len(text_bytes)
+                meta_pos += len(meta_bytes)
+                text_offsets[row + 1] = text_pos
+                meta_offsets[row + 1] = meta_pos
+
+        np.save(os.path.join(directory, "text_offsets.npy"), text_offsets)
+        np.save(os.path.join(directory, "meta_offsets.npy"), meta_offsets)
+        np.save(os.path.join(directory, "session.npy"), session_codes)
+        np.save(os.path.join(directory, "document.npy"), document_codes)
+        np.save(os.path.join(directory, "flags.npy"), flags)
+        np.save(os.path.join(directory, "digests.npy"), digests)
+        digest_rows = np.argsort(digests, kind="stable")
+        np.save(os.path.join(directory, "sorted_digests.npy"), digests[digest_rows])
+        np.save(os.path.join(directory, "digest_rows.npy"), digest_rows)
+        with open(os.path.join(directory, "links.json"), "w") as f:
+            json.dump({"links": links, "files": files}, f)
+        # vocab.json is written last; its presence marks a complete chunk store
+        with open(os.path.join(directory, "vocab.json"), "w") as f:
+            json.dump(vocab, f)
+
+    def adopt(self, directory: str):
+        """
+        Switch to a chunk store written by save(), keeping the rows appended
+        after it in the tail. Links and files stay in memory as they are.
+        """
+        snapshot = _MappedChunks(directory)
+        base, tail = self._state
+        base_len = len(base) if base is not None else 0
+        remaining = tail[len(snapshot) - base_len:]
+        self._state = (snapshot, remaining)
+        self._tail_digests = {}
+        for offset, doc in enumerate(remaining):
+            self._tail_digests.setdefault(chunk_digest(doc["content"]), []).append(len(snapshot) + offset)
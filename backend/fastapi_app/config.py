@@ -10,13 +10,87 @@ class Settings(BaseSettings):
     LLM_MODEL: str = "qwen3-vl:2b"  # Qwen3 Vision-Language model via Ollama
     LLM_BACKEND: str = "gemini"  # "ollama", "huggingface", "openrouter", or "gemini"
     EMBEDDING_MODEL: str = "sentence-transformers/all-mpnet-base-v2"
+    EMBEDDING_CACHE_SIZE: int = 2048  # Query embeddings kept in the in-process LRU
+    EMBEDDING_CACHE_PATH: str | None = None  # Optional SQLite file for a persistent cache tier
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    INGESTION_WORKERS: int = 2  # PDF parser processes (0 parses on the thread pool)
+    INGESTION_PAGES_PER_TASK: int = 16  # Pages handed to each parser task
+    EMBEDDING_BATCH_SIZE: int = 64  # Chunks embedded and indexed per batch
+    DOCUMENT_JOB_WORKERS: int = 1  # Concurrent document-processing jobs
+    DOCUMENT_JOB_RETENTION: int = 500  # Finished jobs kept for status polling
+    DOCUMENT_JOB_CALLBACK_ATTEMPTS: int = 5  # Tries to report a finished job to its callback URL
+    DOCUMENT_JOB_CALLBACK_TIMEOUT: float = 10.0  # Seconds per callback request
     TOP_K: int = 5
+    CONTEXT_TOKEN_BUDGET: int = 8000  # Prompt tokens per chat turn (system prompt, summary, history, question)
+    CONTEXT_RETRIEVAL_BUDGET: int = 3000  # Share of the budget reserved for retrieved document context
+    CONTEXT_RECENT_TURNS: int = 4  # Latest user/assistant exchanges replayed verbatim
+    CONTEXT_SUMMARY_BATCH_TURNS: int = 4  # Older exchanges folded into the rolling summary at a time
+    CONTEXT_SUMMARY_MAX_TOKENS: int = 400  # Length cap for the rolling summary
+    HYBRID_SEARCH_ENABLED: bool = True  # Fuse BM25 keyword hits with dense results (reciprocal-rank fusion)
+    HYBRID_RRF_K: int = 60  # RRF rank constant; larger values flatten the rank weighting
+    HYBRID_CANDIDATE_FACTOR: int = 3  # Candidates per leg as a multiple of k (dense-only search uses 5)
+    RAG_CONFIDENCE_THRESHOLD: float = 0.3  # Below this retrieval score, chat is routed to the agent
+    ANSWER_CACHE_ENABLED: bool = True  # Reuse answers to near-identical questions
+    ANSWER_CACHE_THRESHOLD: float = 0.95  # Cosine similarity needed for a cached answer to be reused
+    ANSWER_CACHE_SIZE: int = 1024  # Cached answers kept (LRU)
+    ANSWER_CACHE_TTL: int = 3600  # Seconds before a cached answer expires
+    SESSION_STORE_MAX_ENTRIES: int = 1000  # Sessions kept in memory per state store (LRU beyond this)
+    SESSION_STORE_IDLE_TTL: int = 3600  # Seconds without access before a session is evicted from memory
+    SESSION_STORE_PATH: str | None = "data/session_state.sqlite3"  # SQLite spill tier (None drops evicted sessions)
+    LEARNING_PROFILES_PATH: str = "data/learning_profiles.sqlite3"  # Learning profiles, upserted one row per profile
+    PROFILE_HISTORY_LIMIT: int = 10  # Interactions kept per learning profile (ring buffer)
+    PROFILE_SAVE_DELAY: float = 2.0  # Seconds profile writes are coalesced before one batched upsert
+    SESSION_STORE_FLUSH_INTERVAL: float = 30.0  # Seconds between writing changed sessions to disk and evicting idle ones
+    VECTORSTORE_PATH: str = "data/vectorstore"
+    VECTORSTORE_COMPACT_SEGMENTS: int = 20  # Fold the vectorstore WAL into a snapshot after this many uploads
+    VECTORSTORE_INDEX_TYPE: str = "flat"  # "flat", "ivf_flat", "hnsw", or "ivf_pq"
+    VECTORSTORE_IVF_NLIST: int = 256  # IVF centroids (training needs 39x this many chunks)
+    VECTORSTORE_IVF_NPROBE: int = 16  # IVF lists scanned per query
+    VECTORSTORE_HNSW_M: int = 32  # HNSW graph neighbours per node
+    VECTORSTORE_HNSW_EF_SEARCH: int = 64  # HNSW search breadth
+    VECTORSTORE_PQ_M: int = 48  # PQ sub-quantizers (must divide the 768-d embedding)
     MAX_TOKENS: int = 2048  # Maximum tokens for LLM response (DeepSeek can handle more)
+    LLM_HTTP_MAX_CONNECTIONS: int = 200  # Shared async HTTP pool for OpenRouter / Gemini
+    LLM_HTTP_MAX_KEEPALIVE: int = 50  # Idle connections kept open for reuse
+    OPENROUTER_MAX_CONCURRENCY: int = 100  # In-flight async OpenRouter generations
+    GEMINI_MAX_CONCURRENCY: int = 100  # In-flight async Gemini generations
     HUGGINGFACE_TOKEN: str | None = None  # Optional, for HuggingFace authentication if needed
     DEBUG: bool = True  # Optional, for debugging
     FASTAPI_URL: str = "http://localhost:8001"  # For Django-FastAPI communication
+    DJANGO_BACKEND_URL: str = "http://127.0.0.1:8000"  # For FastAPI -> Django profile sync
+    PROFILE_SYNC_TTL: int = 600  # Seconds a user's ILS dimensions from Django are reused
+    PROFILE_SYNC_NEGATIVE_TTL: int = 300  # Seconds a "no ILS data" answer (or failed sync) is reused
+    PROFILE_SYNC_TIMEOUT: float = 3.0  # Django profile fetch timeout on the chat path
+    AGENT_TOOL_TIMEOUT: float = 45.0  # Backstop on one agent tool call (per-tool deadlines are TOOL_TIMEOUT*)
+    AGENT_MAX_PARALLEL_ACTIONS: int = 4  # Tool calls the reasoning agent runs concurrently in one step
+    TOOL_CACHE_ENABLED: bool = True  # Reuse agent tool results for repeated identical calls
+    TOOL_CACHE_TTLS: str = ""  # Per-tool TTL overrides, e.g. "searchapi=300,wikipedia=0" (0 disables caching)
+    TOOL_CACHE_SIZE: int = 1024  # Tool results kept in memory (LRU)
+    TOOL_CACHE_PATH: str | None = None  # Optional SQLite file for a persistent / pre-seeded tier
+    TOOL_CACHE_OFFLINE: bool = False  # Serve tools from the cache only (for offline tests)
+    TOOL_TIMEOUT: float = 10.0  # Default seconds an agent tool call may take (queueing included)
+    TOOL_TIMEOUTS: str = ""  # Per-tool overrides, e.g. "playwright=20,arxiv=8"
+    TOOL_MAX_CONCURRENCY: int = 4  # Default calls one tool may have in flight at once
+    TOOL_CONCURRENCY: str = ""  # Per-tool overrides, e.g. "playwright=1"
+    TOOL_BREAKER_WINDOW: int = 10  # Recent calls a tool's circuit breaker looks at
+    TOOL_BREAKER_MIN_CALLS: int = 5  # Calls recorded before the breaker may open
+    TOOL_BREAKER_FAILURE_RATE: float = 0.5  # Failure rate over the window that opens the breaker
+    TOOL_BREAKER_COOLDOWN: float = 60.0  # Seconds a tool stays disabled before a trial call
+    WEB_SEARCH_PROVIDERS: str = "searchapi,google_serper,tavily_search,brave_search,duckduckgo,wikipedia"  # web_search preference order
+    WEB_SEARCH_HEDGE_DELAY: float = 1.5  # Seconds web_search waits on a provider before also asking the next one
+    WEB_SEARCH_DEADLINE: float = 8.0  # Seconds web_search collects results before returning what it has
+    WEB_SEARCH_FANOUT: int = 3  # Providers queried at once in web_search "merge" mode
+    BROWSER_POOL_SIZE: int = 4  # Pages the Playwright tool loads at once, each in a fresh browser context
+    BROWSER_BLOCK_RESOURCES: bool = True  # Skip images, fonts and media when fetching pages
+    BROWSER_PAGE_TIMEOUT: float = 12.0  # Seconds a page may take to load
+    BROWSER_MAX_TEXT_CHARS: int = 2000  # Readable text returned per page
+    PLOT_WORKERS: int = 2  # Pre-warmed worker processes rendering Matplotlib tool plots
+    PLOT_TIME_LIMIT: int = 20  # Wall-clock seconds one plot may take
+    PLOT_CPU_LIMIT: int = 20  # CPU seconds one plot may use
+    PLOT_MEMORY_MB: int = 1024  # Address-space limit per plotting worker (0 disables)
+    PLOT_DPI: int = 100  # Resolution of rendered plots
+    PLOT_CACHE_SIZE: int = 128  # Rendered plots kept by code hash (LRU)
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:8001,http://127.0.0.1:3000,http://127.0.0.1:8001"
     
     # ==================== API KEYS FOR TOOLS ====================
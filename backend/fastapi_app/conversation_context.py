@@ -0,0 +1,226 @@
+"""
+Conversation Context for RAG chat
+Fits chat history into a per-request token budget, folding older turns into a rolling summary
+"""
+
+import asyncio
+import math
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from config import settings
+
+
+# Approximate characters per token for backends without a local tokenizer
+CHARS_PER_TOKEN = {
+    "gemini": 4.0,
+    "openrouter": 3.5,
+    "ollama": 3.5,
+    "huggingface": 3.5,
+}
+
+# Role markers and separators each chat message adds to the prompt
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a tutoring conversation between a student and a tutor. "
+    "Merge the new exchanges into the existing summary. Keep the topics covered, the student's questions, "
+    "any misunderstandings, and anything the tutor said it would follow up on. "
+    "Reply with the updated summary only."
+)
+
+
+class TokenCounter:
+    """Counts prompt tokens for the configured LLM backend"""
+
+    def __init__(self, backend: str, tokenizer=None):
+        self.backend = backend
+        # The HuggingFace backend has its tokenizer loaded, so counts are exact there
+        self.tokenizer = tokenizer
+        self.chars_per_token = CHARS_PER_TOKEN.get(backend, 4.0)
+
+    def count(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_message(self, text: Optional[str]) -> int:
+        return self.count(text) + MESSAGE_OVERHEAD
+
+    def truncate(self, text: str, budget: int) -> str:
+        """Longest prefix of text that fits in budget tokens"""
+        if self.count(text) <= budget:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+
+class ConversationContextManager:
+    """
+    Builds the LLM message list for a chat turn within a token budget.
+
+    The retrieved context is capped at its reserved share of the budget. The
+    latest recent_turns exchanges are replayed verbatim; older exchanges are
+    folded, a batch at a time, into a per-session summary by a background LLM
+    call after the turn is answered. Older exchanges not yet folded are
+    replayed while they still fit, newest first.
+    """
+
+    def __init__(
+        self,
+        llm,
+        counter: TokenCounter,
+        budget: int = None,
+        retrieval_budget: int = None,
+        recent_turns: int = None,
+        summary_batch_turns: int = None,
+        summary_max_tokens: int = None,
+        summaries: Optional[MutableMapping] = None
+    ):
+        self.llm = llm
+        self.counter = counter
+        self.budget = budget or settings.CONTEXT_TOKEN_BUDGET
+        self.retrieval_budget = retrieval_budget or settings.CONTEXT_RETRIEVAL_BUDGET
+        self.recent_turns = recent_turns or settings.CONTEXT_RECENT_TURNS
+        self.summary_batch_turns = summary_batch_turns or settings.CONTEXT_SUMMARY_BATCH_TURNS
+        self.summary_max_tokens = summary_max_tokens or settings.CONTEXT_SUMMARY_MAX_TOKENS
+        # session_id -> {"summary": str, "folded": number of history messages it covers};
+        # a SessionStateStore keeps it bounded and spills it with the chat history
+        self._summaries: MutableMapping = summaries if summaries is not None else {}
+        self._folding: Dict[str, asyncio.Task] = {}
+        self.folds = 0
+        self.fold_failures = 0
+
+    def fit_context(self, context: str) -> str:
+        """Cap retrieved context at its reserved budget (chunks are in priority order)"""
+        fitted = self.counter.truncate(context, self.retrieval_budget)
+        if len(fitted) < len(context):
+            print(f"✂️ [Context] Retrieved context trimmed to {self.retrieval_budget} tokens")
+        return fitted
+
+    def build_messages(
+        self,
+        session_id: str,
+        history_messages: List,
+        system_content: Optional[str],
+        message: str,
+        context: str = ""
+    ) -> Tuple[List, Dict]:
+        """Return (lc_messages, token usage) for one turn"""
+        state = self._summaries.get(session_id, {"summary": "", "folded": 0})
+        folded = min(state["folded"], len(history_messages))
+        summary = state["summary"] if folded else ""
+
+        system_tokens = self.counter.count_message(system_content) if system_content else 0
+        message_tokens = self.counter.count_message(message)
+        summary_content = f"Summary of the earlier conversation:\n{summary}" if summary else ""
+        summary_tokens = self.counter.count_message(summary_content) if summary else 0
+        available = self.budget - system_tokens - message_tokens - summary_tokens
+
+        kept = []
+        history_tokens = 0
+        for msg in reversed(history_messages[folded:]):
+            cost = self.counter.count_message(msg.content)
+            if history_tokens + cost > available:
+                break
+            kept.append(msg)
+            history_tokens += cost
+        kept.reverse()
+
+        lc_messages = []
+        if system_content:
+            lc_messages.append(SystemMessage(content=system_content))
+        if summary:
+            lc_messages.append(SystemMessage(content=summary_content))
+        for msg in kept:
+            if msg.type == "human":
+                lc_messages.append(HumanMessage(content=msg.content))
+            else:
+                lc_messages.append(AIMessage(content=msg.content))
+        lc_messages.append(HumanMessage(content=message))
+
+        usage = {
+            "backend": self.counter.backend,
+            "budget": self.budget,
+            "system": system_tokens,
+            "retrieved_context": self.counter.count(context),
+            "summary": summary_tokens,
+            "history": history_tokens,
+            "message": message_tokens,
+            "prompt": system_tokens + summary_tokens + history_tokens + message_tokens,
+            "history_messages": len(history_messages),
+            "history_messages_verbatim": len(kept),
+            "history_messages_summarized": folded,
+            "history_messages_dropped": len(history_messages) - folded - len(kept),
+        }
+        print(
+            f"🧮 [Context] {usage['prompt']}/{self.budget} prompt tokens "
+            f"({len(kept)} verbatim, {folded} summarized, {usage['history_messages_dropped']} dropped)"
+        )
+        return lc_messages, usage
+
+    def schedule_fold(self, session_id: str, history_messages: List):
+        """Fold old turns into the summary in the background once a batch has built up"""
+        folded = self._summaries.get(session_id, {}).get("folded", 0)
+        fold_end = len(history_messages) - 2 * self.recent_turns
+        if fold_end - folded < 2 * self.summary_batch_turns or session_id in self._folding:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._folding[session_id] = loop.create_task(
+            self._fold(session_id, list(history_messages[folded:fold_end]), fold_end)
+        )
+
+    async def _fold(self, session_id: str, messages: List, fold_end: int):
+        task = self._folding.get(session_id)
+        try:
+            previous = self._summaries.get(session_id, {}).get("summary", "")
+            transcript = "\n\n".join(
+                f"{'Student' if msg.type == 'human' else 'Tutor'}: {msg.content}" for msg in messages
+            )
+            transcript = self.counter.truncate(transcript, self.budget)
+            response = await self.llm.ainvoke([
+                SystemMessage(content=SUMMARY_INSTRUCTIONS),
+                HumanMessage(content=f"Existing summary:\n{previous or '(none)'}\n\nNew exchanges:\n{transcript}")
+            ], max_tokens=self.summary_max_tokens)
+            summary = self.counter.truncate(response.content.strip(), self.summary_max_tokens)
+            # The session may have been cleared while the summary was generated
+            if self._folding.get(session_id) is task:
+                self._summaries[session_id] = {"summary": summary, "folded": fold_end}
+                self.folds += 1
+                print(f"🗂️ [Context] Folded {len(messages)} messages into the summary for {session_id}")
+        except Exception as e:
+            # The turns stay unfolded and are retried after the next exchange
+            self.fold_failures += 1
+            print(f"⚠️ [Context] Could not update conversation summary: {e}")
+        finally:
+            if self._folding.get(session_id) is task:
+                del self._folding[session_id]
+
+    def forget(self, session_id: str):
+        self._summaries.pop(session_id, None)
+        task = self._folding.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "budget": self.budget,
+            "retrieval_budget": self.retrieval_budget,
+            "recent_turns": self.recent_turns,
+            "summarized_sessions": len(self._summaries),
+            "folds_in_progress": len(self._folding),
+            "folds": self.folds,
+            "fold_failures": self.fold_failures,
+        }
@@ -0,0 +1,129 @@
+"""
+Embedding Cache for the RAG retrieval path
+Wraps an embedding model so repeated and templated queries skip the transformer
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different strings share a cache entry"""
+    # all-mpnet-base-v2 lowercases its input, so case does not change the embedding
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.lower().split())
+
+
+class CachedEmbeddings:
+    """
+    Drop-in wrapper around a LangChain embeddings object.
+
+    embed_query results are kept in an in-process LRU keyed by normalized
+    text, with an optional SQLite tier that survives restarts. embed_documents
+    is passed straight through, since ingestion text is rarely repeated.
+    """
+
+    def __init__(self, embeddings, model_name: str, max_entries: int = 2048, disk_path: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if disk_path:
+            self._open_disk_tier(disk_path)
+
+    def _open_disk_tier(self, disk_path: str):
+        try:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+            print(f"✅ [EmbeddingCache] Disk tier enabled at {disk_path}")
+        except Exception as e:
+            print(f"⚠️ [EmbeddingCache] Could not open disk tier, using memory only: {e}")
+            self._db = None
+
+    def _key(self, text: str) -> str:
+        # The model name is part of the key so a model change never serves stale vectors
+        digest = hashlib.sha1(f"{self.model_name}\0{normalize_query(text)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _disk_get(self, key: str) -> Optional[List[float]]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def _disk_put(self, key: str, vector: List[float]):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector) VALUES (?, ?)",
+                (key, np.asarray(vector, dtype=np.float32).tobytes())
+            )
+            self._db.commit()
+        except Exception as e:
+            print(f"⚠️ [EmbeddingCache] Disk write failed: {e}")
+
+    def _remember(self, key: str, vector: List[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            vector = self._disk_get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+            self.misses += 1
+
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._remember(key, vector)
+            self._disk_put(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "disk_tier": self._db is not None,
+        }
+
+    def __getattr__(self, name):
+        # Anything else (model_kwargs, client, ...) is served by the wrapped model
+        return getattr(self.embeddings, name)
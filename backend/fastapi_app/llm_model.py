@@ -1,12 +1,66 @@
 from config import settings
 from langchain_ollama import ChatOllama
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
+from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+from typing import Dict, Optional
+import asyncio
+import httpx
 import torch
+import threading
 import types
 import requests
 import json
 
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+# One keep-alive pool shared by every async LLM call in the process
+_async_http_client: Optional[httpx.AsyncClient] = None
+_backend_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared AsyncClient; reuses TLS connections and speaks HTTP/2 when h2 is installed"""
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        _async_http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+            ),
+            # The read timeout applies between chunks, so long streams are fine
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        print(f"🔌 [LLM] Async HTTP pool ready (http2={http2}, max_connections={settings.LLM_HTTP_MAX_CONNECTIONS})")
+    return _async_http_client
+
+
+async def close_async_http_client():
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
+
+
+def backend_semaphore(backend: str) -> asyncio.Semaphore:
+    """Cap on in-flight async generations per backend"""
+    if backend not in _backend_semaphores:
+        limits = {
+            "openrouter": settings.OPENROUTER_MAX_CONCURRENCY,
+            "gemini": settings.GEMINI_MAX_CONCURRENCY,
+            # A local model generates one request at a time
+            "huggingface": 1,
+        }
+        _backend_semaphores[backend] = asyncio.Semaphore(limits.get(backend, 16))
+    return _backend_semaphores[backend]
+
+
 class LLM_Model:
     def __init__(self):
         self.client = None
@@ -22,6 +76,8 @@ class LLM_Model:
                     num_predict=settings.MAX_TOKENS  # Use configurable max tokens
                 )
                 # ChatOllama.invoke takes list of messages and returns AIMessage with .content
+                # ChatOllama.stream yields AIMessageChunk objects with .content
+                # ChatOllama.ainvoke / astream are native async and share its HTTP client
             elif self.backend == "openrouter":
                 print(f"🌐 [LLM] Initializing OpenRouter backend with DeepSeek model...")
                 self.client = self._create_openrouter_client()
@@ -40,10 +96,8 @@ class LLM_Model:
                     tokenizer=self.tokenizer,
                     device=-1 if device.type == "cpu" else 0,
                 )
-                # Create a wrapper for invoke that takes list of langchain messages
-                def hf_invoke(lc_messages, max_tokens=None):
-                    if max_tokens is None:
-                        max_tokens = settings.MAX_TOKENS
+
+                def hf_prompt(lc_messages):
                     messages = []
                     for msg in lc_messages:
                         if isinstance(msg, SystemMessage):
@@ -64,6 +118,13 @@ class LLM_Model:
                         for msg in messages:
                             prompt += f"{msg['role']}: {msg['content']}\n"
                         prompt += "assistant: "
+                    return prompt
+
+                # Create a wrapper for invoke that takes list of langchain messages
+                def hf_invoke(lc_messages, max_tokens=None):
+                    if max_tokens is None:
+                        max_tokens = settings.MAX_TOKENS
+                    prompt = hf_prompt(lc_messages)
                     outputs = self.pipeline(
                         prompt,
                         max_new_tokens=max_tokens,
@@ -73,8 +134,53 @@ class LLM_Model:
                         return_full_text=False
                     )
                     return types.SimpleNamespace(content=outputs[0]["generated_text"].strip())
-                # Assign the invoke method
-                self.client = types.SimpleNamespace(invoke=hf_invoke)
+
+                def hf_stream(lc_messages, max_tokens=None):
+                    if max_tokens is None:
+                        max_tokens = settings.MAX_TOKENS
+                    prompt = hf_prompt(lc_messages)
+                    streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+                    # Generation runs in its own thread and feeds the streamer as tokens are decoded
+                    worker = threading.Thread(target=self.pipeline, args=(prompt,), kwargs={
+                        "max_new_tokens": max_tokens,
+                        "do_sample": True,
+                        "temperature": 0.7,
+                        "top_p": 0.9,
+                        "return_full_text": False,
+                        "streamer": streamer,
+                    }, daemon=True)
+                    worker.start()
+                    try:
+                        for text in streamer:
+                            if text:
+                                yield types.SimpleNamespace(content=text)
+                    finally:
+                        # Also when the reader stops early: the model is busy until generation ends
+                        worker.join()
+
+                async def hf_ainvoke(lc_messages, max_tokens=None):
+                    # Generation is CPU-bound; run it off the loop, one at a time
+                    async with backend_semaphore("huggingface"):
+                        return await asyncio.to_thread(hf_invoke, lc_messages, max_tokens)
+
+                async def hf_astream(lc_messages, max_tokens=None):
+                    # Streams hold the same single slot as ainvoke, for the whole generation
+                    async with backend_semaphore("huggingface"):
+                        chunks = hf_stream(lc_messages, max_tokens)
+                        finished = object()
+                        try:
+                            while True:
+                                chunk = await asyncio.to_thread(next, chunks, finished)
+                                if chunk is finished:
+                                    break
+                                yield chunk
+                        finally:
+                            await asyncio.to_thread(chunks.close)
+
+                # Assign the invoke and stream methods
+                self.client = types.SimpleNamespace(
+                    invoke=hf_invoke, stream=hf_stream, ainvoke=hf_ainvoke, astream=hf_astream
+                )
             else:
                 raise ValueError(f"Unsupported LLM backend: {self.backend}")
         return self.client
@@ -85,11 +191,8 @@ class LLM_Model:
         if not api_key:
             raise ValueError("DEEPSEEK_OPEN_ROUTER_KEY not set in environment variables")
         
-        def openrouter_invoke(lc_messages, max_tokens=None):
-            """Invoke the OpenRouter API with the given messages."""
-            if max_tokens is None:
-                max_tokens = settings.MAX_TOKENS
-            
+        def build_request(lc_messages, max_tokens):
+            """Headers and payload for an OpenRouter chat completion."""
             # Convert LangChain messages to OpenRouter format
             messages = []
             for msg in lc_messages:
@@ -117,42 +220,141 @@ class LLM_Model:
                 "max_tokens": max_tokens,
                 "top_p": 0.9,
             }
+            return headers, payload
+
+        def raise_for_error(response):
+            if response.status_code != 200:
+                error_msg = f"OpenRouter API error: {response.status_code}"
+                try:
+                    error_data = response.json()
+                    if "error" in error_data:
+                        error_msg += f" - {error_data['error'].get('message', '')}"
+                except:
+                    error_msg += f" - {response.text}"
+                raise Exception(error_msg)
+
+        def parse_completion(result):
+            # Extract the content from the response
+            if "choices" in result and len(result["choices"]) > 0:
+                content = result["choices"][0]["message"]["content"]
+                print(f"✅ [OpenRouter] Received response from DeepSeek ({len(content)} chars)")
+                return types.SimpleNamespace(content=content.strip())
+            else:
+                raise Exception(f"Unexpected OpenRouter response format: {result}")
+
+        def parse_stream_line(line):
+            """Returns (finished, content) for one SSE line of a streamed completion."""
+            # SSE frames; lines starting with ':' are keep-alive comments
+            if not line or not line.startswith("data: "):
+                return False, None
+            data = line[len("data: "):]
+            if data == "[DONE]":
+                return True, None
+            chunk = json.loads(data)
+            if "error" in chunk:
+                raise Exception(f"OpenRouter API error: {chunk['error'].get('message', chunk['error'])}")
+            choices = chunk.get("choices") or []
+            return False, choices[0].get("delta", {}).get("content") if choices else None
+
+        def openrouter_invoke(lc_messages, max_tokens=None):
+            """Invoke the OpenRouter API with the given messages."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
+            headers, payload = build_request(lc_messages, max_tokens)
             
             try:
                 print(f"📡 [OpenRouter] Sending request to DeepSeek model...")
                 response = requests.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
+                    OPENROUTER_URL,
                     headers=headers,
                     json=payload,
                     timeout=60
                 )
-                
-                if response.status_code != 200:
-                    error_msg = f"OpenRouter API error: {response.status_code}"
-                    try:
-                        error_data = response.json()
-                        if "error" in error_data:
-                            error_msg += f" - {error_data['error'].get('message', '')}"
-                    except:
-                        error_msg += f" - {response.text}"
-                    raise Exception(error_msg)
-                
-                result = response.json()
-                
-                # Extract the content from the response
-                if "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0]["message"]["content"]
-                    print(f"✅ [OpenRouter] Received response from DeepSeek ({len(content)} chars)")
-                    return types.SimpleNamespace(content=content.strip())
-                else:
-                    raise Exception(f"Unexpected OpenRouter response format: {result}")
+                raise_for_error(response)
+                return parse_completion(response.json())
                     
             except requests.exceptions.Timeout:
                 raise Exception("OpenRouter API request timed out after 60 seconds")
             except requests.exceptions.RequestException as e:
                 raise Exception(f"OpenRouter API request failed: {str(e)}")
+
+        def openrouter_stream(lc_messages, max_tokens=None):
+            """Stream an OpenRouter completion, yielding content deltas as they arrive."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
+            headers, payload = build_request(lc_messages, max_tokens)
+            payload["stream"] = True
+            
+            try:
+                print(f"📡 [OpenRouter] Streaming request to DeepSeek model...")
+                # The timeout applies between chunks, not to the whole generation
+                with requests.post(
+                    OPENROUTER_URL,
+                    headers=headers,
+                    json=payload,
+                    stream=True,
+                    timeout=60
+                ) as response:
+                    raise_for_error(response)
+                    for line in response.iter_lines(decode_unicode=True):
+                        finished, content = parse_stream_line(line)
+                        if finished:
+                            break
+                        if content:
+                            yield types.SimpleNamespace(content=content)
+            except requests.exceptions.Timeout:
+                raise Exception("OpenRouter API stream stalled for more than 60 seconds")
+            except requests.exceptions.RequestException as e:
+                raise Exception(f"OpenRouter API request failed: {str(e)}")
+
+        async def openrouter_ainvoke(lc_messages, max_tokens=None):
+            """Async invoke over the shared connection pool."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
+            headers, payload = build_request(lc_messages, max_tokens)
+            
+            async with backend_semaphore("openrouter"):
+                try:
+                    print(f"📡 [OpenRouter] Sending async request to DeepSeek model...")
+                    response = await get_async_http_client().post(OPENROUTER_URL, headers=headers, json=payload)
+                except httpx.TimeoutException:
+                    raise Exception("OpenRouter API request timed out after 60 seconds")
+                except httpx.HTTPError as e:
+                    raise Exception(f"OpenRouter API request failed: {str(e)}")
+            raise_for_error(response)
+            return parse_completion(response.json())
+
+        async def openrouter_astream(lc_messages, max_tokens=None):
+            """Async stream over the shared connection pool."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
+            headers, payload = build_request(lc_messages, max_tokens)
+            payload["stream"] = True
+            
+            async with backend_semaphore("openrouter"):
+                try:
+                    print(f"📡 [OpenRouter] Streaming async request to DeepSeek model...")
+                    async with get_async_http_client().stream("POST", OPENROUTER_URL, headers=headers, json=payload) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                            raise_for_error(response)
+                        async for line in response.aiter_lines():
+                            finished, content = parse_stream_line(line)
+                            if finished:
+                                break
+                            if content:
+                                yield types.SimpleNamespace(content=content)
+                except httpx.TimeoutException:
+                    raise Exception("OpenRouter API stream stalled for more than 60 seconds")
+                except httpx.HTTPError as e:
+                    raise Exception(f"OpenRouter API request failed: {str(e)}")
         
-        return types.SimpleNamespace(invoke=openrouter_invoke)
+        return types.SimpleNamespace(
+            invoke=openrouter_invoke,
+            stream=openrouter_stream,
+            ainvoke=openrouter_ainvoke,
+            astream=openrouter_astream,
+        )
 
     def _create_gemini_client(self):
         """Create a Gemini client wrapper using Google's Generative AI."""
@@ -167,75 +369,121 @@ class LLM_Model:
         except ImportError:
             raise ImportError("google-generativeai not installed. Install with: pip install google-generativeai")
         
-        def gemini_invoke(lc_messages, max_tokens=None):
-            """Invoke the Gemini API with the given messages."""
-            if max_tokens is None:
-                max_tokens = settings.MAX_TOKENS
+        # Use Gemini 2.0 Flash model
+        # model_name = 'gemini-2.0-flash'
+        model_name = 'gemini-3.1-flash-lite-preview'
+        
+        def split_messages(lc_messages):
+            """Gemini chat history plus the final user turn; returns (history, user_input)."""
+            # Build chat history (Gemini needs proper format)
+            chat_history = []
+            system_prompt = ""
             
-            # Convert LangChain messages to Gemini format
-            messages = []
             for msg in lc_messages:
                 if isinstance(msg, SystemMessage):
-                    role = "user"  # Gemini doesn't have system role, treat as user with context
-                    content = f"[SYSTEM INSTRUCTION] {msg.content}"
+                    system_prompt = msg.content
                 elif isinstance(msg, HumanMessage):
-                    role = "user"
-                    content = msg.content
+                    chat_history.append({
+                        "role": "user",
+                        "parts": [{"text": msg.content}]
+                    })
                 elif isinstance(msg, AIMessage):
-                    role = "model"
-                    content = msg.content
-                else:
-                    role = "user"
-                    content = msg.content
-                messages.append({"role": role, "parts": [{"text": content}]})
+                    chat_history.append({
+                        "role": "model",
+                        "parts": [{"text": msg.content}]
+                    })
+            
+            # Get the last user message
+            user_input = lc_messages[-1].content if lc_messages else "Hello"
+            
+            # If we have a system prompt, prepend it to the first user message
+            if system_prompt:
+                user_input = f"{system_prompt}\n\n{user_input}"
+            
+            history = chat_history[:-1] if chat_history and isinstance(lc_messages[-1], HumanMessage) else chat_history
+            return history, user_input
+
+        def generation_config(max_tokens):
+            return {
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "max_output_tokens": max_tokens,
+            }
+
+        def start_chat(lc_messages, max_tokens):
+            """Open a Gemini chat seeded with history; returns (chat, user_input)."""
+            # Check if API key is set
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY environment variable not set")
+            
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=generation_config(max_tokens)
+            )
+            history, user_input = split_messages(lc_messages)
+            
+            # Start chat with history
+            chat = model.start_chat(history=history)
+            return chat, user_input
+
+        def rest_request(lc_messages, max_tokens):
+            """Headers and body for the generateContent REST endpoints (used by the async client)."""
+            history, user_input = split_messages(lc_messages)
+            config = generation_config(max_tokens)
+            body = {
+                "contents": history + [{"role": "user", "parts": [{"text": user_input}]}],
+                "generationConfig": {
+                    "temperature": config["temperature"],
+                    "topP": config["top_p"],
+                    "maxOutputTokens": config["max_output_tokens"],
+                },
+            }
+            return {"x-goog-api-key": api_key, "Content-Type": "application/json"}, body
+
+        def rest_text(result):
+            candidates = result.get("candidates") or []
+            if not candidates:
+                return ""
+            parts = candidates[0].get("content", {}).get("parts", [])
+            return "".join(part.get("text", "") for part in parts)
+
+        def rest_error(response):
+            try:
+                message = response.json().get("error", {}).get("message", response.text)
+            except ValueError:
+                message = response.text
+            return Exception(f"{response.status_code} {message}")
+
+        def translate_error(e):
+            """Map a Gemini SDK error to an Exception with an actionable message."""
+            if isinstance(e, ValueError):
+                # Missing API key
+                error_msg = f"Gemini configuration error: {str(e)}"
+                print(f"❌ [Gemini] {error_msg}")
+                return Exception(error_msg)
+            error_msg = f"Gemini API error: {str(e)}"
+            print(f"❌ [Gemini] {error_msg}")
+            if "API key" in str(e) or "403" in str(e) or "401" in str(e):
+                return Exception(f"{error_msg} - Check your GEMINI_API_KEY")
+            elif "quota" in str(e).lower() or "429" in str(e):
+                return Exception(f"{error_msg} - You've exceeded your quota or rate limit")
+            elif "not found" in str(e).lower() or "404" in str(e):
+                return Exception(f"{error_msg} - Model not available. Try 'gemini-1.5-flash' or check available models")
+            elif "timeout" in str(e).lower() or "deadline" in str(e).lower():
+                return Exception(f"{error_msg} - Request timeout. The API is taking too long to respond")
+            else:
+                return Exception(error_msg)
+
+        def gemini_invoke(lc_messages, max_tokens=None):
+            """Invoke the Gemini API with the given messages."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
             
             try:
                 print(f"📡 [Gemini] Sending request to Gemini model...")
-                print(f"   Messages count: {len(messages)}")
+                print(f"   Messages count: {len(lc_messages)}")
                 print(f"   Max tokens: {max_tokens}")
-                
-                # Check if API key is set
-                if not api_key:
-                    raise ValueError("GEMINI_API_KEY environment variable not set")
-                
-                # Use Gemini 2.0 Flash model
-                model = genai.GenerativeModel(
-                    # model_name='gemini-2.0-flash',
-                                        model_name='gemini-3.1-flash-lite-preview',
-                    generation_config={
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "max_output_tokens": max_tokens,
-                    }
-                )
-                
-                # Build chat history (Gemini needs proper format)
-                chat_history = []
-                system_prompt = ""
-                
-                for msg in lc_messages:
-                    if isinstance(msg, SystemMessage):
-                        system_prompt = msg.content
-                    elif isinstance(msg, HumanMessage):
-                        chat_history.append({
-                            "role": "user",
-                            "parts": [{"text": msg.content}]
-                        })
-                    elif isinstance(msg, AIMessage):
-                        chat_history.append({
-                            "role": "model",
-                            "parts": [{"text": msg.content}]
-                        })
-                
-                # Get the last user message
-                user_input = lc_messages[-1].content if lc_messages else "Hello"
-                
-                # If we have a system prompt, prepend it to the first user message
-                if system_prompt:
-                    user_input = f"{system_prompt}\n\n{user_input}"
-                
-                # Start chat with history
-                chat = model.start_chat(history=chat_history[:-1] if chat_history and isinstance(lc_messages[-1], HumanMessage) else chat_history)
+                chat, user_input = start_chat(lc_messages, max_tokens)
                 
                 print(f"📤 [Gemini] Sending chat message...")
                 # Send message and get response
@@ -248,23 +496,84 @@ class LLM_Model:
                 print(f"✅ [Gemini] Received response ({len(content)} chars)")
                 return types.SimpleNamespace(content=content)
                 
-            except ValueError as e:
-                # Missing API key
-                error_msg = f"Gemini configuration error: {str(e)}"
-                print(f"❌ [Gemini] {error_msg}")
-                raise Exception(error_msg)
             except Exception as e:
-                error_msg = f"Gemini API error: {str(e)}"
-                print(f"❌ [Gemini] {error_msg}")
-                if "API key" in str(e) or "403" in str(e) or "401" in str(e):
-                    raise Exception(f"{error_msg} - Check your GEMINI_API_KEY")
-                elif "quota" in str(e).lower() or "429" in str(e):
-                    raise Exception(f"{error_msg} - You've exceeded your quota or rate limit")
-                elif "not found" in str(e).lower() or "404" in str(e):
-                    raise Exception(f"{error_msg} - Model not available. Try 'gemini-1.5-flash' or check available models")
-                elif "timeout" in str(e).lower() or "deadline" in str(e).lower():
-                    raise Exception(f"{error_msg} - Request timeout. The API is taking too long to respond")
-                else:
-                    raise Exception(error_msg)
+                raise translate_error(e)
+
+        def gemini_stream(lc_messages, max_tokens=None):
+            """Stream a Gemini response, yielding text chunks as they are generated."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
+            
+            try:
+                print(f"📡 [Gemini] Streaming request to Gemini model...")
+                chat, user_input = start_chat(lc_messages, max_tokens)
+                received = 0
+                for chunk in chat.send_message(user_input, stream=True):
+                    text = chunk.text
+                    if text:
+                        received += len(text)
+                        yield types.SimpleNamespace(content=text)
+                if not received:
+                    raise Exception("Gemini API returned empty response")
+                print(f"✅ [Gemini] Streamed response ({received} chars)")
+            except Exception as e:
+                raise translate_error(e)
+        
+        async def gemini_ainvoke(lc_messages, max_tokens=None):
+            """Async invoke via the REST API over the shared connection pool."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
+            headers, body = rest_request(lc_messages, max_tokens)
+            
+            async with backend_semaphore("gemini"):
+                try:
+                    print(f"📡 [Gemini] Sending async request to Gemini model...")
+                    response = await get_async_http_client().post(
+                        f"{GEMINI_API_URL}/{model_name}:generateContent", headers=headers, json=body
+                    )
+                    if response.status_code != 200:
+                        raise rest_error(response)
+                    content = rest_text(response.json()).strip()
+                    if not content:
+                        raise Exception("Gemini API returned empty response")
+                    print(f"✅ [Gemini] Received response ({len(content)} chars)")
+                    return types.SimpleNamespace(content=content)
+                except Exception as e:
+                    raise translate_error(e)
+
+        async def gemini_astream(lc_messages, max_tokens=None):
+            """Async stream via the REST API (server-sent events) over the shared connection pool."""
+            if max_tokens is None:
+                max_tokens = settings.MAX_TOKENS
+            headers, body = rest_request(lc_messages, max_tokens)
+            
+            async with backend_semaphore("gemini"):
+                try:
+                    print(f"📡 [Gemini] Streaming async request to Gemini model...")
+                    received = 0
+                    async with get_async_http_client().stream(
+                        "POST", f"{GEMINI_API_URL}/{model_name}:streamGenerateContent",
+                        params={"alt": "sse"}, headers=headers, json=body
+                    ) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                            raise rest_error(response)
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data: "):
+                                continue
+                            text = rest_text(json.loads(line[len("data: "):]))
+                            if text:
+                                received += len(text)
+                                yield types.SimpleNamespace(content=text)
+                    if not received:
+                        raise Exception("Gemini API returned empty response")
+                    print(f"✅ [Gemini] Streamed response ({received} chars)")
+                except Exception as e:
+                    raise translate_error(e)
         
-        return types.SimpleNamespace(invoke=gemini_invoke)
\ No newline at end of file
+        return types.SimpleNamespace(
+            invoke=gemini_invoke,
+            stream=gemini_stream,
+            ainvoke=gemini_ainvoke,
+            astream=gemini_astream,
+        )
\ No newline at end of file
@@ -7,7 +7,7 @@ from datetime import datetime
 import jwt
 import os
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 import asyncio
 from contextlib import asynccontextmanager
 import io
@@ -15,6 +15,7 @@ import base64
 import sys
 import traceback
 import httpx
+import json
 
 print("🚀 FastAPI startup initiated...")
 
@@ -51,6 +52,7 @@ agent_service = None  # Will be initialized after RAG service
 lesson_generator_service = None  # Will be initialized after RAG service
 tts_engine = None
 stt_engine = None
+document_job_queue = None  # Created with the first queued upload
 _initialization_lock = asyncio.Lock()
 _services_initialized = False
 _initialization_error = None
@@ -100,12 +102,10 @@ async def ensure_services_initialized():
             await rag_service.initialize()
             print("  ✅ RAG service initialized")
             
-            # Initialize agent service with RAG service's LLM
+            # Share the RAG service's agent, so there is one session-memory store
+            # and the /api/agent/memory endpoints see what chat routing wrote
             print("  • Initializing agent service...")
-            agent_service = ReasoningAgent(
-                llm_client=rag_service.llm,
-                embedding_model=rag_service.embedding_model
-            )
+            agent_service = rag_service.agent
             print("  ✅ Agent service initialized")
             
             # Initialize lesson generator service with RAG service's LLM and RAG service
@@ -174,6 +174,19 @@ async def lifespan(app: FastAPI):
     print("=" * 60)
     yield
     print("🔄 Shutting down...")
+    if document_job_queue:
+        document_job_queue.shutdown()
+    if rag_service and rag_service.ingestion_pipeline:
+        rag_service.ingestion_pipeline.shutdown()
+    if rag_service:
+        await rag_service.profile_sync.close()
+        # Resident sessions survive the restart through the spill tier
+        rag_service.close_session_state()
+        if rag_service.agent:
+            await rag_service.agent.tools_manager.close()
+    if MAIN_SERVICES_AVAILABLE:
+        from llm_model import close_async_http_client
+        await close_async_http_client()
 
 app = FastAPI(
     title="RAG Chat API",
@@ -258,6 +271,17 @@ async def api_status():
         "main_services_initialized": _services_initialized,
         "tts_available": tts_engine is not None,
         "stt_available": stt_engine is not None,
+        "embedding_cache": rag_service.embedding_model.stats() if rag_service and rag_service.embedding_model else None,
+        "document_jobs": document_job_queue.stats() if document_job_queue else None,
+        "answer_cache": rag_service.answer_cache.stats() if rag_service and rag_service.answer_cache else None,
+        "conversation_context": rag_service.context_manager.stats() if rag_service and rag_service.context_manager else None,
+        "profile_sync": rag_service.profile_sync.stats() if rag_service else None,
+        "session_state": {
+            "chat_history": rag_service.session_histories.stats(),
+            "conversation_summaries": rag_service.conversation_summaries.stats(),
+            "learning_profiles": rag_service.learning_profiles.stats(),
+            "agent_memory": rag_service.agent.session_memories.stats() if rag_service.agent else None,
+        } if rag_service else None,
         "initialization_error": _initialization_error
     }
 
@@ -314,9 +338,7 @@ async def health_check_chat():
                     SystemMessage(content="You are a helpful assistant."),
                     HumanMessage(content="Say 'Health check passed' in one sentence.")
                 ]
-                test_response = await asyncio.get_event_loop().run_in_executor(
-                    None, lambda: rag_service.llm.invoke(test_messages, max_tokens=100)
-                )
+                test_response = await rag_service.llm.ainvoke(test_messages, max_tokens=100)
                 if test_response and hasattr(test_response, 'content'):
                     health_status["tests"]["llm_response"] = test_response.content[:100]
                     health_status["llm_available"] = True
@@ -370,6 +392,41 @@ class MessageCreate(BaseModel):
     session_id: str
     document_ids: Optional[List[str]] = None
 
+async def _answer_with_agent(content: str, namespaced_session_id: str, retrieval: dict) -> dict:
+    """Answer a low-confidence query with the tool-using agent, seeded with whatever was retrieved"""
+    # Max iterations set to 3 for balanced reasoning
+    learning_profile = rag_service.get_or_create_learning_profile(namespaced_session_id)
+    agent_response = await agent_service.reason_and_act(
+        message=content,
+        session_id=namespaced_session_id,
+        context=retrieval["context"],
+        enable_tools=True,
+        max_iterations=3,
+        learning_profile=learning_profile
+    )
+    
+    # Extract tools used from reasoning chain
+    tools_used = []
+    if agent_response.get("reasoning_chain"):
+        for step in agent_response["reasoning_chain"]:
+            if step.get("type") == "action":
+                tools_used.append(step.get("action"))
+    
+    # Follow-up questions need this turn in the history just like a RAG answer
+    answer = agent_response.get("final_response", "")
+    rag_service.record_exchange(retrieval, content, answer)
+    
+    return {
+        "answer": answer,
+        "is_incomplete": False,
+        "context": rag_service.summarize_context(retrieval["context_docs"]),
+        "source": "agent_with_tools",
+        "tools_used": list(set(tools_used)),  # Remove duplicates
+        "reasoning_steps": len(agent_response.get("reasoning_chain", [])),
+        "iterations": agent_response.get("iterations", 0),
+        "confidence_score": retrieval["confidence_score"]
+    }
+
 @app.post("/api/chat/process")
 async def process_message(message: MessageCreate, user_id: int = Depends(verify_token)):
     """Process a chat message with intelligent agent routing
@@ -395,61 +452,34 @@ async def process_message(message: MessageCreate, user_id: int = Depends(verify_
         # Sync learning profile from Django if needed
         await rag_service.sync_learning_profile_from_django(namespaced_session_id, str(user_id))
         
-        # First, try to get RAG results
+        # Score retrieval first; only the chosen route pays for generation
         print(f"🔍 [CHAT/PROCESS] Starting RAG search...")
-        rag_response = await rag_service.chat(
+        retrieval = await rag_service.retrieve(
             message.content, 
             namespaced_session_id,
             document_ids=message.document_ids
         )
-        print(f"✅ [CHAT/PROCESS] RAG response received")
-        
-        rag_score = rag_response.get("confidence_score", 0)
+        rag_score = retrieval["confidence_score"]
         
         print(f"📊 [RAG Score] Query: {message.content[:50]}... | Confidence: {rag_score:.2f}")
         
-        # If RAG confidence is low (< 0.3), use agent with search tools
-        if rag_score < 0.3:
+        # If RAG confidence is low, go straight to the agent with search tools
+        if rag_score < settings.RAG_CONFIDENCE_THRESHOLD:
             print(f"⚠️ [Agent Activation] Low RAG confidence ({rag_score:.2f}), activating agent with search tools...")
-            
-            # Use agent to search for better information
-            # Max iterations set to 3 for balanced reasoning
-            learning_profile = rag_service.get_or_create_learning_profile(namespaced_session_id)
-            agent_response = await agent_service.reason_and_act(
-                message=message.content,
-                session_id=namespaced_session_id,
-                context=rag_response.get("answer", ""),
-                enable_tools=True,
-                max_iterations=3,
-                learning_profile=learning_profile
-            )
-            
-            # Extract tools used from reasoning chain
-            tools_used = []
-            if agent_response.get("reasoning_chain"):
-                for step in agent_response["reasoning_chain"]:
-                    if step.get("type") == "action":
-                        tools_used.append(step.get("action"))
-            
-            print(f"✅ [CHAT/PROCESS] Agent response generated with {len(tools_used)} tools")
-            return {
-                "answer": agent_response.get("final_response", rag_response["answer"]),
-                "is_incomplete": False,
-                "context": rag_response.get("context", []),
-                "source": "agent_with_tools",
-                "tools_used": list(set(tools_used)),  # Remove duplicates
-                "reasoning_steps": len(agent_response.get("reasoning_chain", [])),
-                "iterations": agent_response.get("iterations", 0)
-            }
+            agent_result = await _answer_with_agent(message.content, namespaced_session_id, retrieval)
+            print(f"✅ [CHAT/PROCESS] Agent response generated with {len(agent_result['tools_used'])} tools")
+            return agent_result
         
-        # If RAG is sufficient, return RAG response
+        # If RAG is sufficient, generate the RAG answer
+        rag_response = await rag_service.generate(retrieval, message.content)
         print(f"✅ [CHAT/PROCESS] Returning RAG response with confidence score: {rag_score:.2f}")
         return {
             "answer": rag_response["answer"],
             "is_incomplete": rag_response.get("is_incomplete", False),
             "context": rag_response.get("context", []),
             "source": "rag",
-            "confidence_score": rag_score
+            "confidence_score": rag_score,
+            "token_usage": rag_response.get("token_usage")
         }
     
     except Exception as e:
@@ -459,6 +489,57 @@ async def process_message(message: MessageCreate, user_id: int = Depends(verify_
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
+def _sse(event: dict) -> str:
+    """Encode an event as a server-sent events frame"""
+    return f"data: {json.dumps(event, default=str)}\n\n"
+
+@app.post("/api/chat/stream")
+async def stream_message(message: MessageCreate, user_id: int = Depends(verify_token)):
+    """Streaming variant of /api/chat/process
+    
+    Responds with server-sent events:
+    - {"type": "context", ...} once retrieval is done
+    - {"type": "token", "content": ...} for each piece of generated text
+    - {"type": "done", ...} with the same fields /api/chat/process returns
+    - {"type": "error", "detail": ...} if generation fails midway
+    
+    Low-confidence retrievals fall back to the agent, whose answer arrives as a single token event.
+    """
+    await ensure_services_initialized()
+    namespaced_session_id = f"{user_id}_{message.session_id}"
+    await rag_service.sync_learning_profile_from_django(namespaced_session_id, str(user_id))
+    
+    async def events():
+        try:
+            retrieval = await rag_service.retrieve(
+                message.content,
+                namespaced_session_id,
+                document_ids=message.document_ids
+            )
+            rag_score = retrieval["confidence_score"]
+            if rag_score < settings.RAG_CONFIDENCE_THRESHOLD:
+                print(f"⚠️ [Agent Activation] Low RAG confidence ({rag_score:.2f}), activating agent with search tools...")
+                agent_result = await _answer_with_agent(message.content, namespaced_session_id, retrieval)
+                yield _sse({"type": "context", "context": agent_result["context"], "confidence_score": rag_score})
+                yield _sse({"type": "token", "content": agent_result["answer"]})
+                yield _sse({"type": "done", **agent_result})
+                return
+            async for event in rag_service.chat_stream(message.content, namespaced_session_id, retrieval=retrieval):
+                if event["type"] == "done":
+                    event = {**event, "source": "rag"}
+                yield _sse(event)
+        except Exception as e:
+            print(f"❌ ERROR in stream_message: {str(e)}")
+            traceback.print_exc()
+            yield _sse({"type": "error", "detail": f"Error processing message: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Tell nginx and other proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/documents/process")
 async def process_document(
     file: UploadFile = File(...),
@@ -479,8 +560,55 @@ async def process_document(
         f.write(content)
     
     namespaced_session_id = f"{user_id}_{session_id}"
-    success = await rag_service.process_document(file_path, session_id=namespaced_session_id, document_id=document_id)
-    return {"processed": success}
+    stats = await rag_service.process_document(file_path, session_id=namespaced_session_id, document_id=document_id)
+    return {"processed": stats is not None, "stats": stats}
+
+@app.post("/api/documents/jobs", status_code=202)
+async def submit_document_job(
+    file: UploadFile = File(...),
+    session_id: str = Form(...),
+    document_id: str = Form(...),
+    callback_url: Optional[str] = Form(None),
+    callback_token: Optional[str] = Form(None),
+    user_id: int = Depends(verify_token)
+):
+    """Queue a PDF for background processing and return a job id to poll
+    
+    With callback_url, the outcome is also POSTed there as
+    {"token": callback_token, "job_id", "status", "error"} when the job finishes.
+    """
+    global document_job_queue
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+    
+    await ensure_services_initialized()
+    if document_job_queue is None:
+        from services.document_jobs import DocumentJobQueue
+        document_job_queue = DocumentJobQueue(rag_service)
+    
+    file_path = f"media/uploads/{file.filename}"
+    os.makedirs("media/uploads", exist_ok=True)
+    with open(file_path, "wb") as f:
+        content = await file.read()
+        f.write(content)
+    
+    namespaced_session_id = f"{user_id}_{session_id}"
+    return document_job_queue.submit(
+        file_path,
+        user_id,
+        session_id=namespaced_session_id,
+        document_id=document_id,
+        callback_url=callback_url,
+        callback_token=callback_token
+    )
+
+@app.get("/api/documents/jobs/{job_id}")
+async def get_document_job(job_id: str, user_id: int = Depends(verify_token)):
+    """Status and progress of a document-processing job"""
+    job = document_job_queue.get(job_id, user_id=user_id) if document_job_queue else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.post("/api/chat/clear/{session_id}")
 async def clear_session(session_id: str, user_id: int = Depends(verify_token)):
@@ -692,9 +820,7 @@ IMPORTANT:
             HumanMessage(content=f"Generate {request.num_questions} {request.difficulty} quiz questions about: {request.topic}")
         ]
 
-        response = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: rag_service.llm.invoke(messages, max_tokens=4096)
-        )
+        response = await rag_service.llm.ainvoke(messages, max_tokens=4096)
 
         response_text = response.content if hasattr(response, 'content') else str(response)
 
@@ -762,7 +888,7 @@ async def submit_questionnaire(
         learning_profile.set_questionnaire_data(questionnaire_data)
         
         # Save the updated profile locally
-        rag_service._save_learning_profiles()
+        rag_service._save_learning_profile(namespaced_session_id)
         
         # Sync to Django backend
         try:
@@ -795,6 +921,7 @@ async def submit_questionnaire(
                 )
                 if resp.status_code == 200:
                     print(f"✅ [Questionnaire] Successfully synced to Django")
+                    rag_service.profile_sync.invalidate(str(user_id), django_styles)
                 else:
                     print(f"⚠️ [Questionnaire] Django sync failed: {resp.status_code} - {resp.text}")
         except Exception as sync_err:
@@ -816,6 +943,20 @@ async def submit_questionnaire(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error processing questionnaire: {str(e)}")
 
+class ProfileSyncNotification(BaseModel):
+    ils_data: Optional[Dict[str, float]] = None
+
+@app.post("/api/learning/profile-sync")
+async def notify_profile_sync(
+    notification: ProfileSyncNotification,
+    user_id: int = Depends(verify_token)
+):
+    """Called by Django when a user's ILS data changes, so chat stops using the cached copy"""
+    await ensure_services_initialized()
+    rag_service.profile_sync.invalidate(str(user_id), notification.ils_data)
+    print(f"🔔 [ProfileSync] Django updated ILS data for user {user_id}")
+    return {"success": True}
+
 @app.get("/api/learning/profile/{session_id}")
 async def get_learning_profile(
     session_id: str,
@@ -870,34 +1011,30 @@ async def continue_response(
         
         print(f"   📝 Last assistant message length: {len(last_assistant_msg.content)} chars")
         
-        # Build messages for continuation (include all history + continuation prompt)
-        lc_messages = []
-        for msg in history.messages:
-            if msg.type == "human":
-                lc_messages.append(HumanMessage(content=msg.content))
-            elif msg.type == "ai":
-                lc_messages.append(AIMessage(content=msg.content))
-        
-        # Add a continuation prompt asking to continue from the last response
+        # Build messages for continuation: budgeted history (the incomplete
+        # answer is the newest message, so it is always kept) + continuation prompt
         continuation_prompt = "Please continue your previous response from where you left off. Complete your thought."
-        lc_messages.append(HumanMessage(content=continuation_prompt))
+        lc_messages, token_usage = rag_service.context_manager.build_messages(
+            namespaced_session_id, history.messages, None, continuation_prompt
+        )
         
         print(f"   🤖 Generating continuation (max_tokens: {settings.MAX_TOKENS})")
         
         # Generate continuation
-        continuation = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: rag_service.llm.invoke(lc_messages, max_tokens=settings.MAX_TOKENS)
-        )
+        continuation = await rag_service.llm.ainvoke(lc_messages, max_tokens=settings.MAX_TOKENS)
         
         # Combine the original response with continuation
         combined_response = last_assistant_msg.content + " " + continuation.content
         
         # Update the last assistant message in history
-        # Find the index of the last assistant message and update it
+        # Find the index of the last assistant message and update it; the
+        # history is fetched again in case it was evicted during generation
+        history = rag_service.get_session_history(namespaced_session_id)
         for i in range(len(history.messages) - 1, -1, -1):
             if history.messages[i].type == "ai":
                 history.messages[i].content = combined_response
                 break
+        rag_service.session_histories.mark_dirty(namespaced_session_id)
         
         # Check if still incomplete
         is_incomplete = rag_service._is_response_incomplete(combined_response)
@@ -907,7 +1044,11 @@ async def continue_response(
         return {
             "answer": continuation.content,  # Return only the continuation part
             "full_answer": combined_response,  # Return the full combined answer
-            "is_incomplete": is_incomplete
+            "is_incomplete": is_incomplete,
+            "token_usage": {
+                **token_usage,
+                "completion": rag_service.context_manager.counter.count(continuation.content),
+            }
         }
     except Exception as e:
         print(f"❌ [Continue] Error continuing response: {e}")
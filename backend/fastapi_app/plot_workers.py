@@ -0,0 +1,296 @@
+"""
+Plot Workers for the Matplotlib tool
+Pre-warmed worker processes that render plotting code in isolation, with a render cache
+"""
+
+import asyncio
+import base64
+import hashlib
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Dict, Optional
+
+try:
+    import resource
+    import signal
+except ImportError:  # Windows: no rlimits or SIGALRM, only the caller's wall-clock limit applies
+    resource = None
+    signal = None
+
+
+class RenderTimeout(BaseException):
+    """Raised by the alarm; a BaseException so plot code's `except Exception` cannot swallow it"""
+
+
+def _on_alarm(signum, frame):
+    raise RenderTimeout()
+
+
+def _init_worker(memory_mb: int):
+    """Runs once per worker: select Agg and pay the matplotlib import and font-cache cost up front"""
+    os.environ["MPLBACKEND"] = "Agg"
+    # Plotting does not need BLAS threads, and each one reserves address space under the memory limit
+    os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    from matplotlib import font_manager
+    font_manager.findfont("DejaVu Sans")
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if signal is not None:
+        signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+def _render(plot_code: str, time_limit: int, cpu_limit: int, dpi: int, marker: str = None) -> Dict:
+    """
+    Run plotting code on a fresh figure and return the PNG as base64.
+    While it runs, the marker file holds the worker's pid, so the parent can
+    tell which render a dead worker was running.
+    """
+    import matplotlib.pyplot as plt
+
+    if marker:
+        with open(marker, "w") as f:
+            f.write(str(os.getpid()))
+
+    if resource is not None and cpu_limit:
+        # RLIMIT_CPU counts the worker's whole lifetime, so the limit is set relative to what it has used
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_limit
+        hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+    if signal is not None and time_limit:
+        signal.alarm(time_limit)
+    try:
+        plt.close("all")
+        initial = plt.figure()
+        namespace = {"plt": plt, "fig": initial, "BytesIO": BytesIO, "base64": base64}
+        try:
+            import numpy
+            namespace["np"] = numpy
+        except ImportError:
+            pass
+        exec(plot_code, namespace)
+        # Render a figure the code assigned to fig (fig, ax = plt.subplots()), else the current one
+        figure = namespace.get("fig")
+        if figure is initial or not hasattr(figure, "savefig"):
+            figure = plt.gcf()
+        buffer = BytesIO()
+        figure.savefig(buffer, format="png", dpi=dpi)
+        return {"image_base64": base64.b64encode(buffer.getvalue()).decode()}
+    except RenderTimeout:
+        return {"error": f"Plot code exceeded the {time_limit} second time limit"}
+    except MemoryError:
+        return {"error": "Plot code exceeded the worker memory limit"}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        if signal is not None and time_limit:
+            signal.alarm(0)
+        plt.close("all")
+        if marker:
+            os.remove(marker)
+
+
+class PlotWorkerPool:
+    """
+    Process pool for MatplotlibTool.
+
+    Workers are spawned (not forked from the server process) and import
+    matplotlib with the Agg backend when they start; the pool is warmed in
+    the background as soon as it is created. Each render gets a fresh
+    figure and namespace in a worker of its own, so concurrent plots never
+    share pyplot state. A render is bounded by a wall-clock alarm and a CPU
+    rlimit inside the worker, and by the caller's timeout; a worker that
+    dies is replaced by rebuilding the pool. Successful renders are cached
+    by code hash.
+
+    A dead or killed worker breaks the whole ProcessPoolExecutor, failing
+    every render in flight on it. The render whose worker died (CPU limit,
+    segfault, OOM kill) fails at once; the others, and those caught in a
+    restart after another render's timeout, are retried once on the new pool.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        time_limit: int = 20,
+        cpu_limit: int = 20,
+        memory_mb: int = 1024,
+        dpi: int = 100,
+        cache_size: int = 128
+    ):
+        self.max_workers = max_workers
+        self.time_limit = time_limit
+        self.cpu_limit = cpu_limit
+        self.memory_mb = memory_mb
+        self.dpi = dpi
+        self.cache_size = cache_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        # Pools terminated because a render overran its time limit
+        self._killed_pools = weakref.WeakSet()
+        # Per-render marker files naming the worker that runs it
+        self._marker_dir = tempfile.mkdtemp(prefix="plot-workers-")
+        self.renders = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.restarts = 0
+        self.retries = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.memory_mb,)
+                )
+                # Workers start on submit, so one task per worker brings them all up now
+                for _ in range(self.max_workers):
+                    self._executor.submit(_warm)
+                print(f"📊 [PlotWorkers] Warming {self.max_workers} plotting workers")
+            return self._executor
+
+    def start(self):
+        """Spawn and warm the workers without waiting for them"""
+        self._get_executor()
+
+    def _restart(self, executor: ProcessPoolExecutor, kill: bool = False):
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+            if kill:
+                self._killed_pools.add(executor)
+        if kill:
+            # ProcessPoolExecutor has no public way to stop a busy worker. The
+            # pool then fails every queued and running render with
+            # BrokenProcessPool, and render() retries them on the new pool
+            for process in list(getattr(executor, "_processes", {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False)
+        print("♻️ [PlotWorkers] Restarting the plotting worker pool")
+
+    async def _broke_own_worker(self, executor: ProcessPoolExecutor, workers, marker: str) -> bool:
+        """
+        Whether this render's own worker died and broke the pool. A broken
+        pool terminates its other workers with SIGTERM, as a timeout restart
+        does; the worker that broke it exited some other way.
+        """
+        if executor in self._killed_pools or not os.path.exists(marker):
+            # Restarted for another render's timeout, or never started
+            return False
+        with open(marker) as f:
+            pid = int(f.read() or 0)
+        processes, manager = workers
+        process = (processes or {}).get(pid)
+        if process is None:
+            return False
+        # The exit code is known once the pool's management thread has reaped the workers
+        if manager is not None:
+            await asyncio.get_running_loop().run_in_executor(None, manager.join, 5)
+        terminated = -signal.SIGTERM if signal is not None else None
+        return process.exitcode is not None and process.exitcode != terminated
+
+    def _key(self, plot_code: str) -> str:
+        return hashlib.sha256(f"{self.dpi}\0{plot_code.strip()}".encode("utf-8")).hexdigest()
+
+    async def render(self, plot_code: str) -> Dict:
+        key = self._key(plot_code)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return {"image_base64": cached, "cached": True}
+
+        self.renders += 1
+        marker = os.path.join(self._marker_dir, uuid.uuid4().hex)
+        try:
+            for attempt in range(2):
+                executor = self._get_executor()
+                workers = None
+                try:
+                    future = asyncio.get_running_loop().run_in_executor(
+                        executor, _render, plot_code, self.time_limit, self.cpu_limit, self.dpi, marker
+                    )
+                    # Kept now: shutting the pool down drops the executor's references to both
+                    workers = (executor._processes, executor._executor_manager_thread)
+                    # The alarm in the worker normally fires first; this catches code stuck outside the interpreter
+                    result = await asyncio.wait_for(future, timeout=self.time_limit + 5)
+                    break
+                except RuntimeError as e:
+                    # BrokenProcessPool, or the pool was shut down by a restart before this render was submitted
+                    if not isinstance(e, BrokenProcessPool) and "shutdown" not in str(e):
+                        raise
+                    own_fault = workers is not None and await self._broke_own_worker(executor, workers, marker)
+                    self._restart(executor)
+                    if own_fault:
+                        self.failures += 1
+                        return {"error": "Plot code exceeded the worker's CPU or memory limit"}
+                    if attempt == 0:
+                        # Another render took the pool down; this one gets a second chance
+                        self.retries += 1
+                        continue
+                    self.failures += 1
+                    return {"error": "Plot workers were restarted by another render twice; please try again"}
+                except asyncio.TimeoutError:
+                    self.failures += 1
+                    # The worker cannot be interrupted, so the pool is replaced
+                    self._restart(executor, kill=True)
+                    return {"error": f"Plot code exceeded the {self.time_limit} second time limit"}
+        finally:
+            if os.path.exists(marker):
+                os.remove(marker)
+
+        if "error" in result:
+            self.failures += 1
+            return result
+        self._cache[key] = result["image_base64"]
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return {**result, "cached": False}
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        shutil.rmtree(self._marker_dir, ignore_errors=True)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.max_workers,
+            "running": self._executor is not None,
+            "time_limit": self.time_limit,
+            "cpu_limit": self.cpu_limit,
+            "memory_mb": self.memory_mb,
+            "cached_renders": len(self._cache),
+            "renders": self.renders,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "retries": self.retries,
+        }
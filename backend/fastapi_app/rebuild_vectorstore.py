@@ -0,0 +1,44 @@
+"""
+Rebuild the vectorstore index as another FAISS index type and report recall@k
+
+Usage:
+    python rebuild_vectorstore.py                      # use VECTORSTORE_INDEX_TYPE
+    python rebuild_vectorstore.py --index-type hnsw --k 10 --queries 500
+    python rebuild_vectorstore.py --index-type ivf_pq --dry-run
+"""
+
+import argparse
+import json
+import sys
+
+from config import settings
+from adaptive_learning import AdaptiveFAISSVectorStore
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the FAISS vectorstore index")
+    parser.add_argument("--path", default=settings.VECTORSTORE_PATH, help="Vectorstore path prefix")
+    parser.add_argument("--index-type", default=settings.VECTORSTORE_INDEX_TYPE,
+                        choices=AdaptiveFAISSVectorStore.INDEX_TYPES)
+    parser.add_argument("--k", type=int, default=10, help="k for the recall@k report")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled queries for the recall report")
+    parser.add_argument("--dry-run", action="store_true", help="Report recall without saving the new index")
+    args = parser.parse_args()
+
+    # Rebuilding only touches stored vectors, so no embedding model is needed
+    vectorstore = AdaptiveFAISSVectorStore(embedding_model=None)
+    if not vectorstore.load_index(args.path):
+        print(f"❌ No vectorstore found at {args.path}")
+        return 1
+
+    report = vectorstore.rebuild_index(args.index_type, recall_queries=args.queries, recall_k=args.k)
+    print(json.dumps(report, indent=2))
+
+    if report.get("rebuilt") and not args.dry_run:
+        vectorstore.save_index(args.path)
+        print(f"✅ Saved {args.index_type} index to {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
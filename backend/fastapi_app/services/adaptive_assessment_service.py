@@ -111,10 +111,7 @@ IMPORTANT:
                 HumanMessage(content=f"Generate the adaptive quiz for: {topic}")
             ]
 
-            import asyncio
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: self.llm_client.invoke(messages, max_tokens=4096)
-            )
+            response = await self.llm_client.ainvoke(messages, max_tokens=4096)
             
             response_text = response.content if hasattr(response, 'content') else str(response)
 
@@ -36,9 +36,7 @@ RULES:
                 HumanMessage(content=user_msg)
             ]
 
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: self.llm_client.invoke(messages, max_tokens=2048)
-            )
+            response = await self.llm_client.ainvoke(messages, max_tokens=2048)
             
             code = response.content if hasattr(response, 'content') else str(response)
             code = code.strip()
@@ -76,9 +74,7 @@ Rewrite the provided educational text content into a conversational, easy-to-lis
                 HumanMessage(content=user_msg)
             ]
 
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: self.llm_client.invoke(messages, max_tokens=2048)
-            )
+            response = await self.llm_client.ainvoke(messages, max_tokens=2048)
             
             script = response.content if hasattr(response, 'content') else str(response)
             return script.strip()
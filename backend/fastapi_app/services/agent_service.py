@@ -11,6 +11,8 @@ from enum import Enum
 import traceback
 
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from config import settings
+from session_store import SessionStateStore
 from .tools_manager import tools_manager
 
 
@@ -82,6 +84,25 @@ class AgentMemory:
             context += "\n"
         
         return context
+    
+    def to_dict(self) -> Dict:
+        """Serialize memory to dictionary"""
+        return {
+            "session_id": self.session_id,
+            "max_history": self.max_history,
+            "thoughts": self.thoughts,
+            "actions": self.actions,
+            "observations": self.observations,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AgentMemory":
+        """Deserialize memory from dictionary"""
+        memory = cls(data["session_id"], data.get("max_history", 20))
+        memory.thoughts = data.get("thoughts", [])
+        memory.actions = data.get("actions", [])
+        memory.observations = data.get("observations", [])
+        return memory
 
 
 class ReasoningAgent:
@@ -97,27 +118,49 @@ class ReasoningAgent:
         """
         self.llm_client = llm_client
         self.embedding_model = embedding_model
-        self.session_memories: Dict[str, AgentMemory] = {}
+        self.session_memories = SessionStateStore(
+            "agent_memory",
+            serialize=lambda memory: json.dumps(memory.to_dict(), default=str),
+            deserialize=lambda data: AgentMemory.from_dict(json.loads(data)),
+            max_entries=settings.SESSION_STORE_MAX_ENTRIES,
+            idle_ttl=settings.SESSION_STORE_IDLE_TTL,
+            spill_path=settings.SESSION_STORE_PATH
+        )
         self.max_iterations = 10
         self.tools_manager = tools_manager
     
     def get_memory(self, session_id: str) -> AgentMemory:
         """Get or create memory for a session"""
-        if session_id not in self.session_memories:
-            self.session_memories[session_id] = AgentMemory(session_id)
-        return self.session_memories[session_id]
+        memory = self.session_memories.get(session_id)
+        if memory is None:
+            memory = AgentMemory(session_id)
+            self.session_memories[session_id] = memory
+        return memory
     
     def _parse_agent_response(self, response_text: str) -> Dict:
-        """Parse agent response for thought, action, and observation"""
+        """Parse agent response for thought and one or more actions"""
         lines = response_text.split("\n")
         
         thought = ""
-        action = None
-        action_params = {}
+        actions = []
         
         current_section = None
+        action = None
         action_text = ""
         
+        def flush_action():
+            if not action:
+                return
+            action_params = {}
+            if action_text:
+                try:
+                    action_params = json.loads(action_text)
+                except json.JSONDecodeError:
+                    action_params = {"raw": action_text}
+            if not isinstance(action_params, dict):
+                action_params = {"raw": action_params}
+            actions.append({"action": action, "action_params": action_params})
+        
         for line in lines:
             line = line.strip()
             
@@ -125,25 +168,23 @@ class ReasoningAgent:
                 current_section = "thought"
                 thought = line.replace("Thought:", "").strip()
             elif line.startswith("Action:"):
+                # Each Action line starts a new tool call; the previous one is complete
+                flush_action()
                 current_section = "action"
                 action = line.replace("Action:", "").strip()
+                action_text = ""
             elif line.startswith("Action Input:"):
                 current_section = "action_input"
                 action_text = line.replace("Action Input:", "").strip()
             elif current_section == "action_input":
                 action_text += line
-        
-        # Try to parse action_text as JSON
-        if action_text:
-            try:
-                action_params = json.loads(action_text)
-            except json.JSONDecodeError:
-                action_params = {"raw": action_text}
+        flush_action()
         
         return {
             "thought": thought,
-            "action": action,
-            "action_params": action_params
+            "action": actions[0]["action"] if actions else None,
+            "action_params": actions[0]["action_params"] if actions else {},
+            "actions": actions
         }
     
     def _build_system_prompt(self, session_id: str, learning_profile=None) -> str:
@@ -155,6 +196,7 @@ class ReasoningAgent:
         
         tools_descriptions = {
             # PRIMARY Search Tool (BEST - use first)
+            "web_search": "⚡ Web Search (PRIMARY) - Fastest answer from all configured search engines at once",
             "searchapi": "🎯 SearchApi (PRIMARY) - Best accuracy universal search API",
             
             # DEFAULT - Always active for search
@@ -179,7 +221,7 @@ class ReasoningAgent:
         }
         
         # Separate primary, default and conditional tools
-        primary_tools = ["searchapi"]
+        primary_tools = ["web_search", "searchapi"]
         default_tools = ["google_serper", "tavily_search", "duckduckgo", "brave_search", "wikipedia", "google_scholar", "arxiv", "youtube", "playwright"]
         conditional_tools = ["robocorp", "weather", "code_interpreter", "shell", "github", "wikidata", "matplotlib"]
         
@@ -231,7 +273,7 @@ Always available for search, browsing, and research:
 
 ## Your Reasoning Process
 1. **Analyze** the question type and what information is needed
-2. **Select Tools** - Try SearchApi first, fallback to default tools
+2. **Select Tools** - Try web_search first (use "mode": "merge" for broader coverage), fallback to default tools
 3. **Execute** tool calls to gather information
 4. **Synthesize** results into a coherent answer
 5. **Validate** information across sources
@@ -243,6 +285,8 @@ Thought: <Your reasoning about what to do next>
 Action: <The tool name to use>
 Action Input: <JSON with parameters>
 
+When you need several independent sources (e.g. Wikipedia, ArXiv and a web search), list up to {settings.AGENT_MAX_PARALLEL_ACTIONS} Action / Action Input pairs after one Thought. They run at the same time and all results come back together in the next turn.
+
 When you have enough information to answer, provide a comprehensive response matching the user's learning style.
 
 ## Memory Context
@@ -258,6 +302,7 @@ When you have enough information to answer, provide a comprehensive response mat
         try:
             memory = self.get_memory(session_id)
             memory.add_thought(message)
+            self.session_memories.mark_dirty(session_id)
             
             system_prompt = self._build_system_prompt(session_id, learning_profile)
             
@@ -270,21 +315,20 @@ When you have enough information to answer, provide a comprehensive response mat
             
             print(f"🧠 [Agent] Thinking about: {message[:50]}...")
             
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: self.llm_client.invoke(messages)
-            )
+            response = await self.llm_client.ainvoke(messages)
             
             parsed = self._parse_agent_response(response.content)
             
             print(f"💭 [Agent] Thought: {parsed['thought'][:100]}")
-            if parsed['action']:
-                print(f"🔧 [Agent] Action: {parsed['action']}")
+            if parsed['actions']:
+                print(f"🔧 [Agent] Actions: {', '.join(a['action'] for a in parsed['actions'])}")
             
             return {
                 "status": "success",
                 "thought": parsed["thought"],
                 "action": parsed["action"],
                 "action_params": parsed["action_params"],
+                "actions": parsed["actions"],
                 "full_response": response.content
             }
         
@@ -293,26 +337,67 @@ When you have enough information to answer, provide a comprehensive response mat
             traceback.print_exc()
             return {"status": "error", "error": str(e)}
     
-    async def execute_action(self, action: str, params: Dict) -> Dict:
+    async def execute_action(self, action: str, params: Dict, timeout: float = None) -> Dict:
         """
         Execute a tool action
         
         Args:
             action: Tool name to execute
             params: Parameters for the tool
+            timeout: Seconds to wait for the tool (defaults to AGENT_TOOL_TIMEOUT)
         
         Returns:
             Tool execution result
         """
+        timeout = timeout or settings.AGENT_TOOL_TIMEOUT
         try:
             print(f"🔧 [Agent] Executing action: {action}")
-            result = await self.tools_manager.use_tool(action, **params)
+            result = await asyncio.wait_for(self.tools_manager.use_tool(action, **params), timeout=timeout)
             print(f"✅ [Agent] Action completed: {action}")
             return result
+        except asyncio.TimeoutError:
+            print(f"⏱️ [Agent] Action timed out after {timeout}s: {action}")
+            return {"error": f"Tool timed out after {timeout} seconds", "action": action}
         except Exception as e:
             print(f"❌ Error executing action: {e}")
             return {"error": str(e), "action": action}
     
+    async def execute_actions(self, actions: List[Dict], timeout: float = None) -> List[Dict]:
+        """
+        Execute several tool actions concurrently
+        
+        Args:
+            actions: [{"action": tool name, "action_params": {...}}, ...]
+            timeout: Per-tool timeout in seconds
+        
+        Returns:
+            One result per action, in the same order
+        """
+        if len(actions) == 1:
+            return [await self.execute_action(actions[0]["action"], actions[0].get("action_params") or {}, timeout)]
+        print(f"⚡ [Agent] Executing {len(actions)} actions in parallel")
+        # execute_action never raises, so one failing tool cannot cancel the others
+        return await asyncio.gather(*[
+            self.execute_action(item["action"], item.get("action_params") or {}, timeout)
+            for item in actions
+        ])
+    
+    @staticmethod
+    def _plan_actions(actions: List[Dict]) -> List[Dict]:
+        """Drop repeated identical calls and cap how many tools run in one step"""
+        planned = []
+        seen = set()
+        for item in actions:
+            key = (item["action"], json.dumps(item.get("action_params") or {}, sort_keys=True, default=str))
+            if key in seen:
+                continue
+            seen.add(key)
+            planned.append(item)
+        if len(planned) > settings.AGENT_MAX_PARALLEL_ACTIONS:
+            print(f"⚠️ [Agent] {len(planned)} actions requested, running the first {settings.AGENT_MAX_PARALLEL_ACTIONS}")
+            planned = planned[:settings.AGENT_MAX_PARALLEL_ACTIONS]
+        return planned
+    
     async def reason_and_act(
         self,
         message: str,
@@ -353,7 +438,8 @@ When you have enough information to answer, provide a comprehensive response mat
                 "type": "thought",
                 "thought": think_result["thought"],
                 "action": think_result.get("action"),
-                "action_params": think_result.get("action_params")
+                "action_params": think_result.get("action_params"),
+                "actions": think_result.get("actions", [])
             })
             
             # Check if agent has decided to answer
@@ -368,29 +454,41 @@ When you have enough information to answer, provide a comprehensive response mat
             
             # Action phase
             if enable_tools:
-                action_result = await self.execute_action(
-                    think_result["action"],
-                    think_result.get("action_params", {})
+                actions = self._plan_actions(
+                    think_result.get("actions")
+                    or [{"action": think_result["action"], "action_params": think_result.get("action_params", {})}]
                 )
+                action_results = await self.execute_actions(actions)
                 
-                reasoning_chain.append({
-                    "iteration": iterations,
-                    "type": "action",
-                    "action": think_result["action"],
-                    "result": action_result
-                })
-                
-                # Add observation to memory
-                memory.add_observation({
-                    "source": think_result["action"],
-                    "content": json.dumps(action_result)[:500]
-                })
+                observations = []
+                # Fetched again: the memory may have been evicted while the tools ran
+                memory = self.get_memory(session_id)
+                for item, action_result in zip(actions, action_results):
+                    reasoning_chain.append({
+                        "iteration": iterations,
+                        "type": "action",
+                        "action": item["action"],
+                        "result": action_result
+                    })
+                    
+                    # Add observation to memory
+                    memory.add_observation({
+                        "source": item["action"],
+                        "content": json.dumps(action_result)[:500]
+                    })
+                    
+                    if "error" not in action_result:
+                        observations.append(f"Here's the result from using {item['action']}:\n{json.dumps(action_result)}")
+                    else:
+                        observations.append(f"The tool {item['action']} returned an error: {action_result['error']}")
+                self.session_memories.mark_dirty(session_id)
                 
-                # Continue reasoning with the result
-                if "error" not in action_result:
-                    current_message = f"Here's the result from using {think_result['action']}:\n{json.dumps(action_result)}\n\nNow, based on this information, please continue reasoning about the original question: {message}"
+                # Continue reasoning with every result in one turn
+                observation_text = "\n\n".join(observations)
+                if any("error" not in action_result for action_result in action_results):
+                    current_message = f"{observation_text}\n\nNow, based on this information, please continue reasoning about the original question: {message}"
                 else:
-                    current_message = f"The tool {think_result['action']} returned an error: {action_result['error']}\n\nPlease try a different approach or tool for: {message}"
+                    current_message = f"{observation_text}\n\nPlease try a different approach or tool for: {message}"
             else:
                 print(f"⚠️ [Agent] Tools disabled, returning current response")
                 return {
@@ -0,0 +1,190 @@
+"""
+Document Job Queue
+Runs document ingestion in background workers so uploads return immediately with a pollable job id
+"""
+
+import asyncio
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import httpx
+
+from config import settings
+
+
+class DocumentJobQueue:
+    """
+    In-process job queue for document ingestion.
+
+    Jobs are held in an asyncio.Queue and drained by a small pool of worker
+    tasks running on the app's event loop, so no external broker is needed.
+    Status is kept in memory; finished jobs are retained (oldest evicted
+    first) long enough for clients to poll them. A job submitted with a
+    callback_url also has its outcome POSTed there (retried with backoff),
+    so the caller learns about completion without polling.
+    """
+
+    # Job fields that are not returned to clients
+    _private_fields = ("user_id", "file_path", "callback_url", "callback_token")
+
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(self, rag_service, workers: int = None, retention: int = None):
+        self.rag_service = rag_service
+        self.workers = workers or settings.DOCUMENT_JOB_WORKERS
+        self.retention = retention or settings.DOCUMENT_JOB_RETENTION
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._callback_tasks = set()
+
+    def _ensure_workers(self):
+        """Start the workers on first use, inside the running event loop"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._worker_tasks = [task for task in self._worker_tasks if not task.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    def submit(
+        self,
+        file_path: str,
+        user_id,
+        session_id: str = None,
+        document_id: str = None,
+        callback_url: str = None,
+        callback_token: str = None
+    ) -> Dict:
+        """Queue a document for ingestion and return its job record"""
+        self._ensure_workers()
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "user_id": user_id,
+            "document_id": document_id,
+            "session_id": session_id,
+            "file_path": file_path,
+            "status": self.QUEUED,
+            "progress": 0.0,
+            "stats": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "callback_url": callback_url,
+            "callback_token": callback_token,
+        }
+        self.jobs[job_id] = job
+        self._evict_finished()
+        self._queue.put_nowait(job_id)
+        print(f"📥 [DocumentJobs] Queued job {job_id} for {file_path} ({self._queue.qsize()} waiting)")
+        return self.public_view(job)
+
+    def get(self, job_id: str, user_id=None) -> Optional[Dict]:
+        """Job status, or None if unknown (or owned by another user)"""
+        job = self.jobs.get(job_id)
+        if job is None or (user_id is not None and job["user_id"] != user_id):
+            return None
+        return self.public_view(job)
+
+    def public_view(self, job: Dict) -> Dict:
+        view = {key: value for key, value in job.items() if key not in self._private_fields}
+        if job["status"] == self.QUEUED:
+            queued = [job_id for job_id, other in self.jobs.items() if other["status"] == self.QUEUED]
+            view["queue_position"] = queued.index(job["job_id"]) + 1 if job["job_id"] in queued else None
+        return view
+
+    def stats(self) -> Dict:
+        counts = {self.QUEUED: 0, self.PROCESSING: 0, self.COMPLETED: 0, self.FAILED: 0}
+        for job in self.jobs.values():
+            counts[job["status"]] += 1
+        return {"workers": self.workers, **counts}
+
+    def _evict_finished(self):
+        finished = [
+            job_id for job_id, job in self.jobs.items()
+            if job["status"] in (self.COMPLETED, self.FAILED)
+        ]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Dict):
+        job["status"] = self.PROCESSING
+        job["started_at"] = time.time()
+
+        def on_progress(stats: Dict):
+            if stats.get("pages"):
+                job["progress"] = round(stats["pages_parsed"] / stats["pages"], 3)
+            job["stats"] = stats
+
+        try:
+            stats = await self.rag_service.process_document(
+                job["file_path"],
+                session_id=job["session_id"],
+                document_id=job["document_id"],
+                progress_callback=on_progress
+            )
+            if stats is None:
+                raise RuntimeError("Document processing failed")
+            job["stats"] = stats
+            job["progress"] = 1.0
+            job["status"] = self.COMPLETED
+            print(f"✅ [DocumentJobs] Job {job['job_id']} completed")
+        except Exception as e:
+            job["status"] = self.FAILED
+            job["error"] = str(e)
+            print(f"❌ [DocumentJobs] Job {job['job_id']} failed: {e}")
+            traceback.print_exc()
+        finally:
+            job["finished_at"] = time.time()
+        if job["callback_url"]:
+            # Retries must not hold up the next job, so the callback runs on its own
+            task = asyncio.create_task(self._notify(job))
+            self._callback_tasks.add(task)
+            task.add_done_callback(self._callback_tasks.discard)
+
+    async def _notify(self, job: Dict):
+        """POST the job outcome to its callback URL, retrying with backoff"""
+        payload = {
+            "token": job["callback_token"],
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "error": job["error"],
+        }
+        delay = 1.0
+        for attempt in range(1, settings.DOCUMENT_JOB_CALLBACK_ATTEMPTS + 1):
+            try:
+                async with httpx.AsyncClient(timeout=settings.DOCUMENT_JOB_CALLBACK_TIMEOUT) as client:
+                    response = await client.post(job["callback_url"], json=payload)
+                if response.status_code < 500:
+                    if response.status_code >= 400:
+                        print(f"⚠️ [DocumentJobs] Callback for job {job['job_id']} rejected ({response.status_code})")
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+            print(f"⚠️ [DocumentJobs] Callback for job {job['job_id']} failed (attempt {attempt}): {error}")
+            if attempt < settings.DOCUMENT_JOB_CALLBACK_ATTEMPTS:
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    def shutdown(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        self._worker_tasks = []
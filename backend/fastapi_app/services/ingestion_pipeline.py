@@ -0,0 +1,223 @@
+"""
+Ingestion Pipeline for RAG documents
+Parses PDF pages in a process pool and streams chunks to the embedder in fixed-size batches
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import settings
+
+
+def _pdf_metadata(reader, file_path: str) -> Dict:
+    """Document-level metadata in the same shape PyPDFLoader produces"""
+    metadata = {}
+    for key, value in (reader.metadata or {}).items():
+        metadata[str(key).lstrip("/").lower()] = str(value)
+    metadata["source"] = file_path
+    metadata["total_pages"] = len(reader.pages)
+    return metadata
+
+
+def _file_hash(file_path: str) -> str:
+    """SHA-256 of the file bytes, used to recognise re-uploads of the same PDF"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _count_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def _parse_page_range(file_path: str, start: int, end: int, chunk_size: int, chunk_overlap: int) -> List[Tuple[str, Dict]]:
+    """
+    Worker entry point: extract and split pages [start, end) of a PDF.
+    Runs in a separate process, so imports stay local.
+    """
+    from pypdf import PdfReader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    reader = PdfReader(file_path)
+    base_metadata = _pdf_metadata(reader, file_path)
+    try:
+        labels = reader.page_labels
+    except Exception:
+        labels = []
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    chunks = []
+    for page_number in range(start, min(end, len(reader.pages))):
+        text = reader.pages[page_number].extract_text() or ""
+        page_metadata = {
+            **base_metadata,
+            "page": page_number,
+            "page_label": labels[page_number] if page_number < len(labels) else str(page_number + 1),
+        }
+        # Splitting per page matches RecursiveCharacterTextSplitter.split_documents on PyPDFLoader pages
+        for piece in splitter.split_text(text):
+            chunks.append((piece, dict(page_metadata)))
+    return chunks
+
+
+class IngestionPipeline:
+    """Batched, multi-process ingestion of PDFs into the adaptive vector store"""
+
+    def __init__(self, vectorstore, workers: int = None, pages_per_task: int = None, batch_size: int = None):
+        self.vectorstore = vectorstore
+        self.workers = settings.INGESTION_WORKERS if workers is None else workers
+        self.pages_per_task = pages_per_task or settings.INGESTION_PAGES_PER_TASK
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Lazily start the parser pool; None means parse on the default thread pool"""
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            # spawn avoids forking a process that holds the event loop and model threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            print(f"🏭 [Ingestion] Started PDF parser pool with {self.workers} workers")
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def ingest_pdf(
+        self,
+        file_path: str,
+        extra_metadata: Optional[Dict] = None,
+        persist_path: Optional[str] = None,
+        progress_callback: Optional[Callable[[Dict], None]] = None
+    ) -> Dict:
+        """
+        Parse, split, embed and index a PDF.
+
+        A file whose bytes were ingested before is not parsed or embedded
+        again; its existing rows are linked to the new session/document.
+        Page ranges are parsed concurrently in the process pool while earlier
+        chunks are embedded in batches of batch_size and added to the store,
+        so vectors become searchable (and are appended to the WAL when
+        persist_path is given) before the whole file is done.
+
+        Returns per-job throughput stats.
+        """
+        loop = asyncio.get_event_loop()
+        pool = self._get_pool()
+        started = time.perf_counter()
+        extra_metadata = extra_metadata or {}
+
+        file_hash = await loop.run_in_executor(None, _file_hash, file_path)
+        reused = self.vectorstore.attach_file(file_hash, extra_metadata)
+        if reused is not None:
+            if persist_path:
+                await loop.run_in_executor(None, self.vectorstore.append_segment, persist_path)
+            elapsed = time.perf_counter() - started
+            stats = {
+                "file_path": file_path,
+                "file_hash": file_hash,
+                "deduplicated": True,
+                "pages": None,
+                "pages_parsed": 0,
+                "chunks": reused,
+                "unique_chunks": reused,
+                "batches": 0,
+                "embed_seconds": 0.0,
+                "seconds": elapsed,
+                "pages_per_sec": 0.0,
+                "chunks_per_sec": reused / elapsed if elapsed > 0 else 0.0,
+            }
+            if progress_callback:
+                progress_callback(dict(stats))
+            print(f"♻️ [Ingestion] {file_path} matches an ingested file, reused {reused} chunks")
+            return stats
+
+        total_pages = await loop.run_in_executor(pool, _count_pages, file_path)
+        ranges = [
+            (start, min(start + self.pages_per_task, total_pages))
+            for start in range(0, total_pages, self.pages_per_task)
+        ]
+        print(f"📄 [Ingestion] {file_path}: {total_pages} pages in {len(ranges)} parse tasks")
+
+        # Submit every range up front; results are consumed in page order
+        parse_futures = [
+            loop.run_in_executor(
+                pool, _parse_page_range, file_path, start, end,
+                settings.CHUNK_SIZE, settings.CHUNK_OVERLAP
+            )
+            for start, end in ranges
+        ]
+
+        stats = {
+            "file_path": file_path,
+            "file_hash": file_hash,
+            "deduplicated": False,
+            "pages": total_pages,
+            "pages_parsed": 0,
+            "chunks": 0,
+            "unique_chunks": 0,
+            "batches": 0,
+            "embed_seconds": 0.0,
+        }
+        batch: List[Tuple[str, Dict]] = []
+        file_rows: List[int] = []
+
+        async def flush():
+            if not batch:
+                return
+            texts = [text for text, _ in batch]
+            metadatas = [{**metadata, **extra_metadata} for _, metadata in batch]
+            batch.clear()
+            embed_started = time.perf_counter()
+            # Embedding runs unlocked; the store appends each batch (and searches
+            # read the index) under its lock, so a batch becomes visible all at once
+            rows = await loop.run_in_executor(None, self.vectorstore.add_documents, texts, metadatas)
+            file_rows.extend(rows)
+            if persist_path:
+                await loop.run_in_executor(None, self.vectorstore.append_segment, persist_path)
+            stats["embed_seconds"] += time.perf_counter() - embed_started
+            stats["chunks"] += len(texts)
+            stats["batches"] += 1
+
+        try:
+            for (start, end), future in zip(ranges, parse_futures):
+                for chunk in await future:
+                    batch.append(chunk)
+                    if len(batch) >= self.batch_size:
+                        await flush()
+                stats["pages_parsed"] += end - start
+                if progress_callback:
+                    progress_callback(dict(stats))
+            await flush()
+            stats["unique_chunks"] = len(set(file_rows))
+            self.vectorstore.register_file(file_hash, file_rows)
+            if persist_path:
+                await loop.run_in_executor(None, self.vectorstore.append_segment, persist_path)
+        except BaseException:
+            for future in parse_futures:
+                future.cancel()
+            raise
+
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = elapsed
+        stats["pages_per_sec"] = total_pages / elapsed if elapsed > 0 else 0.0
+        stats["chunks_per_sec"] = stats["chunks"] / elapsed if elapsed > 0 else 0.0
+        if progress_callback:
+            progress_callback(dict(stats))
+        print(
+            f"⚡ [Ingestion] {total_pages} pages, {stats['chunks']} chunks in {elapsed:.1f}s "
+            f"({stats['pages_per_sec']:.1f} pages/s, {stats['chunks_per_sec']:.1f} chunks/s)"
+        )
+        return stats
@@ -0,0 +1,138 @@
+"""
+Django Profile Sync for RAG chat
+Fetches users' ILS dimensions from Django over a pooled client, with a per-user TTL cache
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from config import settings
+
+
+class DjangoProfileSync:
+    """
+    Cached lookups of a user's ILS data in Django.
+
+    Answers are cached per user: ILS dimensions for PROFILE_SYNC_TTL and
+    "no ILS data" (or a failed request) for PROFILE_SYNC_NEGATIVE_TTL, so a
+    user without questionnaire data costs one round trip per window instead
+    of one per chat message. Concurrent lookups for the same user share one
+    request. Django pushes fresh data through invalidate() when a
+    questionnaire is saved.
+    """
+
+    # Cached users kept before expired entries are pruned
+    max_entries = 10000
+
+    def __init__(self, base_url: str = None, ttl: float = None, negative_ttl: float = None, timeout: float = None):
+        self.base_url = (base_url or settings.DJANGO_BACKEND_URL).rstrip("/")
+        self.ttl = settings.PROFILE_SYNC_TTL if ttl is None else ttl
+        self.negative_ttl = settings.PROFILE_SYNC_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.timeout = timeout or settings.PROFILE_SYNC_TIMEOUT
+        self._client: Optional[httpx.AsyncClient] = None
+        # user_id -> (expires_at, ils_data or None)
+        self._cache: Dict[str, tuple] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.negative_hits = 0
+        self.fetches = 0
+        self.failures = 0
+        self.pushes = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_ils_data(self, user_id: str) -> Optional[Dict]:
+        """ILS dimensions on Django's -11..11 scale, or None if the user has none"""
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            if cached[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return cached[1]
+
+        inflight = self._inflight.get(user_id)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            ils_data = await self._fetch(user_id)
+            future.set_result(ils_data)
+            return ils_data
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters get the error; mark it retrieved in case there are none
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[user_id]
+
+    async def _fetch(self, user_id: str) -> Optional[Dict]:
+        self.fetches += 1
+        url = f"{self.base_url}/api/accounts/profile-data/"
+        try:
+            response = await self._get_client().get(url, params={"user_id": user_id})
+        except httpx.HTTPError as e:
+            self.failures += 1
+            print(f"⚠️ [ProfileSync] Django unreachable for user {user_id}: {e}")
+            self._remember(user_id, None)
+            return None
+        if response.status_code != 200:
+            self.failures += 1
+            print(f"⚠️ [ProfileSync] Failed to sync from Django ({response.status_code}): {response.text[:200]}")
+            self._remember(user_id, None)
+            return None
+        # Expecting ILS dimensions in -11 to 11 scale
+        # e.g., {"active_reflective": 1, "sensing_intuitive": -3, ...}
+        ils_data = response.json().get("ils_data") or None
+        if ils_data is None:
+            print(f"⚠️ [ProfileSync] No ILS data found in Django profile for user {user_id}")
+        self._remember(user_id, ils_data)
+        return ils_data
+
+    def _remember(self, user_id: str, ils_data: Optional[Dict]):
+        ttl = self.ttl if ils_data else self.negative_ttl
+        self._cache[user_id] = (time.monotonic() + ttl, ils_data)
+        # Drop expired entries once the cache grows, so it stays proportional to active users
+        if len(self._cache) > self.max_entries:
+            now = time.monotonic()
+            self._cache = {key: entry for key, entry in self._cache.items() if entry[0] > now}
+
+    def invalidate(self, user_id: str, ils_data: Optional[Dict] = None):
+        """Forget a user's cached answer, or replace it with data pushed by Django"""
+        self.pushes += 1
+        if ils_data:
+            self._remember(user_id, ils_data)
+        else:
+            self._cache.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        live = [entry for entry in self._cache.values() if entry[0] > now]
+        return {
+            "cached_users": sum(1 for entry in live if entry[1] is not None),
+            "negative_cached_users": sum(1 for entry in live if entry[1] is None),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "fetches": self.fetches,
+            "failures": self.failures,
+            "pushes": self.pushes,
+        }
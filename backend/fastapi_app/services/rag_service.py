@@ -1,20 +1,44 @@
 import os
 import asyncio
-from typing import Dict, List, Optional
+import threading
+from typing import AsyncIterator, Dict, List, Optional
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages import messages_from_dict, messages_to_dict
 from llm_model import LLM_Model
 from config import settings
 from adaptive_learning import ILSLearningProfile, AdaptiveSystemPromptGenerator, AdaptiveFAISSVectorStore
+from embedding_cache import CachedEmbeddings
+from answer_cache import SemanticAnswerCache
+from conversation_context import ConversationContextManager, TokenCounter
+from session_store import SessionStateStore
 from .agent_service import ReasoningAgent
+from .ingestion_pipeline import IngestionPipeline
+from .profile_sync import DjangoProfileSync
 import json
 import traceback
-import httpx
+
+
+def _history_to_json(history: BaseChatMessageHistory) -> str:
+    return json.dumps(messages_to_dict(history.messages))
+
+
+def _history_from_json(data: str) -> BaseChatMessageHistory:
+    return ChatMessageHistory(messages=messages_from_dict(json.loads(data)))
+
+
+def _session_store(name: str, serialize, deserialize, spill_path: Optional[str] = None, on_evict=None) -> SessionStateStore:
+    return SessionStateStore(
+        name,
+        serialize=serialize,
+        deserialize=deserialize,
+        max_entries=settings.SESSION_STORE_MAX_ENTRIES,
+        idle_ttl=settings.SESSION_STORE_IDLE_TTL,
+        spill_path=spill_path or settings.SESSION_STORE_PATH,
+        on_evict=on_evict
+    )
 
 
 class RAGService:
@@ -23,27 +47,65 @@ class RAGService:
         self.llm = None
         self.embedding_model = None
         self.vectorstore = None
-        self.session_histories = {}
-        self.learning_profiles = {}  # session_id -> ILSLearningProfile
+        self.ingestion_pipeline = None
+        self.answer_cache = None
+        self.context_manager = None
+        # Per-session state is bounded in memory; evicted sessions spill to SQLite
+        self.session_histories = _session_store(
+            "chat_history", _history_to_json, _history_from_json, on_evict=self._on_history_evicted
+        )
+        # session_id -> rolling summary of the folded turns, kept alongside the history
+        self.conversation_summaries = _session_store("conversation_summary", json.dumps, json.loads)
+        # Profiles are always persisted, one upserted row each, in their own database
+        self.learning_profiles = _session_store(  # session_id -> ILSLearningProfile
+            "learning_profiles",
+            lambda profile: json.dumps(profile.to_dict(), default=str),
+            lambda data: ILSLearningProfile.from_dict(json.loads(data)),
+            spill_path=settings.LEARNING_PROFILES_PATH
+        )
+        self._profile_flush_task = None
+        self._session_flush_task = None
+        self.profile_sync = DjangoProfileSync()
         self.prompt_generator = AdaptiveSystemPromptGenerator()
         self.agent = None  # Will be initialized with RAG service
+        self._compaction_task = None
         self._initialized = False
 
     async def initialize(self):
         if self._initialized:
             return
         try:
-            self.llm = LLM_Model().get_client()
-            self.embedding_model = HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+            llm_model = LLM_Model()
+            self.llm = llm_model.get_client()
+            self.context_manager = ConversationContextManager(
+                self.llm,
+                TokenCounter(llm_model.backend, getattr(llm_model, "tokenizer", None)),
+                summaries=self.conversation_summaries
+            )
+            self.embedding_model = CachedEmbeddings(
+                HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL),
+                model_name=settings.EMBEDDING_MODEL,
+                max_entries=settings.EMBEDDING_CACHE_SIZE,
+                disk_path=settings.EMBEDDING_CACHE_PATH
+            )
             self.vectorstore = AdaptiveFAISSVectorStore(self.embedding_model)
-            self.vectorstore.load_index("data/vectorstore")
+            self.vectorstore.load_index(settings.VECTORSTORE_PATH)
+            self.ingestion_pipeline = IngestionPipeline(self.vectorstore)
+            if settings.ANSWER_CACHE_ENABLED:
+                self.answer_cache = SemanticAnswerCache(
+                    threshold=settings.ANSWER_CACHE_THRESHOLD,
+                    max_entries=settings.ANSWER_CACHE_SIZE,
+                    ttl_seconds=settings.ANSWER_CACHE_TTL
+                )
             
             # Initialize reasoning agent
             self.agent = ReasoningAgent(self.llm, self.embedding_model)
             
-            # Load learning profiles if they exist
+            # Profiles load lazily from their store; only a legacy JSON file is imported here
             self._load_learning_profiles()
             
+            self._session_flush_task = asyncio.get_running_loop().create_task(self._flush_session_state_periodically())
+            
             self._initialized = True
             print("✅ RAG Service initialized successfully with ILS adaptive learning and Agent!")
         except Exception as e:
@@ -51,80 +113,151 @@ class RAGService:
             raise
 
     def _load_learning_profiles(self):
-        """Load saved learning profiles"""
+        """One-time import of the legacy whole-file JSON profiles into the profile store"""
         profile_path = "data/learning_profiles.json"
         if os.path.exists(profile_path):
             try:
                 with open(profile_path, 'r') as f:
                     profiles_data = json.load(f)
-                for session_id, profile_data in profiles_data.items():
-                    self.learning_profiles[session_id] = ILSLearningProfile.from_dict(profile_data)
-                print(f"✅ Loaded {len(self.learning_profiles)} learning profiles")
+                imported = self.learning_profiles.import_serialized({
+                    session_id: json.dumps(profile_data)
+                    for session_id, profile_data in profiles_data.items()
+                })
+                os.replace(profile_path, f"{profile_path}.migrated")
+                print(f"✅ Imported {imported} learning profiles from {profile_path}")
             except Exception as e:
-                print(f"⚠️ Could not load learning profiles: {e}")
+                print(f"⚠️ Could not import learning profiles: {e}")
 
-    def _save_learning_profiles(self):
-        """Save learning profiles to disk"""
-        os.makedirs("data", exist_ok=True)
-        profile_path = "data/learning_profiles.json"
+    def _save_learning_profile(self, session_id: str):
+        """
+        Queue a changed profile for saving. Writes are coalesced: every
+        profile queued within PROFILE_SAVE_DELAY is upserted in one transaction.
+        """
+        self.learning_profiles.mark_dirty(session_id)
+        if self._profile_flush_task is not None and not self._profile_flush_task.done():
+            return
         try:
-            profiles_data = {
-                session_id: profile.to_dict() 
-                for session_id, profile in self.learning_profiles.items()
-            }
-            with open(profile_path, 'w') as f:
-                json.dump(profiles_data, f, indent=2)
-        except Exception as e:
-            print(f"⚠️ Could not save learning profiles: {e}")
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.learning_profiles.flush_dirty()
+            return
+        self._profile_flush_task = loop.create_task(self._flush_learning_profiles())
+
+    async def _flush_learning_profiles(self):
+        await asyncio.sleep(settings.PROFILE_SAVE_DELAY)
+        written = self.learning_profiles.flush_dirty()
+        if written:
+            print(f"💾 [RAG Service] Saved {written} learning profiles")
+
+    def _session_stores(self) -> List[SessionStateStore]:
+        stores = [self.session_histories, self.conversation_summaries, self.learning_profiles]
+        if self.agent:
+            stores.append(self.agent.session_memories)
+        return stores
+
+    def flush_session_state(self) -> int:
+        """Write every changed session to disk and evict idle ones; returns rows written"""
+        written = 0
+        for store in self._session_stores():
+            written += store.flush_dirty()
+            store.sweep()
+        return written
+
+    async def _flush_session_state_periodically(self):
+        # Bounds what a crash can lose to one interval of changes
+        while True:
+            await asyncio.sleep(settings.SESSION_STORE_FLUSH_INTERVAL)
+            try:
+                written = self.flush_session_state()
+                if written:
+                    print(f"💾 [RAG Service] Saved {written} changed sessions")
+            except Exception as e:
+                print(f"⚠️ [RAG Service] Could not save session state: {e}")
+
+    def close_session_state(self):
+        """Stop the periodic flush and write every resident session, e.g. before shutdown"""
+        if self._session_flush_task is not None:
+            self._session_flush_task.cancel()
+        for store in self._session_stores():
+            store.flush()
 
     def get_or_create_learning_profile(self, session_id: str) -> ILSLearningProfile:
         """Get existing profile or create new one"""
-        if session_id not in self.learning_profiles:
-            self.learning_profiles[session_id] = ILSLearningProfile(session_id)
-        return self.learning_profiles[session_id]
+        profile = self.learning_profiles.get(session_id)
+        if profile is None:
+            profile = ILSLearningProfile(session_id)
+            self.learning_profiles[session_id] = profile
+        return profile
 
-    async def process_document(self, file_path: str, session_id: str = None, document_id: str = None) -> bool:
+    async def process_document(
+        self,
+        file_path: str,
+        session_id: str = None,
+        document_id: str = None,
+        progress_callback=None
+    ) -> Optional[Dict]:
+        """
+        Ingest a PDF through the batched pipeline.
+        Returns the job's throughput stats, or None if processing failed.
+        """
         try:
-            loader = PyPDFLoader(file_path)
-            docs = await asyncio.get_event_loop().run_in_executor(None, loader.load)
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=settings.CHUNK_SIZE,
-                chunk_overlap=settings.CHUNK_OVERLAP,
+            extra_metadata = {}
+            if session_id:
+                extra_metadata['session_id'] = session_id
+            if document_id:
+                extra_metadata['document_id'] = document_id
+            os.makedirs(os.path.dirname(settings.VECTORSTORE_PATH) or ".", exist_ok=True)
+            # Batches are appended to the WAL as they are embedded; the full
+            # snapshot is rewritten by background compaction
+            stats = await self.ingestion_pipeline.ingest_pdf(
+                file_path,
+                extra_metadata=extra_metadata,
+                persist_path=settings.VECTORSTORE_PATH,
+                progress_callback=progress_callback
             )
-            chunks = text_splitter.split_documents(docs)
-            texts = [chunk.page_content for chunk in chunks]
-            # Add session_id and document_id to metadata
-            metadatas = []
-            for chunk in chunks:
-                metadata = chunk.metadata.copy()
-                if session_id:
-                    metadata['session_id'] = session_id
-                if document_id:
-                    metadata['document_id'] = document_id
-                metadatas.append(metadata)
-            self.vectorstore.add_documents(texts, metadatas)
-            os.makedirs("data", exist_ok=True)
-            self.vectorstore.save_index("data/vectorstore")
+            self._schedule_compaction()
+            if self.answer_cache and document_id:
+                self.answer_cache.invalidate_documents([document_id])
             print(f"✅ Processed document: {file_path} (session_id: {session_id}, document_id: {document_id})")
-            print(f"   📊 Added {len(texts)} chunks to vectorstore. Total documents in store: {len(self.vectorstore.documents)}")
+            print(f"   📊 Added {stats['chunks']} chunks to vectorstore. Total documents in store: {len(self.vectorstore.documents)}")
             # Verify metadata was added correctly
             if len(self.vectorstore.documents) > 0:
                 last_doc = self.vectorstore.documents[-1]
                 print(f"   🔍 Last document metadata check: session_id={last_doc.get('metadata', {}).get('session_id')}, document_id={last_doc.get('metadata', {}).get('document_id')}")
-            return True
+            return stats
         except Exception as e:
             print(f"❌ Error processing document {file_path}: {e}")
             traceback.print_exc()
-            return False
+            return None
+
+    def _schedule_compaction(self):
+        """Compact the vectorstore WAL in the background once it has grown enough"""
+        if not self.vectorstore.needs_compaction():
+            return
+        if self._compaction_task and not self._compaction_task.done():
+            return
+        print(f"🗜️ [RAG Service] Scheduling background vectorstore compaction")
+        self._compaction_task = asyncio.get_event_loop().run_in_executor(
+            None, self.vectorstore.compact, settings.VECTORSTORE_PATH
+        )
 
     def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
-        if session_id not in self.session_histories:
-            self.session_histories[session_id] = ChatMessageHistory()
-        return self.session_histories[session_id]
+        history = self.session_histories.get(session_id)
+        if history is None:
+            history = ChatMessageHistory()
+            self.session_histories[session_id] = history
+        return history
+
+    def _on_history_evicted(self, session_id: str):
+        # A spilled history comes back with its summary; a dropped one takes the summary with it
+        if self.context_manager and not self.session_histories.spilling:
+            self.context_manager.forget(session_id)
 
     def clear_session_history(self, session_id: str):
         if session_id in self.session_histories:
             del self.session_histories[session_id]
+        if self.context_manager:
+            self.context_manager.forget(session_id)
     
     def _is_response_incomplete(self, response_text: str) -> bool:
         """Check if response appears to be incomplete/cut off"""
@@ -214,180 +347,8 @@ class RAGService:
             use_adaptive_learning: Whether to use ILS-based adaptation (default: True)
         """
         try:
-            if not self._initialized:
-                await self.initialize()
-            
-            # Get or create learning profile
-            print(f"👤 [RAG Service] Getting/creating learning profile for session: {session_id}")
-            learning_profile = self.get_or_create_learning_profile(session_id)
-            
-            # Analyze user message for learning patterns
-            if use_adaptive_learning:
-                print(f"🧠 [RAG Service] Using adaptive learning - analyzing message patterns")
-                indicators = learning_profile.analyze_message_patterns(message)
-                learning_profile.update_from_interaction(indicators)
-                learning_style = learning_profile.get_learning_style()
-                print(f"✅ [RAG Service] Learning style determined: {learning_style}")
-            else:
-                print(f"ℹ️ [RAG Service] Adaptive learning disabled")
-                learning_style = {}
-            
-            # Retrieve relevant context with adaptive ranking
-            # Filter by session_id and document_ids if provided
-            print(f"🔍 Searching for context - session_id: {session_id}, document_ids: {document_ids}")
-            
-            if use_adaptive_learning and learning_style:
-                context_docs = self.vectorstore.adaptive_similarity_search(
-                    message, learning_style, k=settings.TOP_K,
-                    session_id=session_id, document_ids=document_ids
-                )
-            else:
-                context_docs = self.vectorstore.similarity_search(
-                    message, k=settings.TOP_K,
-                    session_id=session_id, document_ids=document_ids
-                )
-            
-            print(f"📄 Found {len(context_docs)} context documents")
-            if len(context_docs) == 0:
-                print(f"⚠️ No documents found! This might mean:")
-                print(f"   - Documents haven't been processed yet")
-                print(f"   - Documents don't have matching session_id or document_id metadata")
-                print(f"   - Vectorstore might be empty")
-            
-            # Prioritize content from uploaded documents
-            # Separate documents by priority (uploaded vs other)
-            uploaded_docs_content = []
-            other_docs_content = []
-            
-            for doc in context_docs:
-                metadata = doc.get("metadata", {})
-                doc_id = metadata.get("document_id")
-                # Check if this document is in the provided document_ids (uploaded document)
-                if document_ids and len(document_ids) > 0 and doc_id in document_ids:
-                    uploaded_docs_content.append(doc["content"])
-                    print(f"✅ Found uploaded document content (doc_id: {doc_id})")
-                else:
-                    other_docs_content.append(doc["content"])
-                    print(f"📚 Found other document content (doc_id: {doc_id})")
-            
-            # Build context with priority: uploaded documents first, then others
-            if uploaded_docs_content:
-                primary_context = "\n\n".join(uploaded_docs_content)
-                if other_docs_content:
-                    secondary_context = "\n\n".join(other_docs_content)
-                    context = f"PRIMARY CONTEXT (from uploaded documents - use this as the main source):\n{primary_context}\n\nADDITIONAL CONTEXT (for reference only):\n{secondary_context}"
-                else:
-                    context = primary_context
-            elif context_docs:
-                # If no uploaded docs but we have context, use all of it
-                context = "\n\n".join([doc["content"] for doc in context_docs])
-            else:
-                # No context found - this is a problem
-                context = ""
-                print(f"❌ ERROR: No context documents found for query: {message}")
-                print(f"   This means the document might not be processed or indexed correctly")
-            
-            # Generate adaptive system prompt
-            print(f"📝 [RAG Service] Generating system prompt")
-            if not context:
-                # No context available - tell user the document might not be processed
-                print(f"   ⚠️ No context available - using fallback prompt")
-                system_content = (
-                    "You are an intelligent chatbot. "
-                    "The user is asking about a document, but the document content is not available in the system. "
-                    "This might mean the document hasn't been processed yet or there was an error processing it. "
-                    "Please inform the user that the document needs to be processed first, or ask them to re-upload it."
-                )
-            elif use_adaptive_learning:
-                print(f"   🎨 Using adaptive learning prompt generator")
-                system_content = self.prompt_generator.generate_prompt(learning_profile, context)
-            else:
-                print(f"   📄 Using standard prompt")
-                priority_instruction = ""
-                if document_ids and len(document_ids) > 0:
-                    priority_instruction = "IMPORTANT: Base your answer primarily on the PRIMARY CONTEXT section (from the uploaded documents). Use the ADDITIONAL CONTEXT only for supplementary information if needed. "
-                
-                system_content = (
-                    "You are an intelligent chatbot with strong reasoning abilities. "
-                    f"{priority_instruction}"
-                    "Use the following context to answer the question. Think step by step and provide clear reasoning. "
-                    "If you don't know the answer based on the context, say that you don't know.\n\n"
-                    f"Context:\n{context}\n\n"
-                )
-            
-            # Build conversation history
-            print(f"💬 [RAG Service] Building conversation history")
-            history = self.get_session_history(session_id)
-            print(f"   📚 History contains {len(history.messages)} previous messages")
-            lc_messages = [SystemMessage(content=system_content)]
-            
-            for msg in history.messages:
-                if msg.type == "human":
-                    lc_messages.append(HumanMessage(content=msg.content))
-                else:
-                    lc_messages.append(AIMessage(content=msg.content))
-            
-            lc_messages.append(HumanMessage(content=message))
-            print(f"   📝 Total messages to LLM: {len(lc_messages)}")
-            
-            # Run the LLM
-            print(f"🤖 [RAG Service] Invoking LLM to generate response (max_tokens: {settings.MAX_TOKENS})")
-            try:
-                print(f"   LLM backend: {self.llm}")
-                print(f"   Attempting to invoke LLM...")
-                response = await asyncio.get_event_loop().run_in_executor(
-                    None, lambda: self.llm.invoke(lc_messages, max_tokens=settings.MAX_TOKENS)
-                )
-                print(f"✅ [RAG Service] LLM response generated (length: {len(response.content)} chars)")
-            except AttributeError as e:
-                print(f"❌ [RAG Service] LLM object doesn't have invoke method: {str(e)}")
-                print(f"   LLM type: {type(self.llm)}")
-                print(f"   LLM attributes: {dir(self.llm)}")
-                raise Exception(f"LLM not properly initialized: {str(e)}")
-            except Exception as e:
-                print(f"❌ [RAG Service] LLM invocation failed: {str(e)}")
-                print(f"   Exception type: {type(e).__name__}")
-                raise
-            
-            # Check if response seems incomplete (ends with incomplete sentence or seems cut off)
-            is_incomplete = self._is_response_incomplete(response.content)
-            if is_incomplete:
-                print(f"⚠️ [RAG Service] Response appears incomplete - may need continuation")
-            
-            # Save to history
-            history.add_user_message(message)
-            history.add_ai_message(response.content)
-            print(f"💾 [RAG Service] Conversation history updated")
-            
-            # Save learning profiles periodically
-            if learning_profile.total_interactions % 5 == 0:
-                print(f"💾 [RAG Service] Saving learning profiles (periodic save)")
-                self._save_learning_profiles()
-            
-            # Calculate confidence score
-            confidence_score = self._calculate_confidence_score(context_docs, context)
-            print(f"📊 [Confidence Score] {confidence_score:.2f} for query: {message[:50]}...")
-            
-            return {
-                "answer": response.content,
-                "is_incomplete": is_incomplete,
-                "context": [
-                    {
-                        "content": doc["content"][:200] + "..." if len(doc["content"]) > 200 else doc["content"],
-                        "metadata": doc.get("metadata", {}),
-                        "score": doc.get("combined_score", doc.get("score", 0)),
-                    }
-                    for doc in context_docs
-                ],
-                "confidence_score": confidence_score,
-                "learning_style": learning_style if use_adaptive_learning else None,
-                "learning_profile_summary": {
-                    "dimensions": learning_profile.dimensions,
-                    "total_interactions": learning_profile.total_interactions,
-                    "detected_style": learning_style
-                } if use_adaptive_learning else None
-            }
-            
+            retrieval = await self.retrieve(message, session_id, document_ids, use_adaptive_learning)
+            return await self.generate(retrieval, message)
         except Exception as e:
             print(f"❌ Error in chat processing: {e}")
             traceback.print_exc()
@@ -397,16 +358,388 @@ class RAGService:
                 "learning_style": None
             }
 
+    async def retrieve(
+        self,
+        message: str,
+        session_id: str,
+        document_ids: Optional[List[str]] = None,
+        use_adaptive_learning: bool = True
+    ) -> Dict:
+        """
+        Retrieval stage of chat(): update the learning profile, fetch context
+        and build the prompt, without calling the LLM.
+
+        The returned dict carries "confidence_score" so callers can route
+        low-confidence queries elsewhere before paying for a generation, and
+        can be passed to generate() or chat_stream() to finish the answer.
+        """
+        if not self._initialized:
+            await self.initialize()
+        
+        retrieval = await self._prepare_chat(message, session_id, document_ids, use_adaptive_learning)
+        retrieval["confidence_score"] = self._calculate_confidence_score(retrieval["context_docs"], retrieval["context"])
+        print(f"📊 [Confidence Score] {retrieval['confidence_score']:.2f} for query: {message[:50]}...")
+        retrieval["document_ids"] = document_ids or []
+        retrieval["cache_scope"] = self._answer_cache_scope(
+            session_id, document_ids, retrieval["learning_style"] if use_adaptive_learning else {},
+            retrieval["history"].messages
+        )
+        return retrieval
+
+    def _answer_cache_scope(
+        self,
+        session_id: str,
+        document_ids: Optional[List[str]],
+        learning_style: Dict,
+        history_messages: List
+    ):
+        """
+        Answers are shared only between questions that could see exactly the
+        same chunks and get the same learning-style treatment. The row
+        fingerprint means two students who uploaded the same textbook share a
+        scope, and adding a document to the filter moves it to a new one.
+        Follow-up questions ("what about the second one?") depend on the
+        conversation, so only a session's opening question is cached.
+        """
+        if self.answer_cache is None or history_messages:
+            return None
+        fingerprint = self.vectorstore.filter_fingerprint(session_id, document_ids)
+        if fingerprint is None:
+            return None
+        return (fingerprint, tuple(sorted((learning_style or {}).items())))
+
+    def _cached_answer(self, retrieval: Dict, message: str) -> Optional[Dict]:
+        if retrieval.get("cache_scope") is None or not retrieval["context"]:
+            return None
+        # The query embedding was computed during retrieval, so this is an embedding-cache hit
+        retrieval["query_vector"] = self.embedding_model.embed_query(message)
+        cached = self.answer_cache.lookup(retrieval["cache_scope"], retrieval["query_vector"])
+        if cached is not None:
+            print(f"⚡ [AnswerCache] Reusing cached answer (similarity {cached['cache_similarity']:.3f})")
+        return cached
+
+    def _remember_answer(self, retrieval: Dict, result: Dict):
+        if retrieval.get("query_vector") is None or result.get("is_incomplete"):
+            return
+        self.answer_cache.store(
+            retrieval["cache_scope"],
+            retrieval["query_vector"],
+            {"answer": result["answer"]},
+            document_ids=retrieval["document_ids"]
+        )
+
+    async def generate(self, retrieval: Dict, message: str) -> Dict:
+        """Generation stage of chat(): answer from a retrieve() result"""
+        cached = self._cached_answer(retrieval, message)
+        if cached is not None:
+            return {**self._finish_chat(retrieval, message, cached["answer"]), "cached": True}
+        
+        lc_messages = retrieval["lc_messages"]
+        
+        # Run the LLM
+        print(f"🤖 [RAG Service] Invoking LLM to generate response (max_tokens: {settings.MAX_TOKENS})")
+        try:
+            print(f"   LLM backend: {self.llm}")
+            print(f"   Attempting to invoke LLM...")
+            response = await self.llm.ainvoke(lc_messages, max_tokens=settings.MAX_TOKENS)
+            print(f"✅ [RAG Service] LLM response generated (length: {len(response.content)} chars)")
+        except AttributeError as e:
+            print(f"❌ [RAG Service] LLM object doesn't have invoke method: {str(e)}")
+            print(f"   LLM type: {type(self.llm)}")
+            print(f"   LLM attributes: {dir(self.llm)}")
+            raise Exception(f"LLM not properly initialized: {str(e)}")
+        except Exception as e:
+            print(f"❌ [RAG Service] LLM invocation failed: {str(e)}")
+            print(f"   Exception type: {type(e).__name__}")
+            raise
+        
+        result = self._finish_chat(retrieval, message, response.content)
+        self._remember_answer(retrieval, result)
+        return {**result, "cached": False}
+
+    async def chat_stream(
+        self,
+        message: str,
+        session_id: str,
+        document_ids: Optional[List[str]] = None,
+        use_adaptive_learning: bool = True,
+        retrieval: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of chat().
+
+        Yields a "context" event once retrieval is done, a "token" event for
+        each piece of text the LLM produces, and a final "done" event carrying
+        the same fields chat() returns. History and learning profiles are only
+        updated once the answer is complete. Pass a retrieve() result as
+        retrieval to skip the retrieval stage.
+        """
+        prepared = retrieval or await self.retrieve(message, session_id, document_ids, use_adaptive_learning)
+        yield {
+            "type": "context",
+            "context": self.summarize_context(prepared["context_docs"]),
+            "confidence_score": prepared["confidence_score"],
+        }
+        
+        cached = self._cached_answer(prepared, message)
+        if cached is not None:
+            yield {"type": "token", "content": cached["answer"]}
+            yield {"type": "done", **self._finish_chat(prepared, message, cached["answer"]), "cached": True}
+            return
+        
+        print(f"🤖 [RAG Service] Streaming LLM response (max_tokens: {settings.MAX_TOKENS})")
+        pieces = []
+        async for piece in self._stream_llm(prepared["lc_messages"]):
+            pieces.append(piece)
+            yield {"type": "token", "content": piece}
+        answer = "".join(pieces).strip()
+        print(f"✅ [RAG Service] LLM response streamed (length: {len(answer)} chars)")
+        
+        result = self._finish_chat(prepared, message, answer)
+        self._remember_answer(prepared, result)
+        yield {"type": "done", **result, "cached": False}
+
+    async def _stream_llm(self, lc_messages) -> AsyncIterator[str]:
+        """
+        Yield generated text as it arrives, preferring the backend's native
+        astream(); blocking stream() generators are bridged through a thread
+        """
+        if hasattr(self.llm, "astream"):
+            async for chunk in self.llm.astream(lc_messages, max_tokens=settings.MAX_TOKENS):
+                if chunk.content:
+                    yield chunk.content
+            return
+        if not hasattr(self.llm, "stream"):
+            response = await self.llm.ainvoke(lc_messages, max_tokens=settings.MAX_TOKENS)
+            yield response.content
+            return
+        
+        loop = asyncio.get_event_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        cancelled = threading.Event()
+        
+        def produce():
+            try:
+                for chunk in self.llm.stream(lc_messages, max_tokens=settings.MAX_TOKENS):
+                    if cancelled.is_set():
+                        break
+                    content = getattr(chunk, "content", chunk)
+                    if content:
+                        loop.call_soon_threadsafe(queue.put_nowait, content)
+                loop.call_soon_threadsafe(queue.put_nowait, finished)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+        
+        loop.run_in_executor(None, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Client went away or the stream ended; stop pulling from the backend
+            cancelled.set()
+
+    async def _prepare_chat(
+        self,
+        message: str,
+        session_id: str,
+        document_ids: Optional[List[str]],
+        use_adaptive_learning: bool
+    ) -> Dict:
+        """Update the learning profile, retrieve context and build the LLM messages"""
+        # Get or create learning profile
+        print(f"👤 [RAG Service] Getting/creating learning profile for session: {session_id}")
+        learning_profile = self.get_or_create_learning_profile(session_id)
+        
+        # Analyze user message for learning patterns
+        if use_adaptive_learning:
+            print(f"🧠 [RAG Service] Using adaptive learning - analyzing message patterns")
+            indicators = learning_profile.analyze_message_patterns(message)
+            learning_profile.update_from_interaction(indicators)
+            learning_style = learning_profile.get_learning_style()
+            print(f"✅ [RAG Service] Learning style determined: {learning_style}")
+        else:
+            print(f"ℹ️ [RAG Service] Adaptive learning disabled")
+            learning_style = {}
+        
+        # Retrieve relevant context with adaptive ranking
+        # Filter by session_id and document_ids if provided
+        print(f"🔍 Searching for context - session_id: {session_id}, document_ids: {document_ids}")
+        
+        if use_adaptive_learning and learning_style:
+            context_docs = self.vectorstore.adaptive_similarity_search(
+                message, learning_style, k=settings.TOP_K,
+                session_id=session_id, document_ids=document_ids
+            )
+        else:
+            context_docs = self.vectorstore.similarity_search(
+                message, k=settings.TOP_K,
+                session_id=session_id, document_ids=document_ids
+            )
+        
+        print(f"📄 Found {len(context_docs)} context documents")
+        if len(context_docs) == 0:
+            print(f"⚠️ No documents found! This might mean:")
+            print(f"   - Documents haven't been processed yet")
+            print(f"   - Documents don't have matching session_id or document_id metadata")
+            print(f"   - Vectorstore might be empty")
+        
+        # Prioritize content from uploaded documents
+        # Separate documents by priority (uploaded vs other)
+        uploaded_docs_content = []
+        other_docs_content = []
+        
+        for doc in context_docs:
+            metadata = doc.get("metadata", {})
+            doc_id = metadata.get("document_id")
+            # Check if this document is in the provided document_ids (uploaded document)
+            if document_ids and len(document_ids) > 0 and doc_id in document_ids:
+                uploaded_docs_content.append(doc["content"])
+                print(f"✅ Found uploaded document content (doc_id: {doc_id})")
+            else:
+                other_docs_content.append(doc["content"])
+                print(f"📚 Found other document content (doc_id: {doc_id})")
+        
+        # Build context with priority: uploaded documents first, then others
+        if uploaded_docs_content:
+            primary_context = "\n\n".join(uploaded_docs_content)
+            if other_docs_content:
+                secondary_context = "\n\n".join(other_docs_content)
+                context = f"PRIMARY CONTEXT (from uploaded documents - use this as the main source):\n{primary_context}\n\nADDITIONAL CONTEXT (for reference only):\n{secondary_context}"
+            else:
+                context = primary_context
+        elif context_docs:
+            # If no uploaded docs but we have context, use all of it
+            context = "\n\n".join([doc["content"] for doc in context_docs])
+        else:
+            # No context found - this is a problem
+            context = ""
+            print(f"❌ ERROR: No context documents found for query: {message}")
+            print(f"   This means the document might not be processed or indexed correctly")
+        
+        # Keep retrieved context within its share of the prompt budget
+        context = self.context_manager.fit_context(context)
+        
+        # Generate adaptive system prompt
+        print(f"📝 [RAG Service] Generating system prompt")
+        if not context:
+            # No context available - tell user the document might not be processed
+            print(f"   ⚠️ No context available - using fallback prompt")
+            system_content = (
+                "You are an intelligent chatbot. "
+                "The user is asking about a document, but the document content is not available in the system. "
+                "This might mean the document hasn't been processed yet or there was an error processing it. "
+                "Please inform the user that the document needs to be processed first, or ask them to re-upload it."
+            )
+        elif use_adaptive_learning:
+            print(f"   🎨 Using adaptive learning prompt generator")
+            system_content = self.prompt_generator.generate_prompt(learning_profile, context)
+        else:
+            print(f"   📄 Using standard prompt")
+            priority_instruction = ""
+            if document_ids and len(document_ids) > 0:
+                priority_instruction = "IMPORTANT: Base your answer primarily on the PRIMARY CONTEXT section (from the uploaded documents). Use the ADDITIONAL CONTEXT only for supplementary information if needed. "
+            
+            system_content = (
+                "You are an intelligent chatbot with strong reasoning abilities. "
+                f"{priority_instruction}"
+                "Use the following context to answer the question. Think step by step and provide clear reasoning. "
+                "If you don't know the answer based on the context, say that you don't know.\n\n"
+                f"Context:\n{context}\n\n"
+            )
+        
+        # Build conversation history: recent turns verbatim, older ones summarized
+        print(f"💬 [RAG Service] Building conversation history")
+        history = self.get_session_history(session_id)
+        print(f"   📚 History contains {len(history.messages)} previous messages")
+        lc_messages, token_usage = self.context_manager.build_messages(
+            session_id, history.messages, system_content, message, context
+        )
+        print(f"   📝 Total messages to LLM: {len(lc_messages)}")
+        
+        return {
+            "session_id": session_id,
+            "learning_profile": learning_profile,
+            "learning_style": learning_style,
+            "use_adaptive_learning": use_adaptive_learning,
+            "context_docs": context_docs,
+            "context": context,
+            "history": history,
+            "lc_messages": lc_messages,
+            "token_usage": token_usage,
+        }
+
+    def summarize_context(self, context_docs: List[Dict]) -> List[Dict]:
+        return [
+            {
+                "content": doc["content"][:200] + "..." if len(doc["content"]) > 200 else doc["content"],
+                "metadata": doc.get("metadata", {}),
+                "score": doc.get("combined_score", doc.get("score", 0)),
+            }
+            for doc in context_docs
+        ]
+
+    def record_exchange(self, prepared: Dict, message: str, answer: str):
+        """Save a question and its answer to the session history, whichever route produced the answer"""
+        session_id = prepared["session_id"]
+        # Fetched again: the history may have been evicted while the answer was generated
+        history = self.get_session_history(session_id)
+        history.add_user_message(message)
+        history.add_ai_message(answer)
+        self.session_histories.mark_dirty(session_id)
+        print(f"💾 [RAG Service] Conversation history updated")
+        self.context_manager.schedule_fold(session_id, history.messages)
+        
+        self._save_learning_profile(session_id)
+
+    def _finish_chat(self, prepared: Dict, message: str, answer: str) -> Dict:
+        """Record the exchange and build the response payload"""
+        learning_profile = prepared["learning_profile"]
+        learning_style = prepared["learning_style"]
+        use_adaptive_learning = prepared["use_adaptive_learning"]
+        context_docs = prepared["context_docs"]
+        
+        # Check if response seems incomplete (ends with incomplete sentence or seems cut off)
+        is_incomplete = self._is_response_incomplete(answer)
+        if is_incomplete:
+            print(f"⚠️ [RAG Service] Response appears incomplete - may need continuation")
+        
+        self.record_exchange(prepared, message, answer)
+        
+        confidence_score = prepared["confidence_score"]
+        
+        return {
+            "answer": answer,
+            "is_incomplete": is_incomplete,
+            "context": self.summarize_context(context_docs),
+            "confidence_score": confidence_score,
+            "token_usage": {
+                **prepared["token_usage"],
+                "completion": self.context_manager.counter.count(answer),
+            },
+            "learning_style": learning_style if use_adaptive_learning else None,
+            "learning_profile_summary": {
+                "dimensions": learning_profile.dimensions,
+                "total_interactions": learning_profile.total_interactions,
+                "detected_style": learning_style
+            } if use_adaptive_learning else None
+        }
+
     def get_learning_profile_summary(self, session_id: str) -> Optional[Dict]:
         """Get detailed summary of user's learning profile"""
-        if session_id in self.learning_profiles:
-            profile = self.learning_profiles[session_id]
+        profile = self.learning_profiles.get(session_id)
+        if profile is not None:
             return {
                 "session_id": session_id,
                 "dimensions": profile.dimensions,
                 "learning_style": profile.get_learning_style(),
                 "total_interactions": profile.total_interactions,
-                "recent_history": profile.interaction_history[-5:]  # Last 5 interactions
+                "recent_history": list(profile.interaction_history)[-5:]  # Last 5 interactions
             }
         return None
 
@@ -420,24 +753,12 @@ class RAGService:
                 # Already synced or has interaction data, don't overwrite unless needed
                 return
             
-            print(f"🔄 [RAG Service] Syncing learning profile for user {user_id} from Django...")
-            
-            django_url = f"{settings.DJANGO_BACKEND_URL}/api/accounts/profile-data/?user_id={user_id}"
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.get(django_url, timeout=10.0)
-                if response.status_code == 200:
-                    data = response.json()
-                    # Expecting data to have ILS dimensions in -11 to 11 scale
-                    # e.g., {"active_reflective": 1, "sensing_intuitive": -3, ...}
-                    ils_data = data.get('ils_data', {})
-                    if ils_data:
-                        profile.set_dimensions_from_django(ils_data)
-                        print(f"✅ [RAG Service] Synced learning profile for user {user_id}")
-                    else:
-                        print(f"⚠️ [RAG Service] No ILS data found in Django profile for user {user_id}")
-                else:
-                    print(f"⚠️ [RAG Service] Failed to sync from Django ({response.status_code}): {response.text}")
+            # Served from the per-user cache unless it expired or Django pushed an update
+            ils_data = await self.profile_sync.get_ils_data(user_id)
+            if ils_data:
+                profile.set_dimensions_from_django(ils_data)
+                self._save_learning_profile(session_id)
+                print(f"✅ [RAG Service] Synced learning profile for user {user_id}")
         except Exception as e:
             print(f"❌ [RAG Service] Error syncing from Django: {e}")
 
@@ -445,7 +766,6 @@ class RAGService:
         """Reset learning profile for a session"""
         if session_id in self.learning_profiles:
             del self.learning_profiles[session_id]
-            self._save_learning_profiles()
             print(f"✅ Reset learning profile for session: {session_id}")
     
     async def chat_with_agent(
@@ -543,10 +863,9 @@ class RAGService:
             history = self.get_session_history(session_id)
             history.add_user_message(message)
             history.add_ai_message(final_response)
+            self.session_histories.mark_dirty(session_id)
             
-            # Save profiles
-            if learning_profile.total_interactions % 5 == 0:
-                self._save_learning_profiles()
+            self._save_learning_profile(session_id)
             
             # Build tools summary from reasoning chain
             tools_used = []
@@ -6,7 +6,7 @@ Manages all external tools like search, code execution, weather, etc.
 import os
 import asyncio
 import json
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 from datetime import datetime
 import traceback
 from dataclasses import dataclass
@@ -14,22 +14,20 @@ from enum import Enum
 
 # Import settings
 from config import settings
+from tool_cache import ToolResultCache, parse_tool_seconds
+from browser_pool import BrowserPool
+from plot_workers import PlotWorkerPool
+from tool_guard import (
+    CircuitBreaker,
+    ToolGuard,
+    DEFAULT_TOOL_CONCURRENCY,
+    DEFAULT_TOOL_TIMEOUTS,
+    http_error,
+    provider_error,
+)
 
-# Import tool libraries
-try:
-    from langchain_community.tools import Tool
-except ImportError:
-    pass
-
-try:
-    from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
-except ImportError:
-    DuckDuckGoSearchAPIWrapper = None
-
-try:
-    from langchain_community.utilities import GoogleSerperAPIWrapper
-except ImportError:
-    GoogleSerperAPIWrapper = None
+# Tool libraries (langchain_community, playwright, matplotlib, arxiv, ...) are
+# imported inside the tool methods, so importing this module stays cheap
 
 # Define tool categories
 class ToolCategory(Enum):
@@ -52,6 +50,12 @@ class ToolConfig:
     enabled: bool = True
     api_key_env: Optional[str] = None
     requires_api_key: bool = False
+    factory: Optional[Callable[[], Any]] = None
+
+    def api_key_configured(self) -> bool:
+        if not self.api_key_env:
+            return False
+        return bool(getattr(settings, self.api_key_env, None) or os.getenv(self.api_key_env))
 
 
 class GoogleSerperTool:
@@ -67,6 +71,11 @@ class GoogleSerperTool:
             return {"error": "Google Serper API key not configured"}
         
         try:
+            try:
+                from langchain_community.utilities import GoogleSerperAPIWrapper
+            except ImportError:
+                GoogleSerperAPIWrapper = None
+            
             # Try using langchain wrapper if available
             if GoogleSerperAPIWrapper:
                 wrapper = GoogleSerperAPIWrapper(serper_api_key=self.api_key)
@@ -92,7 +101,7 @@ class GoogleSerperTool:
                         if response.status == 200:
                             results = await response.json()
                         else:
-                            return {"error": f"Google Serper API error: {response.status}"}
+                            return http_error("Google Serper API", response.status)
             
             formatted_results = {
                 "query": query,
@@ -105,7 +114,7 @@ class GoogleSerperTool:
         except Exception as e:
             print(f"❌ Google Serper error: {e}")
             traceback.print_exc()
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class DuckDuckGoSearchTool:
@@ -117,6 +126,8 @@ class DuckDuckGoSearchTool:
     async def search(self, query: str, num_results: int = 5) -> Dict:
         """Search using DuckDuckGo"""
         try:
+            from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
+            
             wrapper = DuckDuckGoSearchAPIWrapper()
             results = await asyncio.get_event_loop().run_in_executor(
                 None, lambda: wrapper.results(query, num_results)
@@ -129,7 +140,7 @@ class DuckDuckGoSearchTool:
             }
         except Exception as e:
             print(f"❌ DuckDuckGo error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class WikipediaTool:
@@ -169,7 +180,7 @@ class WikipediaTool:
             }
         except Exception as e:
             print(f"❌ Wikipedia error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class ArxivTool:
@@ -214,7 +225,7 @@ class ArxivTool:
             }
         except Exception as e:
             print(f"❌ ArXiv error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class YoutubeSearchTool:
@@ -262,7 +273,7 @@ class YoutubeSearchTool:
             }
         except Exception as e:
             print(f"❌ YouTube error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class WeatherTool:
@@ -303,10 +314,10 @@ class WeatherTool:
                             "tool": "openweathermap"
                         }
                     else:
-                        return {"error": f"Weather API error: {response.status}"}
+                        return http_error("Weather API", response.status)
         except Exception as e:
             print(f"❌ Weather error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class CodeInterpreterTool:
@@ -350,7 +361,7 @@ class CodeInterpreterTool:
                     }
         except Exception as e:
             print(f"❌ Riza code execution error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class GithubToolkit:
@@ -395,7 +406,7 @@ class GithubToolkit:
             }
         except Exception as e:
             print(f"❌ GitHub search error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class PlaywrightBrowserTool:
@@ -403,32 +414,30 @@ class PlaywrightBrowserTool:
     
     def __init__(self):
         self.enabled = True
+        self.pool = BrowserPool(
+            max_contexts=settings.BROWSER_POOL_SIZE,
+            block_resources=settings.BROWSER_BLOCK_RESOURCES
+        )
     
-    async def fetch_page(self, url: str) -> Dict:
-        """Fetch and parse a web page"""
+    async def fetch_page(self, url: str, fast: bool = True) -> Dict:
+        """Fetch a web page and extract its readable text"""
         try:
-            from playwright.async_api import async_playwright
-            
-            async with async_playwright() as p:
-                browser = await p.chromium.launch()
-                page = await browser.new_page()
-                await page.goto(url, wait_until="networkidle")
-                
-                content = await page.content()
-                title = await page.title()
-                
-                await browser.close()
-                
-                return {
-                    "url": url,
-                    "title": title,
-                    "content": content[:2000],
-                    "full_content_length": len(content),
-                    "tool": "playwright"
-                }
+            result = await self.pool.fetch(
+                url,
+                fast=fast,
+                timeout=settings.BROWSER_PAGE_TIMEOUT,
+                max_chars=settings.BROWSER_MAX_TEXT_CHARS
+            )
+            return {**result, "tool": "playwright"}
         except Exception as e:
             print(f"❌ Playwright error: {e}")
             return {"error": str(e)}
+    
+    async def close(self):
+        await self.pool.close()
+    
+    def stats(self) -> Dict:
+        return self.pool.stats()
 
 
 class WikidataTool:
@@ -459,48 +468,55 @@ class WikidataTool:
                             "tool": "wikidata"
                         }
                     else:
-                        return {"error": f"Wikidata error: {response.status}"}
+                        return http_error("Wikidata", response.status)
         except Exception as e:
             print(f"❌ Wikidata error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class MatplotlibTool:
     """Matplotlib Visualization Tool"""
     
     def __init__(self):
-        self.enabled = True
+        import importlib.util
+        
+        self.enabled = importlib.util.find_spec("matplotlib") is not None
+        self.workers = PlotWorkerPool(
+            max_workers=settings.PLOT_WORKERS,
+            time_limit=settings.PLOT_TIME_LIMIT,
+            cpu_limit=settings.PLOT_CPU_LIMIT,
+            memory_mb=settings.PLOT_MEMORY_MB,
+            dpi=settings.PLOT_DPI,
+            cache_size=settings.PLOT_CACHE_SIZE
+        )
+        if self.enabled:
+            self.workers.start()
     
     async def create_visualization(self, plot_code: str) -> Dict:
         """Create visualization using Matplotlib"""
+        if not self.enabled:
+            return {"error": "matplotlib package not installed"}
+        
         try:
-            import matplotlib.pyplot as plt
-            import base64
-            from io import BytesIO
-            
-            exec_globals = {"plt": plt, "BytesIO": BytesIO, "base64": base64}
-            
-            def _create_plot():
-                exec(plot_code, exec_globals)
-                
-                buffer = BytesIO()
-                plt.savefig(buffer, format="png")
-                buffer.seek(0)
-                
-                image_base64 = base64.b64encode(buffer.read()).decode()
-                plt.close()
-                
-                return image_base64
-            
-            image_b64 = await asyncio.get_event_loop().run_in_executor(None, _create_plot)
+            result = await self.workers.render(plot_code)
+            if "error" in result:
+                print(f"❌ Matplotlib error: {result['error']}")
+                return {"error": result["error"]}
             
             return {
-                "image_base64": image_b64,
+                "image_base64": result["image_base64"],
+                "cached": result["cached"],
                 "tool": "matplotlib"
             }
         except Exception as e:
             print(f"❌ Matplotlib error: {e}")
             return {"error": str(e)}
+    
+    async def close(self):
+        self.workers.close()
+    
+    def stats(self) -> Dict:
+        return self.workers.stats()
 
 
 class ShellCommandTool:
@@ -594,10 +610,10 @@ class BraveSearchTool:
                             "tool": "brave_search"
                         }
                     else:
-                        return {"error": f"Brave Search error: {response.status}"}
+                        return http_error("Brave Search", response.status)
         except Exception as e:
             print(f"❌ Brave Search error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class GoogleScholarTool:
@@ -638,7 +654,7 @@ class GoogleScholarTool:
             return {"error": "scholarly package not installed"}
         except Exception as e:
             print(f"❌ Google Scholar error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class SearchApiTool:
@@ -688,10 +704,10 @@ class SearchApiTool:
                             "total_results": len(results)
                         }
                     else:
-                        return {"error": f"SearchApi error: {response.status}"}
+                        return http_error("SearchApi", response.status)
         except Exception as e:
             print(f"❌ SearchApi error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class TavilySearchTool:
@@ -741,10 +757,10 @@ class TavilySearchTool:
                             "total_results": len(results)
                         }
                     else:
-                        return {"error": f"Tavily error: {response.status}"}
+                        return http_error("Tavily", response.status)
         except Exception as e:
             print(f"❌ Tavily Search error: {e}")
-            return {"error": str(e)}
+            return provider_error(str(e))
 
 
 class RobocorpToolkit:
@@ -780,111 +796,307 @@ class RobocorpToolkit:
             return {"error": str(e)}
 
 
+class WebSearchTool:
+    """Web Search Tool - Hedged fan-out across the configured search providers"""
+    
+    def __init__(self, manager: "ToolsManager"):
+        self.manager = manager
+        self.providers = [name.strip() for name in settings.WEB_SEARCH_PROVIDERS.split(",") if name.strip()]
+        self.hedge_delay = settings.WEB_SEARCH_HEDGE_DELAY
+        self.deadline = settings.WEB_SEARCH_DEADLINE
+        self.fanout = settings.WEB_SEARCH_FANOUT
+        self.enabled = True
+        # Losing provider calls left to finish and fill the result cache
+        self._background = set()
+    
+    @staticmethod
+    def _normalize(provider: str, result: Dict) -> List[Dict]:
+        """Provider results as [{"title", "url", "snippet", "source"}]"""
+        if not isinstance(result, dict) or "error" in result:
+            return []
+        items = []
+        for item in result.get("results", []):
+            if not isinstance(item, dict):
+                continue
+            snippet = item.get("snippet") or item.get("description") or item.get("content") or item.get("summary") or ""
+            items.append({
+                "title": item.get("title") or "",
+                "url": item.get("link") or item.get("url") or item.get("href") or "",
+                "snippet": snippet[:500],
+                "source": provider
+            })
+        return items
+    
+    @staticmethod
+    def _merge(result_sets: List[List[Dict]], num_results: int) -> List[Dict]:
+        """Interleave providers' results by rank, dropping repeated URLs"""
+        merged = []
+        seen = set()
+        for rank in range(max((len(items) for items in result_sets), default=0)):
+            for items in result_sets:
+                if rank >= len(items):
+                    continue
+                url = items[rank]["url"].rstrip("/").lower()
+                if url and url in seen:
+                    continue
+                seen.add(url)
+                merged.append(items[rank])
+        return merged[:num_results]
+    
+    def _settle(self, pending: Dict[asyncio.Task, str]) -> tuple:
+        """Cancel the unfinished provider calls whose results would be thrown away; leave the rest running"""
+        cache = self.manager.result_cache
+        cancelled, background = [], []
+        for task, provider in pending.items():
+            if cache is not None and cache.ttl_for(provider) > 0:
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+                background.append(provider)
+            else:
+                task.cancel()
+                cancelled.append(provider)
+        return sorted(cancelled), sorted(background)
+    
+    async def search(self, query: str, num_results: int = 5, mode: str = "first") -> Dict:
+        """
+        Search the enabled providers in preference order.
+        
+        mode="first": start the preferred provider and hedge with the next one
+        whenever no good answer arrives within the hedge delay (or a provider
+        fails); the first good result set wins.
+        mode="merge": query several providers at once and merge the results
+        that arrive before the deadline.
+        
+        Providers still running at the end are cancelled, unless their result
+        will be cached: those finish in the background and fill the result
+        cache, since an identical call may already be waiting on them.
+        """
+        providers = [name for name in self.providers if self.manager.enabled_tools.get(name, False)]
+        if not providers:
+            return {"error": "No web search provider is enabled", "tool": "web_search"}
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        pending: Dict[asyncio.Task, str] = {}
+        result_sets: List[tuple] = []
+        failures: Dict[str, str] = {}
+        queue = list(providers)
+        
+        def launch():
+            provider = queue.pop(0)
+            task = asyncio.create_task(self.manager.use_tool(provider, query=query, num_results=num_results))
+            pending[task] = provider
+        
+        for _ in range(min(self.fanout if mode == "merge" else 1, len(queue))):
+            launch()
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                hedge = mode != "merge" and bool(queue)
+                done, _ = await asyncio.wait(
+                    pending, timeout=min(self.hedge_delay, remaining) if hedge else remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if hedge:
+                        print(f"⏩ [WebSearch] No answer yet, hedging with {queue[0]}")
+                        launch()
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    result = task.result()
+                    items = self._normalize(provider, result)
+                    if items:
+                        result_sets.append((provider, items))
+                    else:
+                        failures[provider] = result.get("error", "no results") if isinstance(result, dict) else "no results"
+                        # Replace a failed provider straight away instead of waiting for the hedge delay
+                        if queue:
+                            launch()
+                if result_sets and mode != "merge":
+                    break
+        finally:
+            cancelled, background = self._settle(pending)
+        
+        if not result_sets:
+            return {"error": "All web search providers failed", "failures": failures, "tool": "web_search"}
+        
+        return {
+            "query": query,
+            "results": self._merge([items for _, items in result_sets], num_results),
+            "providers": [provider for provider, _ in result_sets],
+            "failures": failures,
+            "cancelled": cancelled,
+            "background": background,
+            "mode": mode,
+            "tool": "web_search"
+        }
+
+
 class ToolsManager:
     """Main Tools Manager for coordinating all tools"""
     
     def __init__(self):
+        # Registered tools; instances are only created the first time a tool is used
+        self.tool_configs: Dict[str, ToolConfig] = {}
         self.tools: Dict[str, Any] = {}
         self.enabled_tools: Dict[str, bool] = {}
+        self.guards: Dict[str, ToolGuard] = {}
+        self._timeouts = {**DEFAULT_TOOL_TIMEOUTS, **parse_tool_seconds(settings.TOOL_TIMEOUTS)}
+        self._concurrency = {**DEFAULT_TOOL_CONCURRENCY, **parse_tool_seconds(settings.TOOL_CONCURRENCY)}
+        self.result_cache: Optional[ToolResultCache] = None
+        if settings.TOOL_CACHE_ENABLED:
+            self.result_cache = ToolResultCache(
+                ttls=parse_tool_seconds(settings.TOOL_CACHE_TTLS),
+                max_entries=settings.TOOL_CACHE_SIZE,
+                disk_path=settings.TOOL_CACHE_PATH,
+                offline=settings.TOOL_CACHE_OFFLINE
+            )
         self._initialize_tools()
     
+    def _register(self, name: str, category: ToolCategory, description: str, factory: Callable[[], Any],
+                  api_key_env: Optional[str] = None, requires_api_key: bool = False):
+        config = ToolConfig(
+            name=name,
+            category=category,
+            description=description,
+            api_key_env=api_key_env,
+            requires_api_key=requires_api_key,
+            factory=factory
+        )
+        # Same rule the tool constructors apply, checked without constructing the tool
+        config.enabled = config.api_key_configured() if requires_api_key else True
+        self.tool_configs[name] = config
+        self.enabled_tools[name] = config.enabled
+        self.guards[name] = ToolGuard(
+            name,
+            timeout=self._timeouts.get(name, settings.TOOL_TIMEOUT),
+            max_concurrency=int(self._concurrency.get(name, settings.TOOL_MAX_CONCURRENCY)),
+            breaker=CircuitBreaker(
+                window=settings.TOOL_BREAKER_WINDOW,
+                min_calls=settings.TOOL_BREAKER_MIN_CALLS,
+                failure_rate=settings.TOOL_BREAKER_FAILURE_RATE,
+                cooldown=settings.TOOL_BREAKER_COOLDOWN
+            )
+        )
+    
     def _initialize_tools(self):
-        """Initialize all available tools"""
-        print("🛠️ Initializing Tools Manager...")
-        
+        """Register all available tools"""
         # PRIMARY Search Tools (DEFAULT - Always Available)
         # SearchApi is PRIMARY/FIRST choice for best results
-        self.tools["searchapi"] = SearchApiTool()
-        self.tools["google_serper"] = GoogleSerperTool()
-        self.tools["tavily_search"] = TavilySearchTool()
-        self.tools["duckduckgo"] = DuckDuckGoSearchTool()
-        self.tools["brave_search"] = BraveSearchTool()
-        self.tools["wikipedia"] = WikipediaTool()
-        self.tools["google_scholar"] = GoogleScholarTool()
-        self.tools["arxiv"] = ArxivTool()
-        self.tools["youtube"] = YoutubeSearchTool()
+        self._register("web_search", ToolCategory.SEARCH, "Hedged search across the enabled providers", lambda: WebSearchTool(self))
+        self._register("searchapi", ToolCategory.SEARCH, "Universal search API", SearchApiTool, "SEARCHAPI_API_KEY", True)
+        self._register("google_serper", ToolCategory.SEARCH, "Google web search", GoogleSerperTool, "GOOGLE_SERPER_API_KEY", True)
+        self._register("tavily_search", ToolCategory.SEARCH, "AI-optimized search", TavilySearchTool, "TAVILY_API_KEY", True)
+        self._register("duckduckgo", ToolCategory.SEARCH, "DuckDuckGo web search", DuckDuckGoSearchTool)
+        self._register("brave_search", ToolCategory.SEARCH, "Brave web search", BraveSearchTool, "BRAVE_SEARCH_API_KEY", True)
+        self._register("wikipedia", ToolCategory.RESEARCH, "Wikipedia articles", WikipediaTool)
+        self._register("google_scholar", ToolCategory.RESEARCH, "Academic publications", GoogleScholarTool)
+        self._register("arxiv", ToolCategory.RESEARCH, "ArXiv papers and preprints", ArxivTool)
+        self._register("youtube", ToolCategory.SEARCH, "YouTube videos", YoutubeSearchTool, "YOUTUBE_API_KEY", True)
         
         # Browser Tool (DEFAULT for web browsing)
-        self.tools["playwright"] = PlaywrightBrowserTool()
+        self._register("playwright", ToolCategory.BROWSER, "Web page content", PlaywrightBrowserTool)
         
         # Automation (Conditional)
-        self.tools["robocorp"] = RobocorpToolkit()
+        self._register("robocorp", ToolCategory.COMPOSITION, "Automation and RPA tasks", RobocorpToolkit, "ROBOCORP_API_KEY")
         
         # Weather Tool
-        self.tools["weather"] = WeatherTool()
+        self._register("weather", ToolCategory.WEATHER, "Current weather", WeatherTool, "OPENWEATHERMAP_API_KEY", True)
         
         # Code Execution (Conditional)
-        self.tools["code_interpreter"] = CodeInterpreterTool()
+        self._register("code_interpreter", ToolCategory.CODE_EXECUTION, "Python code execution", CodeInterpreterTool, "RIZA_API_KEY", True)
         
         # Shell Command (Conditional)
-        self.tools["shell"] = ShellCommandTool()
+        self._register("shell", ToolCategory.CODE_EXECUTION, "Whitelisted shell commands", ShellCommandTool)
         
         # Git/GitHub (Conditional)
-        self.tools["github"] = GithubToolkit()
+        self._register("github", ToolCategory.GIT, "GitHub repository search", GithubToolkit, "GITHUB_TOKEN", True)
         
         # Data Analysis (Conditional)
-        self.tools["wikidata"] = WikidataTool()
-        self.tools["matplotlib"] = MatplotlibTool()
+        self._register("wikidata", ToolCategory.DATA_ANALYSIS, "Wikidata SPARQL queries", WikidataTool)
+        self._register("matplotlib", ToolCategory.DATA_ANALYSIS, "Data visualizations", MatplotlibTool)
         
-        # Update enabled status
-        for tool_name, tool_instance in self.tools.items():
-            self.enabled_tools[tool_name] = getattr(tool_instance, "enabled", True)
-            status = "✅" if self.enabled_tools[tool_name] else "⚠️"
-            tool_type = "PRIMARY" if tool_name == "searchapi" else ""
-            print(f"   {status} {tool_name.replace('_', ' ').title()} {tool_type}")
+        enabled = sum(1 for v in self.enabled_tools.values() if v)
+        print(f"🛠️ Tools Manager: {len(self.tool_configs)} tools registered ({enabled} enabled, loaded on first use)")
+    
+    def get_tool(self, tool_name: str) -> Any:
+        """Tool instance, constructed on first use"""
+        tool = self.tools.get(tool_name)
+        if tool is None:
+            tool = self.tools[tool_name] = self.tool_configs[tool_name].factory()
+            self.tool_configs[tool_name].enabled = getattr(tool, "enabled", True)
+            self._refresh_enabled()
+            print(f"🛠️ Loaded tool: {tool_name}")
+        return tool
+    
+    def _refresh_enabled(self):
+        """A tool is enabled when it is configured and its circuit breaker is not open"""
+        for name, config in self.tool_configs.items():
+            self.enabled_tools[name] = config.enabled and not self.guards[name].breaker.is_open()
+    
+    def _resolve_call(self, tool_name: str, tool: Any, kwargs: Dict) -> Optional[tuple]:
+        """Map use_tool kwargs to (bound method, [(argument name, value), ...]) for a tool"""
+        if tool_name == "web_search":
+            return tool.search, [
+                ("query", kwargs.get("query", "")), ("num_results", kwargs.get("num_results", 5)),
+                ("mode", kwargs.get("mode", "first"))
+            ]
+        elif tool_name in ["searchapi", "google_serper", "tavily_search", "duckduckgo", "brave_search"]:
+            return tool.search, [("query", kwargs.get("query", "")), ("num_results", kwargs.get("num_results", 5))]
+        elif tool_name == "wikipedia":
+            return tool.search, [("query", kwargs.get("query", ""))]
+        elif tool_name in ["google_scholar", "arxiv", "youtube"]:
+            return tool.search, [("query", kwargs.get("query", "")), ("max_results", kwargs.get("max_results", 5))]
+        elif tool_name == "weather":
+            return tool.get_weather, [("city", kwargs.get("city", ""))]
+        elif tool_name == "code_interpreter":
+            return tool.execute_code, [("code", kwargs.get("code", "")), ("language", kwargs.get("language", "python"))]
+        elif tool_name == "shell":
+            return tool.execute, [("command", kwargs.get("command", ""))]
+        elif tool_name == "github":
+            return tool.search_repos, [("query", kwargs.get("query", "")), ("max_results", kwargs.get("max_results", 5))]
+        elif tool_name == "playwright":
+            return tool.fetch_page, [("url", kwargs.get("url", "")), ("fast", kwargs.get("fast", True))]
+        elif tool_name == "robocorp":
+            return tool.run_automation, [("task_name", kwargs.get("task_name", "")), ("params", kwargs.get("params", {}))]
+        elif tool_name == "wikidata":
+            return tool.query, [("sparql_query", kwargs.get("sparql_query", ""))]
+        elif tool_name == "matplotlib":
+            return tool.create_visualization, [("plot_code", kwargs.get("plot_code", ""))]
+        return None
     
     async def use_tool(self, tool_name: str, **kwargs) -> Dict:
         """Use a specific tool"""
-        if tool_name not in self.tools:
+        if tool_name not in self.tool_configs:
             return {"error": f"Tool '{tool_name}' not found"}
         
-        if not self.enabled_tools.get(tool_name, False):
+        if not self.tool_configs[tool_name].enabled:
             return {"error": f"Tool '{tool_name}' is not enabled. Check API keys."}
         
         try:
-            tool = self.tools[tool_name]
+            tool = self.get_tool(tool_name)
             
             print(f"🔧 Using tool: {tool_name} with params: {list(kwargs.keys())}")
             
             # Call appropriate method based on tool
-            if tool_name == "searchapi":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("num_results", 5))
-            elif tool_name == "google_serper":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("num_results", 5))
-            elif tool_name == "tavily_search":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("num_results", 5))
-            elif tool_name == "duckduckgo":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("num_results", 5))
-            elif tool_name == "brave_search":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("num_results", 5))
-            elif tool_name == "wikipedia":
-                result = await tool.search(kwargs.get("query", ""))
-            elif tool_name == "google_scholar":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("max_results", 5))
-            elif tool_name == "arxiv":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("max_results", 5))
-            elif tool_name == "youtube":
-                result = await tool.search(kwargs.get("query", ""), kwargs.get("max_results", 5))
-            elif tool_name == "weather":
-                result = await tool.get_weather(kwargs.get("city", ""))
-            elif tool_name == "code_interpreter":
-                result = await tool.execute_code(kwargs.get("code", ""), kwargs.get("language", "python"))
-            elif tool_name == "shell":
-                result = await tool.execute(kwargs.get("command", ""))
-            elif tool_name == "github":
-                result = await tool.search_repos(kwargs.get("query", ""), kwargs.get("max_results", 5))
-            elif tool_name == "playwright":
-                result = await tool.fetch_page(kwargs.get("url", ""))
-            elif tool_name == "robocorp":
-                result = await tool.run_automation(kwargs.get("task_name", ""), kwargs.get("params", {}))
-            elif tool_name == "wikidata":
-                result = await tool.query(kwargs.get("sparql_query", ""))
-            elif tool_name == "matplotlib":
-                result = await tool.create_visualization(kwargs.get("plot_code", ""))
-            else:
-                result = {"error": f"Tool '{tool_name}' method not implemented"}
+            call = self._resolve_call(tool_name, tool, kwargs)
+            if call is None:
+                return {"error": f"Tool '{tool_name}' method not implemented"}
+            method, arguments = call
+            
+            def invoke():
+                # Deadline, concurrency limit and circuit breaker apply to provider calls, not cache hits
+                return self.guards[tool_name].run(lambda: method(*[value for _, value in arguments]))
             
-            return result
+            try:
+                if self.result_cache is not None:
+                    return await self.result_cache.get_or_call(tool_name, arguments, invoke)
+                return await invoke()
+            finally:
+                self._refresh_enabled()
         
         except Exception as e:
             print(f"❌ Error using tool '{tool_name}': {e}")
@@ -893,23 +1105,44 @@ class ToolsManager:
     
     def get_tool_list(self) -> Dict:
         """Get list of all available tools with their status"""
+        self._refresh_enabled()
         return {
-            "total_tools": len(self.tools),
+            "total_tools": len(self.tool_configs),
             "enabled_tools": sum(1 for v in self.enabled_tools.values() if v),
             "disabled_tools": sum(1 for v in self.enabled_tools.values() if not v),
             "tools": {
                 name: {
                     "enabled": self.enabled_tools.get(name, False),
-                    "category": self._get_tool_category(name)
+                    "category": self._get_tool_category(name),
+                    "loaded": name in self.tools,
+                    **self.guards[name].stats(),
+                    **self._runtime_stats(name)
                 }
-                for name in self.tools.keys()
-            }
+                for name in self.tool_configs.keys()
+            },
+            "cache": self.result_cache.stats() if self.result_cache is not None else None
         }
     
+    def _runtime_stats(self, tool_name: str) -> Dict:
+        """Stats a loaded tool keeps about its own resources (e.g. the browser pool)"""
+        tool = self.tools.get(tool_name)
+        if tool is None or not hasattr(tool, "stats"):
+            return {}
+        return {"runtime": tool.stats()}
+    
+    async def close(self):
+        """Release resources held by loaded tools (browsers, worker processes)"""
+        for tool_name, tool in self.tools.items():
+            if hasattr(tool, "close"):
+                try:
+                    await tool.close()
+                except Exception as e:
+                    print(f"⚠️ Could not close tool '{tool_name}': {e}")
+    
     def _get_tool_category(self, tool_name: str) -> str:
         """Get category of a tool"""
         # PRIMARY Search tool (best accuracy)
-        if tool_name == "searchapi":
+        if tool_name in ["web_search", "searchapi"]:
             return "search_primary"
         # Search tools (DEFAULT - always available)
         search_tools = ["google_serper", "tavily_search", "duckduckgo", "brave_search", "wikipedia", "google_scholar", "arxiv", "youtube"]
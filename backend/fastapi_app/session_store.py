@@ -0,0 +1,275 @@
+"""
+Session State Store for the FastAPI services
+Bounded per-session state with LRU / idle-TTL eviction and an optional SQLite spill tier
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+class SessionStateStore(MutableMapping):
+    """
+    Dict-like map of session_id -> state object.
+
+    At most max_entries objects stay in memory; the least recently used, and
+    any not touched for idle_ttl seconds, are evicted. With a spill_path,
+    evicted objects are serialized into a SQLite table and rehydrated on the
+    next access, so eviction costs a reload instead of the session's state.
+    Without one, evicted state is dropped. on_evict, if given, is called
+    with each evicted key, so state kept elsewhere for the session can
+    follow it out.
+
+    Objects are mutated in place by their callers, who call mark_dirty()
+    after each change (assignment marks the key dirty itself); the next
+    flush_dirty() upserts every queued row in a single transaction. An
+    object evicted while a caller still holds it is no longer stored, so
+    callers fetch it again after any await before changing it. Opening a
+    store reads nothing but the schema, so startup does not depend on how
+    many sessions are on disk.
+
+    Several stores can share one SQLite file; each uses its own table.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        serialize: Callable[[Any], str],
+        deserialize: Callable[[str], Any],
+        max_entries: int = 1000,
+        idle_ttl: Optional[float] = 3600,
+        spill_path: Optional[str] = None,
+        on_evict: Optional[Callable[[str], None]] = None
+    ):
+        self.name = name
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        # key -> [value, last access time], oldest access first
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.rehydrations = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+        self._db = None
+        if spill_path:
+            self._open_spill(spill_path)
+
+    def _open_spill(self, spill_path: str):
+        try:
+            os.makedirs(os.path.dirname(spill_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            print(f"✅ [SessionStore:{self.name}] Spill tier at {spill_path}")
+        except Exception as e:
+            print(f"⚠️ [SessionStore:{self.name}] Could not open spill tier, evicted sessions will be dropped: {e}")
+            self._db = None
+
+    @property
+    def spilling(self) -> bool:
+        """Evicted sessions are written to disk rather than dropped"""
+        return self._db is not None
+
+    @property
+    def _table(self) -> str:
+        return f"session_state_{self.name}"
+
+    def _write(self, items) -> int:
+        """Upsert (key, value) pairs in one transaction"""
+        if self._db is None:
+            return 0
+        now = time.time()
+        rows = [(key, self.serialize(value), now) for key, value in items]
+        if not rows:
+            return 0
+        try:
+            with self._db:
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO {self._table} (key, value, updated_at) VALUES (?, ?, ?)", rows
+                )
+            self.writes += len(rows)
+            return len(rows)
+        except Exception as e:
+            print(f"⚠️ [SessionStore:{self.name}] Could not write {len(rows)} sessions: {e}")
+            return 0
+
+    def _on_disk(self, key: str) -> bool:
+        if self._db is None:
+            return False
+        return self._db.execute(f"SELECT 1 FROM {self._table} WHERE key = ?", (key,)).fetchone() is not None
+
+    def _load(self, key: str) -> Optional[Any]:
+        if self._db is None:
+            return None
+        row = self._db.execute(f"SELECT value FROM {self._table} WHERE key = ?", (key,)).fetchone()
+        return self.deserialize(row[0]) if row is not None else None
+
+    def _evict(self, now: float):
+        """Evict idle entries and anything beyond max_entries, oldest access first"""
+        while self._entries:
+            key, (value, last_access) = next(iter(self._entries.items()))
+            idle = self.idle_ttl is not None and now - last_access > self.idle_ttl
+            if not idle and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+            self._dirty.discard(key)
+            self._write([(key, value)])
+            self.evictions += 1
+            if self.on_evict is not None:
+                try:
+                    self.on_evict(key)
+                except Exception as e:
+                    print(f"⚠️ [SessionStore:{self.name}] Eviction callback failed for {key}: {e}")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            value = self._load(key)
+            if value is None:
+                self.misses += 1
+                return default
+            self.rehydrations += 1
+            self._entries[key] = [value, now]
+            self._evict(now)
+            return value
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        with self._lock:
+            now = time.time()
+            self._entries[key] = [value, now]
+            self._entries.move_to_end(key)
+            self._dirty.add(key)
+            self._evict(now)
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            found = self._entries.pop(key, None) is not None
+            self._dirty.discard(key)
+            if self._db is not None:
+                with self._db:
+                    found = self._db.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,)).rowcount > 0 or found
+            if not found:
+                raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries or self._on_disk(key)
+
+    def _disk_keys(self) -> list:
+        if self._db is None:
+            return []
+        return [row[0] for row in self._db.execute(f"SELECT key FROM {self._table}")]
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            keys = list(self._entries)
+            keys += [key for key in self._disk_keys() if key not in self._entries]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries) + sum(1 for key in self._disk_keys() if key not in self._entries)
+
+    def items(self):
+        """All sessions; spilled ones are read from disk without being made resident"""
+        with self._lock:
+            resident = [(key, entry[0]) for key, entry in self._entries.items()]
+            spilled = [key for key in self._disk_keys() if key not in self._entries]
+        yield from resident
+        for key in spilled:
+            with self._lock:
+                value = self._load(key)
+            if value is not None:
+                yield key, value
+
+    def import_serialized(self, rows: Dict[str, str]) -> int:
+        """Write already-serialized sessions straight to disk without making them resident"""
+        if self._db is None or not rows:
+            return 0
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO {self._table} (key, value, updated_at) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in rows.items()]
+            )
+        return len(rows)
+
+    def mark_dirty(self, key: str):
+        """Queue a resident session for the next flush_dirty()"""
+        with self._lock:
+            if key in self._entries:
+                self._dirty.add(key)
+
+    def flush_dirty(self) -> int:
+        """Upsert every session changed since the last flush; returns rows written"""
+        with self._lock:
+            items = [(key, self._entries[key][0]) for key in self._dirty if key in self._entries]
+            self._dirty.clear()
+            return self._write(items)
+
+    def sweep(self):
+        """Evict idle sessions without waiting for the next access"""
+        with self._lock:
+            self._evict(time.time())
+
+    def flush(self):
+        """Write every resident session to the spill tier, e.g. before shutdown"""
+        with self._lock:
+            self._dirty.clear()
+            self._write([(key, entry[0]) for key, entry in self._entries.items()])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            resident = [entry[0] for entry in self._entries.values()]
+            on_disk = self._db.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0] if self._db else 0
+            dirty = len(self._dirty)
+        # Serialized size is a stable, allocator-independent gauge of resident state
+        resident_bytes = 0
+        for value in resident:
+            try:
+                resident_bytes += len(self.serialize(value))
+            except Exception:
+                pass
+        lookups = self.hits + self.rehydrations + self.misses
+        return {
+            "resident": len(resident),
+            "on_disk": on_disk,
+            "dirty": dirty,
+            "max_entries": self.max_entries,
+            "idle_ttl": self.idle_ttl,
+            "resident_bytes": resident_bytes,
+            "hits": self.hits,
+            "rehydrations": self.rehydrations,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "writes": self.writes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "spill_tier": self._db is not None,
+        }
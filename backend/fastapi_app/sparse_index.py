@@ -0,0 +1,155 @@
+"""
+Sparse Index for the adaptive vector store
+BM25 inverted index over chunk text, addressed by FAISS row id
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Words, with dotted numbers ("3.2", "9.81") kept as one token so chapter
+# and section references match exactly
+_TOKEN_PATTERN = re.compile(r"\w+(?:\.\d+)*")
+
+# Very common words are left out of the index; they would carry almost no
+# IDF weight and their postings lists would be as long as the corpus
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its of on or "
+    "that the their there this to was were what when where which who why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class _Postings:
+    """One term's (row, term frequency) pairs in numpy buffers grown by doubling"""
+
+    __slots__ = ("rows", "frequencies", "count")
+
+    def __init__(self):
+        self.rows = np.empty(4, dtype="int64")
+        self.frequencies = np.empty(4, dtype="float32")
+        self.count = 0
+
+    def append(self, row: int, frequency: int):
+        if self.count == len(self.rows):
+            self.rows = np.concatenate([self.rows, np.empty(self.count, dtype="int64")])
+            self.frequencies = np.concatenate([self.frequencies, np.empty(self.count, dtype="float32")])
+        self.rows[self.count] = row
+        self.frequencies[self.count] = frequency
+        self.count += 1
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows (ascending) and frequencies in use, as views rather than copies"""
+        return self.rows[:self.count], self.frequencies[:self.count]
+
+
+class BM25Index:
+    """
+    Append-only BM25 index kept alongside the FAISS index.
+
+    Postings are numpy arrays of (row, term frequency) per term, so adding a
+    chunk costs only its own tokens and a query only touches the postings of
+    its terms. Search can be restricted to a sorted array of candidate rows,
+    the same form the session/document filters produce; a short candidate
+    list is looked up in the postings by binary search instead of scanning them.
+
+    Postings and chunk lengths live in numpy buffers grown by doubling, so a
+    query reads them in place without copying.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, _Postings] = {}
+        # Token count per row; only the first self._rows entries are in use
+        self._lengths = np.zeros(1024, dtype="float32")
+        self._rows = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _append_length(self, length: int):
+        if self._rows == len(self._lengths):
+            grown = np.zeros(2 * len(self._lengths), dtype="float32")
+            grown[:self._rows] = self._lengths
+            self._lengths = grown
+        self._lengths[self._rows] = length
+        self._rows += 1
+
+    def add(self, row: int, text: str):
+        """Index a chunk; rows must be added in increasing order"""
+        while self._rows < row:
+            # Rows without text (never expected, but keeps ids aligned)
+            self._append_length(0)
+        tokens = tokenize(text)
+        self._append_length(len(tokens))
+        self._total_length += len(tokens)
+        for term, frequency in Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+            postings.append(row, frequency)
+
+    def search(self, query: str, k: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (scores, row ids) of the top k rows for the query.
+        When rows is given (sorted), only those rows are scored.
+        """
+        total = self._rows
+        terms = set(tokenize(query))
+        if total == 0 or not terms or k <= 0 or (rows is not None and len(rows) == 0):
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+
+        lengths = self._lengths
+        average_length = max(self._total_length / total, 1.0)
+        hit_rows = []
+        hit_scores = []
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            document_frequency = postings.count
+            posting_rows, frequencies = postings.view()
+            if rows is not None:
+                if len(rows) < document_frequency:
+                    # Few candidates: find each one in the (sorted) postings
+                    positions = np.minimum(np.searchsorted(posting_rows, rows), document_frequency - 1)
+                    positions = positions[posting_rows[positions] == rows]
+                else:
+                    positions = np.minimum(np.searchsorted(rows, posting_rows), len(rows) - 1)
+                    positions = np.flatnonzero(rows[positions] == posting_rows)
+                posting_rows = posting_rows[positions]
+                frequencies = frequencies[positions]
+                if len(posting_rows) == 0:
+                    continue
+            # IDF stays corpus-wide so scores do not depend on the filter
+            idf = math.log(1.0 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[posting_rows] / average_length)
+            hit_rows.append(posting_rows)
+            hit_scores.append(idf * frequencies * (self.k1 + 1.0) / (frequencies + norm))
+
+        if not hit_rows:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+        matched, inverse = np.unique(np.concatenate(hit_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores)).astype("float32")
+        if k < len(matched):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(matched))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], matched[top]
+
+    def stats(self) -> Dict:
+        return {
+            "rows": self._rows,
+            "terms": len(self._postings),
+            "average_length": self._total_length / self._rows if self._rows else 0.0,
+        }
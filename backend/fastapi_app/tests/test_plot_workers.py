@@ -0,0 +1,61 @@
+"""
+PlotWorkerPool isolation: time limits, pool restarts and retries of renders
+caught in another render's restart
+
+Run from backend/fastapi_app: python -m unittest discover tests
+"""
+
+import asyncio
+import unittest
+
+from plot_workers import PlotWorkerPool
+
+GOOD_PLOT = "import time\ntime.sleep(0.5)\nplt.plot([1, 2, 3])"
+CRASHING_PLOT = "import os, signal\nos.kill(os.getpid(), signal.SIGSEGV)"
+
+
+class PlotWorkerPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pool = PlotWorkerPool(max_workers=2, time_limit=2, cpu_limit=0, memory_mb=0)
+        self.pool.start()
+
+    async def asyncTearDown(self):
+        self.pool.close()
+
+    async def test_renders_are_cached(self):
+        first = await self.pool.render("plt.plot([1, 2])")
+        second = await self.pool.render("plt.plot([1, 2])")
+
+        self.assertIn("image_base64", first)
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+
+    async def test_crashing_render_fails_once_and_innocent_render_is_retried(self):
+        async def crash_later():
+            await asyncio.sleep(0.3)
+            return await self.pool.render(CRASHING_PLOT)
+
+        innocent, crashed = await asyncio.gather(self.pool.render(GOOD_PLOT), crash_later())
+
+        self.assertIn("image_base64", innocent)
+        self.assertIn("error", crashed)
+        stats = self.pool.stats()
+        # The crash took the pool down once and was not run a second time
+        self.assertEqual(stats["restarts"], 1)
+        self.assertEqual(stats["retries"], 1)
+
+    async def test_time_limit_cannot_be_swallowed_by_plot_code(self):
+        result = await self.pool.render(
+            "import time\ntry:\n    time.sleep(10)\nexcept Exception:\n    pass\nplt.plot([1])"
+        )
+        self.assertEqual(result["error"], "Plot code exceeded the 2 second time limit")
+
+    async def test_errors_in_plot_code_are_reported_without_a_restart(self):
+        result = await self.pool.render("raise ValueError('bad data')")
+
+        self.assertEqual(result["error"], "ValueError: bad data")
+        self.assertEqual(self.pool.stats()["restarts"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+SessionStateStore eviction, spill tier and dirty-row flushing
+
+Run from backend/fastapi_app: python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from session_store import SessionStateStore
+
+
+class SessionStateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spill_path = os.path.join(self.directory, "sessions.sqlite3")
+        self.evicted = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def new_store(self, spill=True, **kwargs):
+        return SessionStateStore(
+            "test",
+            serialize=json.dumps,
+            deserialize=json.loads,
+            spill_path=self.spill_path if spill else None,
+            on_evict=self.evicted.append,
+            **kwargs
+        )
+
+    def on_disk(self, store, key):
+        row = store._db.execute(f"SELECT value FROM {store._table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def test_least_recently_used_session_spills_and_comes_back(self):
+        store = self.new_store(max_entries=2)
+        store["a"] = {"turns": 1}
+        store["b"] = {"turns": 2}
+        store.get("a")
+        store["c"] = {"turns": 3}
+
+        self.assertEqual(self.evicted, ["b"])
+        self.assertEqual(store.stats()["resident"], 2)
+        self.assertEqual(store.get("b"), {"turns": 2})
+        self.assertEqual(store.rehydrations, 1)
+        self.assertEqual(sorted(store), ["a", "b", "c"])
+
+    def test_without_a_spill_tier_evicted_sessions_are_dropped(self):
+        store = self.new_store(spill=False, max_entries=1)
+        store["a"] = {"turns": 1}
+        store["b"] = {"turns": 2}
+
+        self.assertFalse(store.spilling)
+        self.assertEqual(self.evicted, ["a"])
+        self.assertIsNone(store.get("a"))
+
+    def test_sweep_evicts_idle_sessions(self):
+        store = self.new_store(idle_ttl=0.05)
+        store["a"] = {"turns": 1}
+        time.sleep(0.1)
+        store.sweep()
+
+        self.assertEqual(self.evicted, ["a"])
+        self.assertEqual(store.stats()["resident"], 0)
+        self.assertEqual(self.on_disk(store, "a"), {"turns": 1})
+
+    def test_in_place_changes_reach_disk_once_marked_dirty(self):
+        store = self.new_store()
+        session = {"turns": 1}
+        store["a"] = session
+        self.assertEqual(store.flush_dirty(), 1)
+
+        session["turns"] = 2
+        self.assertEqual(store.flush_dirty(), 0)
+        store.mark_dirty("a")
+        self.assertEqual(store.flush_dirty(), 1)
+        self.assertEqual(self.on_disk(store, "a"), {"turns": 2})
+
+    def test_delete_removes_the_spilled_row(self):
+        store = self.new_store(max_entries=1)
+        store["a"] = {"turns": 1}
+        store["b"] = {"turns": 2}
+        del store["a"]
+
+        self.assertNotIn("a", store)
+        self.assertIsNone(self.on_disk(store, "a"))
+        with self.assertRaises(KeyError):
+            del store["a"]
+
+    def test_sessions_survive_a_restart_after_flush(self):
+        store = self.new_store()
+        store["a"] = {"turns": 4}
+        store.flush()
+
+        self.assertEqual(self.new_store().get("a"), {"turns": 4})
+
+
+if __name__ == "__main__":
+    unittest.main()
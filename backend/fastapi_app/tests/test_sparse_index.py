@@ -0,0 +1,85 @@
+"""
+BM25 ranking and its reciprocal-rank fusion with dense search
+
+Run from backend/fastapi_app: python -m unittest discover tests
+"""
+
+import unittest
+
+import numpy as np
+
+from sparse_index import BM25Index, tokenize
+from test_vectorstore_persistence import HashEmbeddings, make_chunks
+from adaptive_learning import AdaptiveFAISSVectorStore
+
+
+class BM25IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.texts = [
+            "photosynthesis turns light into sugar",
+            "the mitochondria is the powerhouse of the cell",
+            "newton's third law: every action has an equal and opposite reaction",
+            "photosynthesis photosynthesis happens in the chloroplast",
+            "section 3.2 covers kinetic energy",
+        ]
+        for row, text in enumerate(self.texts):
+            self.index.add(row, text)
+
+    def test_tokenize_keeps_section_numbers_and_drops_stopwords(self):
+        self.assertEqual(tokenize("The energy in Section 3.2"), ["energy", "section", "3.2"])
+
+    def test_term_frequency_orders_matches(self):
+        scores, rows = self.index.search("photosynthesis", k=5)
+        self.assertEqual(rows.tolist(), [3, 0])
+        self.assertGreater(scores[0], scores[1])
+
+    def test_exact_section_reference_matches(self):
+        _, rows = self.index.search("what is in 3.2", k=5)
+        self.assertEqual(rows.tolist(), [4])
+
+    def test_candidate_rows_restrict_results_without_changing_scores(self):
+        all_scores, all_rows = self.index.search("photosynthesis", k=5)
+        scores, rows = self.index.search("photosynthesis", k=5, rows=np.array([0, 2], dtype="int64"))
+
+        self.assertEqual(rows.tolist(), [0])
+        # IDF is corpus-wide, so a filter does not change a row's score
+        self.assertAlmostEqual(float(scores[0]), float(all_scores[all_rows.tolist().index(0)]), places=5)
+
+    def test_unknown_terms_and_empty_filters_return_nothing(self):
+        self.assertEqual(len(self.index.search("quantum", k=5)[1]), 0)
+        self.assertEqual(len(self.index.search("photosynthesis", k=5, rows=np.array([], dtype="int64"))[1]), 0)
+
+    def test_postings_grow_past_their_initial_capacity(self):
+        index = BM25Index()
+        for row in range(100):
+            index.add(row, f"common term{row}")
+        _, rows = index.search("common", k=100)
+        self.assertEqual(sorted(rows.tolist()), list(range(100)))
+        _, rows = index.search("common", k=5, rows=np.array([7, 93], dtype="int64"))
+        self.assertEqual(sorted(rows.tolist()), [7, 93])
+
+
+class HybridSearchTest(unittest.TestCase):
+    def test_keyword_match_is_fused_into_dense_results(self):
+        store = AdaptiveFAISSVectorStore(HashEmbeddings())
+        texts = make_chunks(50) + ["the unique keyword zygomorphic appears only here"]
+        store.add_documents(texts, [{"session_id": "s1"}] * len(texts))
+
+        # Hash embeddings carry no meaning, so only the BM25 leg can find this row
+        scores, rows, relevance = store._search(store._embed_query("zygomorphic"), 5, query="zygomorphic")
+        self.assertIn(50, rows.tolist())
+        self.assertTrue(all(0 < value <= 1 for value in relevance.tolist()))
+        self.assertEqual(len(scores), len(rows))
+
+    def test_filters_apply_to_both_legs(self):
+        store = AdaptiveFAISSVectorStore(HashEmbeddings())
+        store.add_documents(["zygomorphic flowers"], [{"session_id": "s1"}])
+        store.add_documents(["zygomorphic symmetry"], [{"session_id": "s2"}])
+
+        _, rows, _ = store._search(store._embed_query("zygomorphic"), 5, session_id="s2", query="zygomorphic")
+        self.assertEqual(rows.tolist(), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+"""
+Concurrency primitives around the agent tools: single-flight result cache,
+deadlines and circuit breakers, and the hedged web search
+
+Run from backend/fastapi_app: python -m unittest discover tests
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from config import settings
+from tool_cache import ToolResultCache
+from tool_guard import CircuitBreaker, ToolGuard, http_error, provider_error
+
+
+class SingleFlightCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.cache = ToolResultCache()
+        self.calls = 0
+
+    async def slow_call(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return {"answer": self.calls}
+
+    async def test_identical_calls_share_one_provider_call(self):
+        results = await asyncio.gather(*[
+            self.cache.get_or_call("wikipedia", [("query", "Photosynthesis ")], self.slow_call),
+            self.cache.get_or_call("wikipedia", [("query", "photosynthesis")], self.slow_call),
+            self.cache.get_or_call("wikipedia", [("query", "PHOTOSYNTHESIS")], self.slow_call),
+        ])
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{"answer": 1}] * 3)
+        self.assertEqual(self.cache.stats()["coalesced"], 2)
+        # Callers get copies, so one cannot change another's result
+        results[0]["answer"] = "changed"
+        self.assertEqual(await self.cache.get_or_call("wikipedia", [("query", "photosynthesis")], self.slow_call), {"answer": 1})
+
+    async def test_cancelling_the_first_caller_does_not_cancel_the_shared_call(self):
+        owner = asyncio.create_task(self.cache.get_or_call("wikipedia", [("query", "x")], self.slow_call))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(self.cache.get_or_call("wikipedia", [("query", "x")], self.slow_call))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+
+        self.assertEqual(await waiter, {"answer": 1})
+        self.assertTrue(owner.cancelled())
+        self.assertEqual(self.calls, 1)
+
+    async def test_abandoned_call_still_fills_the_cache(self):
+        caller = asyncio.create_task(self.cache.get_or_call("arxiv", [("query", "y")], self.slow_call))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.cache.stats()["stores"], 1)
+        self.assertEqual(self.cache.stats()["in_flight"], 0)
+
+    async def test_errors_are_not_cached(self):
+        async def failing():
+            self.calls += 1
+            return {"error": "not found"}
+
+        await self.cache.get_or_call("wikipedia", [("query", "z")], failing)
+        await self.cache.get_or_call("wikipedia", [("query", "z")], failing)
+        self.assertEqual(self.calls, 2)
+
+
+class ToolGuardTest(unittest.IsolatedAsyncioTestCase):
+    def new_guard(self, timeout=1.0, max_concurrency=2):
+        breaker = CircuitBreaker(window=4, min_calls=2, failure_rate=0.5, cooldown=0.1)
+        return ToolGuard("test_tool", timeout, max_concurrency, breaker)
+
+    async def test_deadline_returns_a_provider_failure(self):
+        guard = self.new_guard(timeout=0.05)
+
+        async def hang():
+            await asyncio.sleep(1)
+
+        result = await guard.run(hang)
+        self.assertTrue(result["provider_failure"])
+        self.assertEqual(guard.timeouts, 1)
+
+    async def test_provider_failures_open_the_breaker_and_it_recovers(self):
+        guard = self.new_guard()
+
+        async def outage():
+            return http_error("Provider", 503)
+
+        async def healthy():
+            return {"results": []}
+
+        await guard.run(outage)
+        await guard.run(outage)
+        self.assertEqual(guard.breaker.state, "open")
+        self.assertIn("temporarily disabled", (await guard.run(healthy))["error"])
+
+        await asyncio.sleep(0.15)
+        self.assertEqual(await guard.run(healthy), {"results": []})
+        self.assertEqual(guard.breaker.state, "closed")
+
+    async def test_request_errors_do_not_count_against_the_provider(self):
+        guard = self.new_guard()
+
+        async def bad_request():
+            return http_error("Provider", 404)
+
+        for _ in range(4):
+            await guard.run(bad_request)
+        self.assertEqual(guard.breaker.state, "closed")
+        self.assertEqual(guard.failures, 0)
+
+    async def test_exceptions_count_as_failures(self):
+        guard = self.new_guard()
+
+        async def broken():
+            raise ConnectionError("reset")
+
+        result = await guard.run(broken)
+        self.assertEqual(result, provider_error("reset", tool="test_tool"))
+        self.assertEqual(guard.failures, 1)
+
+    async def test_concurrency_limit_queues_extra_calls(self):
+        guard = self.new_guard(max_concurrency=2)
+        running = []
+        peak = 0
+
+        async def tracked():
+            nonlocal peak
+            running.append(1)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.02)
+            running.pop()
+            return {}
+
+        await asyncio.gather(*[guard.run(tracked) for _ in range(5)])
+        self.assertEqual(peak, 2)
+
+    async def test_cancelled_half_open_trial_is_not_a_failure(self):
+        guard = self.new_guard()
+        guard.breaker._open()
+        guard.breaker.opened_at -= 1
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        trial = asyncio.create_task(guard.run(slow))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+        self.assertEqual(guard.failures, 0)
+        self.assertTrue(guard.breaker.allow())
+
+
+class SearchProvider:
+    def __init__(self, name, delay, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.enabled = True
+        self.calls = 0
+        self.cancelled = False
+
+    async def search(self, query, num_results=5):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            return {"error": "down"}
+        return {"results": [{"title": self.name, "link": f"https://{self.name}.example/{query}", "snippet": "s"}]}
+
+
+class HedgedSearchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        patches = {
+            "TOOL_CACHE_ENABLED": True,
+            "TOOL_CACHE_PATH": "",
+            "WEB_SEARCH_PROVIDERS": "searchapi,google_serper",
+            "WEB_SEARCH_HEDGE_DELAY": 0.05,
+            "WEB_SEARCH_DEADLINE": 1.0,
+        }
+        for name, value in patches.items():
+            patcher = mock.patch.object(settings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        from services.tools_manager import ToolsManager
+        self.manager = ToolsManager()
+        for name in ("searchapi", "google_serper"):
+            self.manager.tool_configs[name].enabled = True
+        self.manager._refresh_enabled()
+
+    async def test_slow_provider_is_hedged_and_left_to_fill_the_cache(self):
+        slow = SearchProvider("slow", 0.3)
+        fast = SearchProvider("fast", 0.01)
+        self.manager.tools.update(searchapi=slow, google_serper=fast)
+
+        result = await self.manager.use_tool("web_search", query="cells")
+        self.assertEqual(result["providers"], ["google_serper"])
+        self.assertEqual(result["background"], ["searchapi"])
+
+        await asyncio.sleep(0.4)
+        self.assertFalse(slow.cancelled)
+        # The losing call finished and its result is served from the cache
+        await self.manager.use_tool("searchapi", query="cells", num_results=5)
+        self.assertEqual(slow.calls, 1)
+
+    async def test_failed_provider_is_replaced_without_waiting_for_the_hedge(self):
+        self.manager.tools.update(searchapi=SearchProvider("down", 0.0, fail=True), google_serper=SearchProvider("up", 0.01))
+
+        result = await self.manager.use_tool("web_search", query="atoms")
+        self.assertEqual(result["providers"], ["google_serper"])
+        self.assertIn("searchapi", result["failures"])
+
+
+if __name__ == "__main__":
+    unittest.main()
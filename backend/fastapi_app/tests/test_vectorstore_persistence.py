@@ -0,0 +1,221 @@
+"""
+Persistence of AdaptiveFAISSVectorStore: write-ahead log, versioned
+snapshots, crash recovery and index rebuilds
+
+Run from backend/fastapi_app: python -m unittest discover tests
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import faiss
+import numpy as np
+
+from adaptive_learning import AdaptiveFAISSVectorStore
+from chunk_store import ChunkStore, current_snapshot, new_snapshot
+from config import settings
+
+
+class HashEmbeddings:
+    """Deterministic stand-in for the sentence-transformer embeddings"""
+
+    def _vector(self, text):
+        rng = np.random.default_rng(int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16))
+        return rng.standard_normal(768).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def make_chunks(count, prefix="chunk"):
+    return [f"{prefix} {i} about topic {i % 7}" for i in range(count)]
+
+
+class VectorStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "vectorstore")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def new_store(self):
+        return AdaptiveFAISSVectorStore(HashEmbeddings())
+
+    def reopen(self):
+        store = self.new_store()
+        self.assertTrue(store.load_index(self.path))
+        return store
+
+    def assertSameContents(self, store, texts):
+        self.assertEqual([doc["content"] for doc in store.documents], texts)
+        self.assertEqual(store.index.ntotal, len(texts))
+
+
+class WriteAheadLogTest(VectorStoreTestCase):
+    def test_segments_are_replayed_on_load(self):
+        store = self.new_store()
+        store.add_documents(make_chunks(3), [{"session_id": "s1"}] * 3)
+        store.append_segment(self.path)
+        store.add_documents(["late chunk"], [{"session_id": "s2"}])
+        store.append_segment(self.path)
+
+        reopened = self.reopen()
+        self.assertSameContents(reopened, make_chunks(3) + ["late chunk"])
+        self.assertEqual(reopened.session_rows, {"s1": [0, 1, 2], "s2": [3]})
+
+    def test_links_to_existing_rows_are_replayed(self):
+        store = self.new_store()
+        store.add_documents(["shared chunk"], [{"session_id": "s1", "document_id": "d1"}])
+        rows = store.add_documents(["shared chunk"], [{"session_id": "s2", "document_id": "d2"}])
+        store.append_segment(self.path)
+
+        self.assertEqual(rows, [0])
+        reopened = self.reopen()
+        self.assertEqual(len(reopened.documents), 1)
+        self.assertEqual(reopened.document_rows, {"d1": [0], "d2": [0]})
+
+    def test_torn_tail_is_truncated_before_new_segments(self):
+        store = self.new_store()
+        store.add_documents(["first"], [{}])
+        store.append_segment(self.path)
+        store.add_documents(["second"], [{}])
+        store.append_segment(self.path)
+        wal_path = f"{self.path}.wal"
+        with open(wal_path, "r+b") as f:
+            f.truncate(os.path.getsize(wal_path) - 7)
+
+        recovered = self.reopen()
+        self.assertSameContents(recovered, ["first"])
+        recovered.add_documents(["third"], [{}])
+        recovered.append_segment(self.path)
+
+        # Without the truncation replay would stop at the torn record again
+        self.assertSameContents(self.reopen(), ["first", "third"])
+
+
+class SnapshotTest(VectorStoreTestCase):
+    def test_snapshot_replaces_the_wal(self):
+        store = self.new_store()
+        store.add_documents(make_chunks(5), [{"document_id": "d1"}] * 5)
+        store.append_segment(self.path)
+        store.save_index(self.path)
+
+        self.assertFalse(os.path.exists(f"{self.path}.wal"))
+        self.assertEqual(os.listdir(f"{self.path}.snapshots"), [os.path.basename(current_snapshot(self.path))])
+        reopened = self.reopen()
+        self.assertSameContents(reopened, make_chunks(5))
+        self.assertEqual(reopened.document_rows, {"d1": [0, 1, 2, 3, 4]})
+
+    def test_unpublished_snapshot_is_ignored_and_pruned(self):
+        store = self.new_store()
+        store.add_documents(["kept"], [{}])
+        store.save_index(self.path)
+        published = current_snapshot(self.path)
+        # A crash after writing a new version but before publishing it
+        abandoned = new_snapshot(self.path)
+        with open(os.path.join(abandoned, "index.faiss"), "wb") as f:
+            f.write(b"partial")
+
+        reopened = self.reopen()
+        self.assertSameContents(reopened, ["kept"])
+        self.assertEqual(current_snapshot(self.path), published)
+        reopened.add_documents(["next"], [{}])
+        reopened.save_index(self.path)
+        self.assertEqual(os.listdir(f"{self.path}.snapshots"), [os.path.basename(current_snapshot(self.path))])
+
+    def test_rows_added_while_the_snapshot_is_written_stay_in_the_wal(self):
+        store = self.new_store()
+        store.add_documents(make_chunks(4), [{"session_id": "s1"}] * 4)
+        store.append_segment(self.path)
+        save = store.documents.save
+
+        def save_with_concurrent_upload(directory, rows=None):
+            # The store lock is free while the corpus is written
+            store.add_documents(["uploaded meanwhile"], [{"session_id": "s2"}])
+            store.append_segment(self.path)
+            save(directory, rows)
+
+        store.documents.save = save_with_concurrent_upload
+        store.save_index(self.path)
+
+        self.assertTrue(os.path.exists(f"{self.path}.wal"))
+        self.assertEqual(store.documents.find("uploaded meanwhile"), 4)
+        reopened = self.reopen()
+        self.assertSameContents(reopened, make_chunks(4) + ["uploaded meanwhile"])
+        self.assertEqual(reopened.session_rows["s2"], [4])
+
+    def test_legacy_pickle_is_migrated_and_removed(self):
+        vectors = np.array(HashEmbeddings().embed_documents(["legacy chunk"]), dtype="float32")
+        faiss.normalize_L2(vectors)
+        index = faiss.IndexFlatIP(768)
+        index.add(vectors)
+        faiss.write_index(index, f"{self.path}.faiss")
+        with open(f"{self.path}.pkl", "wb") as f:
+            pickle.dump([{"content": "legacy chunk", "metadata": {"session_id": "old"}}], f)
+
+        store = self.reopen()
+        store.save_index(self.path)
+
+        self.assertFalse(os.path.exists(f"{self.path}.faiss"))
+        self.assertFalse(os.path.exists(f"{self.path}.pkl"))
+        self.assertTrue(ChunkStore.exists(os.path.join(current_snapshot(self.path), "chunks")))
+        reopened = self.reopen()
+        self.assertSameContents(reopened, ["legacy chunk"])
+        self.assertEqual(reopened.session_rows, {"old": [0]})
+
+
+class IndexRebuildTest(VectorStoreTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(settings, "VECTORSTORE_IVF_NLIST", 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rebuild_reports_recall_and_survives_a_snapshot(self):
+        store = self.new_store()
+        store.add_documents(make_chunks(300), [{}] * 300)
+
+        report = store.rebuild_index("ivf_flat", recall_queries=50, recall_k=5)
+        self.assertTrue(report["rebuilt"])
+        self.assertGreater(report["recall"], 0.5)
+        store.save_index(self.path)
+
+        reopened = self.reopen()
+        self.assertEqual(reopened._index_kind(reopened.index), "ivf_flat")
+        self.assertEqual(reopened.similarity_search(make_chunks(300)[42], k=1)[0]["content"], make_chunks(300)[42])
+
+    def test_rows_added_during_training_are_kept(self):
+        store = self.new_store()
+        store.add_documents(make_chunks(300), [{}] * 300)
+        build = store._build_index
+
+        def build_with_concurrent_upload(index_type, vectors):
+            store.add_documents(["uploaded meanwhile"], [{}])
+            return build(index_type, vectors)
+
+        store._build_index = build_with_concurrent_upload
+        store.rebuild_index("ivf_flat", recall_queries=10, recall_k=5)
+
+        self.assertEqual(store.index.ntotal, 301)
+        self.assertEqual(store.similarity_search("uploaded meanwhile", k=1)[0]["content"], "uploaded meanwhile")
+
+    def test_too_few_rows_keeps_the_current_index(self):
+        store = self.new_store()
+        store.add_documents(make_chunks(20), [{}] * 20)
+
+        report = store.rebuild_index("ivf_flat")
+        self.assertFalse(report["rebuilt"])
+        self.assertEqual(report["index_type"], "flat")
+
+
+if __name__ == "__main__":
+    unittest.main()
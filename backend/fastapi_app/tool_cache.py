@@ -0,0 +1,259 @@
+"""
+Tool Result Cache for the agent tools
+Reuses provider responses for repeated tool calls, with request coalescing and an optional SQLite tier
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+# Seconds a tool's successful result is reused; tools that are not listed
+# (code execution, shell, automation, plotting) always run
+DEFAULT_TOOL_TTLS = {
+    "searchapi": 900,
+    "google_serper": 900,
+    "tavily_search": 900,
+    "duckduckgo": 900,
+    "brave_search": 900,
+    "wikipedia": 86400,
+    "google_scholar": 86400,
+    "arxiv": 86400,
+    "youtube": 3600,
+    "github": 3600,
+    "wikidata": 86400,
+    "playwright": 600,
+    "weather": 600,
+}
+
+
+def parse_tool_seconds(spec: Optional[str]) -> Dict[str, float]:
+    """Parse per-tool "tool=seconds,tool=seconds" overrides from a setting"""
+    ttls = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, seconds = item.split("=", 1)
+        try:
+            ttls[name.strip()] = float(seconds)
+        except ValueError:
+            print(f"⚠️ [ToolCache] Ignoring invalid per-tool override: {item.strip()}")
+    return ttls
+
+
+def normalize_argument(value: Any) -> Any:
+    """Normalize a tool argument so trivially different calls share a cache entry"""
+    if isinstance(value, str):
+        # Search providers ignore case and spacing; other text (code, SPARQL) is only trimmed
+        return unicodedata.normalize("NFKC", value).strip()
+    if isinstance(value, dict):
+        return {key: normalize_argument(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [normalize_argument(item) for item in value]
+    return value
+
+
+class ToolResultCache:
+    """
+    TTL cache of tool results keyed by tool name and normalized arguments.
+
+    Only successful results are cached. Identical calls that arrive while the
+    first is still running wait for it instead of hitting the provider again;
+    the shared call finishes and fills the cache even if every caller stops
+    waiting for it.
+    With a disk_path, results are also written to a SQLite table that is
+    consulted on a memory miss; rows with a NULL expiry never expire, so the
+    table can be pre-seeded (seed()) with fixtures for offline runs. In
+    offline mode a miss returns an error instead of calling the provider.
+    """
+
+    # Arguments compared case-insensitively, with whitespace collapsed
+    case_insensitive_args = {"query", "city"}
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        max_entries: int = 1024,
+        disk_path: Optional[str] = None,
+        offline: bool = False
+    ):
+        self.ttls = {**DEFAULT_TOOL_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.offline = offline
+        # key -> (tool name, expires_at or None, result)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.stores = 0
+        self._db = None
+        if disk_path:
+            self._open_disk_tier(disk_path)
+
+    def _open_disk_tier(self, disk_path: str):
+        try:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tool_results "
+                "(key TEXT PRIMARY KEY, tool TEXT NOT NULL, arguments TEXT NOT NULL, result TEXT NOT NULL, expires_at REAL)"
+            )
+            self._db.commit()
+            print(f"✅ [ToolCache] Disk tier enabled at {disk_path}")
+        except Exception as e:
+            print(f"⚠️ [ToolCache] Could not open disk tier, using memory only: {e}")
+            self._db = None
+
+    def ttl_for(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, 0)
+
+    def _arguments(self, arguments: List) -> str:
+        normalized = []
+        for name, value in arguments:
+            value = normalize_argument(value)
+            if name in self.case_insensitive_args and isinstance(value, str):
+                value = " ".join(value.lower().split())
+            normalized.append([name, value])
+        return json.dumps(normalized, sort_keys=True, default=str)
+
+    def key(self, tool_name: str, arguments: List) -> str:
+        """Cache key for a call; arguments is a list of (name, value) as passed to the tool"""
+        digest = hashlib.sha1(f"{tool_name}\0{self._arguments(arguments)}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT tool, expires_at, result FROM tool_results WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def _disk_put(self, key: str, tool_name: str, arguments: List, result: Dict, expires_at: Optional[float]):
+        if self._db is None:
+            return
+        try:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tool_results (key, tool, arguments, result, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, tool_name, self._arguments(arguments), json.dumps(result, default=str), expires_at)
+                )
+        except Exception as e:
+            print(f"⚠️ [ToolCache] Disk write failed: {e}")
+
+    def _remember(self, key: str, tool_name: str, expires_at: Optional[float], result: Dict):
+        self._entries[key] = (tool_name, expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] is None or entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                del self._entries[key]
+            entry = self._disk_get(key, now)
+            if entry is not None:
+                self._remember(key, *entry)
+                self.disk_hits += 1
+                return entry[2]
+        return None
+
+    def seed(self, tool_name: str, arguments: List, result: Dict, ttl: Optional[float] = None):
+        """Store a result directly, e.g. a fixture for offline tests; no ttl means it never expires"""
+        key = self.key(tool_name, arguments)
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._remember(key, tool_name, expires_at, copy.deepcopy(result))
+            self._disk_put(key, tool_name, arguments, result, expires_at)
+
+    async def get_or_call(self, tool_name: str, arguments: List, call: Callable[[], Awaitable[Dict]]) -> Dict:
+        """Cached result for the call, or run it (once, however many callers are waiting)"""
+        ttl = self.ttl_for(tool_name)
+        key = self.key(tool_name, arguments)
+        cached = self._lookup(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        if ttl <= 0 and not self.offline:
+            return await call()
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return copy.deepcopy(await asyncio.shield(inflight))
+
+        self.misses += 1
+        if self.offline:
+            return {"error": f"Tool '{tool_name}' has no cached result for these arguments (offline mode)", "tool": tool_name}
+
+        # The call runs in a task of its own, so a caller that is cancelled (e.g. its
+        # deadline passed) stops waiting without cancelling the call for the others
+        task = asyncio.ensure_future(self._call_and_store(key, tool_name, arguments, ttl, call))
+        self._inflight[key] = task
+        # Mark an error retrieved in case every caller has stopped waiting
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _call_and_store(self, key: str, tool_name: str, arguments: List, ttl: float, call) -> Dict:
+        try:
+            result = await call()
+        finally:
+            self._inflight.pop(key, None)
+
+        if isinstance(result, dict) and "error" not in result:
+            expires_at = time.time() + ttl
+            with self._lock:
+                self._remember(key, tool_name, expires_at, copy.deepcopy(result))
+                self._disk_put(key, tool_name, arguments, result, expires_at)
+                self.stores += 1
+        return result
+
+    def clear(self, tool_name: Optional[str] = None):
+        """Drop cached results, for one tool or all; seeded disk rows are kept"""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if tool_name in (None, entry[0])]:
+                del self._entries[key]
+            if self._db is not None:
+                with self._db:
+                    if tool_name is None:
+                        self._db.execute("DELETE FROM tool_results WHERE expires_at IS NOT NULL")
+                    else:
+                        self._db.execute(
+                            "DELETE FROM tool_results WHERE tool = ? AND expires_at IS NOT NULL", (tool_name,)
+                        )
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.coalesced + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": (self.hits + self.disk_hits + self.coalesced) / lookups if lookups else 0.0,
+            "disk_tier": self._db is not None,
+            "offline": self.offline,
+        }
@@ -0,0 +1,197 @@
+"""
+Tool Guard for the agent tools
+Per-tool deadlines, concurrency limits and failure-rate circuit breakers
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+
+# Seconds a tool call may take, including time spent waiting for a slot
+DEFAULT_TOOL_TIMEOUTS = {
+    "playwright": 15,
+    "google_scholar": 15,
+    "wikipedia": 10,
+    "arxiv": 10,
+    "code_interpreter": 30,
+    "matplotlib": 30,
+    "shell": 12,
+}
+
+# Calls a tool may have running at once; the rest wait their turn
+DEFAULT_TOOL_CONCURRENCY = {
+    # Composite tool; the providers it calls have their own limits
+    "web_search": 32,
+    "google_scholar": 2,
+    "matplotlib": 2,
+    "shell": 2,
+}
+
+
+def provider_error(message: str, **fields) -> Dict:
+    """
+    Error result for a failure on the provider's side or in transport (outage,
+    5xx, rate limit, rejected key, network error). Only these, exceptions and
+    timeouts count against a tool's circuit breaker; an error caused by the
+    request itself (bad code, unknown page, nothing found) does not.
+    """
+    return {"error": message, "provider_failure": True, **fields}
+
+
+def http_error(provider: str, status: int) -> Dict:
+    """Error result for a non-200 provider response; 5xx, 429 and auth failures are the provider's"""
+    message = f"{provider} error: {status}"
+    if status >= 500 or status in (401, 403, 429):
+        return provider_error(message)
+    return {"error": message}
+
+
+def is_provider_failure(result) -> bool:
+    return isinstance(result, dict) and bool(result.get("provider_failure"))
+
+
+class CircuitBreaker:
+    """
+    Failure-rate breaker over a tool's most recent calls.
+
+    Closed: calls run and outcomes are recorded. Once at least min_calls of
+    the last window calls are recorded and the failure rate reaches
+    failure_rate, the breaker opens and calls are refused for cooldown
+    seconds. After that one trial call is let through (half-open); success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, window: int = 10, min_calls: int = 5, failure_rate: float = 0.5, cooldown: float = 60):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            return True
+        return self.state == "closed"
+
+    def is_open(self) -> bool:
+        """Open and still cooling down"""
+        return self.state == "open" and time.monotonic() - self.opened_at < self.cooldown
+
+    def record(self, success: bool):
+        if self.state == "half_open":
+            if success:
+                self.state = "closed"
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def cancel_trial(self):
+        """A half-open trial call was cancelled; let the next call be the trial instead"""
+        if self.state == "half_open":
+            self.state = "open"
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self._outcomes.clear()
+
+    def stats(self) -> Dict:
+        retry_in = self.cooldown - (time.monotonic() - self.opened_at) if self.is_open() else 0.0
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "trips": self.trips,
+            "retry_in": round(retry_in, 1),
+        }
+
+
+class ToolGuard:
+    """
+    Deadline, bulkhead semaphore and circuit breaker around one tool's calls.
+    The breaker records exceptions, timeouts and provider_error() results as
+    failures; any other result, including an ordinary {"error"}, as a success.
+    """
+
+    def __init__(self, name: str, timeout: float, max_concurrency: int, breaker: CircuitBreaker):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    async def run(self, call: Callable[[], Awaitable[Dict]]) -> Dict:
+        if not self.breaker.allow():
+            self.rejected += 1
+            return {
+                "error": f"Tool '{self.name}' is temporarily disabled after repeated failures. Try another tool.",
+                "tool": self.name
+            }
+
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self._run_limited(call), timeout=self.timeout)
+        except asyncio.CancelledError:
+            # Cancelled by the caller (e.g. a hedged search that already has an answer): not a tool failure
+            self.breaker.cancel_trial()
+            raise
+        except asyncio.TimeoutError:
+            # Tools that run in an executor keep their thread until they finish; only the wait ends here
+            self.timeouts += 1
+            result = provider_error(f"Tool '{self.name}' timed out after {self.timeout} seconds", tool=self.name)
+        except Exception as e:
+            result = provider_error(str(e), tool=self.name)
+
+        success = not is_provider_failure(result)
+        if not success:
+            self.failures += 1
+        self.breaker.record(success)
+        if self.breaker.state == "open":
+            print(f"🚫 [ToolGuard] Circuit opened for {self.name} ({self.breaker.cooldown}s cooldown)")
+        elif not success:
+            print(f"⚠️ [ToolGuard] {self.name} failed after {time.monotonic() - started:.1f}s")
+        return result
+
+    async def _run_limited(self, call: Callable[[], Awaitable[Dict]]) -> Dict:
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await call()
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            "timeout": self.timeout,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "circuit": self.breaker.stats(),
+        }
@@ -6,6 +6,7 @@ const chatEndpoints = {
   messages: (sessionId) => `chat/sessions/${sessionId}/messages/`,
   continue: (sessionId) => `chat/sessions/${sessionId}/continue/`,
   documents: (sessionId) => `chat/sessions/${sessionId}/documents/`,
+  documentStatus: (sessionId, documentId) => `chat/sessions/${sessionId}/documents/${documentId}/status/`,
   documentsByMessage: (messageId) => `chat/documents/${messageId}/`,
   documentsList: (params = {}) => {
     const query = new URLSearchParams(params).toString();
@@ -89,12 +90,42 @@ const chatApi = {
         chatEndpoints.documents(sessionId),
         formData
       );
+      // The upload returns as soon as the file is queued; wait for embedding
+      // so the document is searchable when the first message is sent
+      if (response?.job_id && !response.processed) {
+        const { response: status, err } = await chatApi.waitForDocument(sessionId, response.id);
+        if (err) return { err };
+        return { response: { ...response, processed: status.processed, status: status.status } };
+      }
       return { response };
     } catch (err) {
       return { err };
     }
   },
 
+  getDocumentStatus: async (sessionId, documentId) => {
+    try {
+      const response = await privateClient.get(chatEndpoints.documentStatus(sessionId, documentId));
+      return { response };
+    } catch (err) {
+      return { err };
+    }
+  },
+
+  waitForDocument: async (sessionId, documentId, { intervalMs = 1500, timeoutMs = 600000 } = {}) => {
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+      const { response, err } = await chatApi.getDocumentStatus(sessionId, documentId);
+      if (err) return { err };
+      if (response.status === "completed") return { response };
+      if (response.status === "failed") {
+        return { err: new Error(response.error || "Document processing failed") };
+      }
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+    return { err: new Error("Timed out waiting for document processing") };
+  },
+
   listDocuments: async (sessionId) => {
     try {
       const response = await privateClient.get(chatEndpoints.documents(sessionId));